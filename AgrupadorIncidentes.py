@@ -0,0 +1,81 @@
+import queue
+
+"""
+Agrupación de los frames con infracción en incidentes, en el lado del detector.
+Recibe TODOS los frames analizados (no solo los que llega a pintar la GUI) y agrupa
+por índice de frame y tiempo de vídeo, así el resultado no depende de la carga de la GUI.
+Los incidentes cerrados se entregan en una cola thread-safe.
+"""
+
+
+class AgrupadorIncidentes:
+
+    def __init__(self, ventana_s=1.0, frames_previos=None):
+        """
+        ventana_s: duración máxima (en tiempo de vídeo) de un incidente; una infracción más
+                   larga se parte en varios incidentes consecutivos.
+        frames_previos: función frame_idx -> lista de frames anteriores (buffer previo) que se
+                        añaden al principio de cada incidente nuevo.
+        """
+        self.ventana_s = ventana_s
+        self.frames_previos = frames_previos
+        self.cola = queue.Queue()
+
+        self._actual = None
+        self._ultimo_frame_idx = None
+        self._continuacion = False # El incidente anterior se cortó por la ventana
+
+    def procesar(self, results):
+        """Procesa el resultado de un frame (con 'frame_idx', 'tiempo_s' y 'video_time')."""
+        frame_idx = results['frame_idx']
+
+        # Un salto en la numeración (p.ej. el vídeo vuelve al principio) cierra el incidente abierto
+        if self._actual is not None and frame_idx != self._ultimo_frame_idx + 1:
+            self._cerrar()
+            self._continuacion = False
+        self._ultimo_frame_idx = frame_idx
+
+        if not results['infraccion_detectada']:
+            if self._actual is not None:
+                self._cerrar()
+            self._continuacion = False
+            return
+
+        if self._actual is None:
+            self._abrir(results)
+
+        inc = self._actual
+        # El analizador no copia el frame (puede ser un hueco del buffer circular): el incidente se queda su copia
+        inc['frames'].append(results['frame_real'].copy())
+        inc['fin_frame'] = frame_idx
+        inc['fin_video_time'] = results['video_time']
+        inc['porcentaje_min'] = min(inc['porcentaje_min'], results['porcentaje_en_pista'])
+
+        if results['tiempo_s'] - inc['inicio_tiempo_s'] >= self.ventana_s:
+            self._cerrar()
+            self._continuacion = True
+
+    def cerrar(self):
+        """Entrega el incidente abierto, si lo hay (fin del vídeo o parada del detector)."""
+        if self._actual is not None:
+            self._cerrar()
+        self._continuacion = False
+
+    def _abrir(self, results):
+        # Un incidente nuevo empieza con los frames de aproximación; la continuación de uno cortado, no
+        previos = []
+        if self.frames_previos is not None and not self._continuacion:
+            previos = self.frames_previos(results['frame_idx'])
+
+        self._actual = {
+            'inicio_frame': results['frame_idx'],
+            'inicio_tiempo_s': results['tiempo_s'],
+            'video_time': results['video_time'],
+            'frames': list(previos),
+            'n_previos': len(previos),
+            'porcentaje_min': results['porcentaje_en_pista']
+        }
+
+    def _cerrar(self):
+        self.cola.put(self._actual)
+        self._actual = None
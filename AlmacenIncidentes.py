@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+"""
+Almacén de los frames de cada incidente con un presupuesto de memoria fijo.
+Los incidentes recientes se guardan tal cual en RAM. Cuando se supera el presupuesto,
+los más antiguos se comprimen (JPEG/PNG) y se vuelcan a un fichero en disco; solo se
+vuelven a leer (mapeando el fichero en memoria) cuando se abre su ventana de revisión.
+La compresión y la escritura se hacen en un hilo aparte: agregar() se llama desde el hilo de
+la GUI y no puede esperar a codificar decenas de frames. Mientras el hilo trabaja, el
+presupuesto se puede superar durante un momento.
+"""
+
+
+def _bytes_residentes(frames):
+    """
+    Memoria que mantienen viva los frames. Los frames previos son vistas del bloque entero del
+    buffer previo (BufferCircular.desacoplar): cada bloque se cuenta completo y una sola vez.
+    """
+    bloques = {}
+    for frame in frames:
+        base = frame.base if isinstance(frame.base, np.ndarray) else frame
+        bloques[id(base)] = base.nbytes
+    return sum(bloques.values())
+
+
+class _Incidente:
+    __slots__ = ('frames', 'ruta', 'offsets', 'n_frames', 'nbytes', 'volcable')
+
+    def __init__(self, frames):
+        self.frames = frames          # Lista de frames BGR (None si está volcado a disco)
+        self.ruta = None              # Fichero con los frames comprimidos concatenados
+        self.offsets = None           # Posición de cada frame dentro del fichero
+        self.n_frames = len(frames)
+        self.nbytes = _bytes_residentes(frames)
+        self.volcable = True          # False si falló el volcado: se queda en RAM
+
+
+class AlmacenIncidentes:
+
+    def __init__(self, presupuesto_mb=256, directorio=None, formato='.jpg', calidad_jpeg=90):
+        """
+        presupuesto_mb: memoria máxima para frames sin comprimir.
+        directorio: dónde volcar los incidentes antiguos (por defecto, un directorio temporal).
+        formato: '.jpg' (con pérdida, mucho más pequeño) o '.png' (sin pérdida).
+        """
+        self.presupuesto_bytes = int(presupuesto_mb * 1024 * 1024)
+        self.formato = formato
+        self.params_codificacion = [cv2.IMWRITE_JPEG_QUALITY, calidad_jpeg] if formato == '.jpg' else []
+
+        self._directorio_propio = directorio is None
+        self.directorio = directorio or tempfile.mkdtemp(prefix='f1_incidentes_')
+        os.makedirs(self.directorio, exist_ok=True)
+
+        self._incidentes = OrderedDict() # id -> _Incidente, en orden de llegada
+        self._bytes_en_ram = 0
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+
+        # Hilo de volcado: se despierta cada vez que se añade un incidente
+        self._cond = threading.Condition(self._lock)
+        self._activo = True
+        self._hilo = threading.Thread(target=self._hilo_volcado, daemon=True)
+        self._hilo.start()
+
+    def __len__(self):
+        return len(self._incidentes)
+
+    @property
+    def bytes_en_ram(self):
+        return self._bytes_en_ram
+
+    def agregar(self, frames):
+        """Guarda los frames de un incidente y devuelve su identificador."""
+        with self._lock:
+            id_incidente = self._siguiente_id
+            self._siguiente_id += 1
+
+            incidente = _Incidente(list(frames))
+            self._incidentes[id_incidente] = incidente
+            self._bytes_en_ram += incidente.nbytes
+
+            # El volcado de los antiguos (si hace falta) lo hace el hilo de volcado
+            self._cond.notify()
+            return id_incidente
+
+    def n_frames(self, id_incidente):
+        return self._incidentes[id_incidente].n_frames
+
+    def frames(self, id_incidente):
+        """Devuelve los frames BGR de un incidente (descomprimiéndolos desde disco si hace falta)."""
+        with self._lock:
+            incidente = self._incidentes[id_incidente]
+            if incidente.frames is not None:
+                return list(incidente.frames)
+            ruta, offsets = incidente.ruta, incidente.offsets
+
+        datos = np.memmap(ruta, dtype=np.uint8, mode='r')
+        return [cv2.imdecode(datos[ini:fin], cv2.IMREAD_COLOR) for ini, fin in zip(offsets[:-1], offsets[1:])]
+
+    def cerrar(self):
+        """Libera la memoria y borra los ficheros volcados (si el directorio es temporal)."""
+        with self._cond:
+            self._activo = False
+            self._cond.notify()
+        self._hilo.join()
+
+        with self._lock:
+            self._incidentes.clear()
+            self._bytes_en_ram = 0
+        if self._directorio_propio:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+
+    # ------------------------------------------------------------
+    # Volcado a disco
+    # ------------------------------------------------------------
+
+    def _siguiente_a_volcar(self):
+        """Incidente más antiguo que aún está en RAM, si se supera el presupuesto (con el lock adquirido)."""
+        if self._bytes_en_ram <= self.presupuesto_bytes:
+            return None
+        ultimo = self._siguiente_id - 1
+        for id_incidente, incidente in self._incidentes.items():
+            # El incidente recién añadido siempre se queda en RAM (es el que se va a revisar antes)
+            if incidente.frames is not None and incidente.volcable and id_incidente != ultimo:
+                return id_incidente, incidente
+        return None
+
+    def _hilo_volcado(self):
+        """Vuelca a disco los incidentes más antiguos hasta volver a entrar en el presupuesto."""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._activo or self._siguiente_a_volcar() is not None)
+                if not self._activo:
+                    return
+                id_incidente, incidente = self._siguiente_a_volcar()
+                frames = incidente.frames
+
+            # Sin el lock: la GUI puede seguir añadiendo incidentes y abriendo este (sigue en RAM)
+            try:
+                ruta, offsets = self._volcar(id_incidente, frames)
+            except (OSError, IOError) as e:
+                print(f"No se pudo volcar el incidente {id_incidente} a disco: {e}")
+                with self._lock:
+                    incidente.volcable = False
+                continue
+
+            with self._lock:
+                if self._incidentes.get(id_incidente) is not incidente:
+                    continue # Se cerró el almacén mientras tanto
+                incidente.ruta = ruta
+                incidente.offsets = offsets
+                incidente.frames = None
+                self._bytes_en_ram -= incidente.nbytes
+
+    def _volcar(self, id_incidente, frames):
+        """Comprime los frames en un fichero. Devuelve (ruta, offsets)."""
+        ruta = os.path.join(self.directorio, f"incidente_{id_incidente:06d}.bin")
+        offsets = [0]
+        with open(ruta, 'wb') as f:
+            for frame in frames:
+                ok, buf = cv2.imencode(self.formato, frame, self.params_codificacion)
+                if not ok:
+                    raise IOError(f"No se pudo comprimir un frame del incidente {id_incidente}")
+                f.write(buf.tobytes())
+                offsets.append(offsets[-1] + len(buf))
+        return ruta, offsets
@@ -0,0 +1,174 @@
+import argparse
+import json
+import time
+
+from Detector import DetectorDeVideo
+
+"""
+Análisis headless (sin GUI) de un vídeo completo.
+Recorre el vídeo una sola vez, a máxima velocidad, y guarda cada frame con infracción
+como un registro JSONL. No importa customtkinter ni PIL.
+
+Uso:
+    python AnalisisHeadless.py Imagenes/RbRingT10.mp4 --salida eventos.jsonl
+    python AnalisisHeadless.py rtsp://10.0.0.13/stream1 --duracion 600
+
+Con una cámara o un stream (o --en-directo con un fichero) se analiza siempre el último frame
+capturado hasta --duracion segundos o Ctrl+C, y cada infracción lleva su latencia desde la captura.
+"""
+
+
+# --- REGISTRO DE UNA INFRACCIÓN ---
+def registro_infraccion(results):
+    """Convierte el resultado de un frame con infracción en un diccionario serializable."""
+    registro = {
+        'tipo': 'infraccion',
+        'frame_idx': results['frame_idx'],
+        'video_time': results['video_time'],
+        'tiempo_s': round(results['tiempo_s'], 3),
+        'porcentaje_en_pista': round(results['porcentaje_en_pista'], 2),
+        'area_coche': int(results['area_coche']),
+        'coches_fuera': [
+            {'bbox': list(c['bbox']), 'area': c['area'], 'porcentaje_en_pista': round(c['porcentaje_en_pista'], 2)}
+            for c in results['coches'] if c['infraccion']
+        ]
+    }
+    if 'latencia_s' in results:
+        registro['t_captura'] = round(results['t_captura'], 3)
+        registro['latencia_s'] = round(results['latencia_s'], 4)
+    return registro
+
+
+# --- AGRUPACIÓN EN INCIDENTES ---
+def agrupar_infracciones(registros):
+    """
+    Agrupa registros de infracción (ordenados por frame_idx) en incidentes:
+    cada incidente es una racha de frames consecutivos con infracción.
+    Al depender solo del índice de frame, el resultado es el mismo tanto si los registros
+    vienen de un recorrido secuencial como de varios tramos analizados por separado.
+    """
+    incidentes = []
+    actual = None
+
+    for r in registros:
+        if actual is not None and r['frame_idx'] == actual['fin_frame'] + 1:
+            actual['fin_frame'] = r['frame_idx']
+            actual['fin_video_time'] = r['video_time']
+            actual['n_frames'] += 1
+            actual['porcentaje_min'] = min(actual['porcentaje_min'], r['porcentaje_en_pista'])
+            actual['area_max'] = max(actual['area_max'], r['area_coche'])
+        else:
+            actual = {
+                'tipo': 'incidente',
+                'inicio_frame': r['frame_idx'],
+                'fin_frame': r['frame_idx'],
+                'video_time': r['video_time'],
+                'fin_video_time': r['video_time'],
+                'n_frames': 1,
+                'porcentaje_min': r['porcentaje_en_pista'],
+                'area_max': r['area_coche']
+            }
+            incidentes.append(actual)
+
+    return incidentes
+
+
+def escribir_eventos(f, registros, resumen):
+    """Escribe en f (JSONL) los frames con infracción, los incidentes agrupados y el resumen."""
+    for r in registros:
+        f.write(json.dumps(r, ensure_ascii=False) + '\n')
+    for inc in agrupar_infracciones(registros):
+        f.write(json.dumps(inc, ensure_ascii=False) + '\n')
+    f.write(json.dumps(resumen, ensure_ascii=False) + '\n')
+
+
+# --- BUCLE PRINCIPAL ---
+def analizar_video(video_path, ruta_salida, ancho_ventana=600, ruta_config='config.json', prefetch=False,
+                   en_directo=None, duracion_s=None):
+    """
+    Analiza el vídeo de principio a fin y escribe las infracciones en ruta_salida (JSONL).
+    Una fuente en directo se analiza durante duracion_s segundos (None = hasta Ctrl+C).
+    Devuelve el resumen de rendimiento, que también se escribe como último registro.
+    """
+    detector = DetectorDeVideo(video_path, ancho_ventana=ancho_ventana, ruta_config=ruta_config, bucle=False,
+                               incidentes=False, prefetch=prefetch, en_directo=en_directo)
+
+    frames = 0
+    registros = []
+    latencias = []
+    inicio = time.perf_counter()
+
+    try:
+        while duracion_s is None or time.perf_counter() - inicio < duracion_s:
+            results = detector.get_next_frame_data()
+            if results is None:
+                break
+
+            frames += 1
+            if detector.en_directo:
+                latencias.append(results['latencia_s'])
+            if results['infraccion_detectada']:
+                registros.append(registro_infraccion(results))
+    except KeyboardInterrupt:
+        pass # En directo no hay final de vídeo: Ctrl+C termina y se escribe lo analizado
+
+    detector.liberar()
+    tiempo_total = time.perf_counter() - inicio
+    resumen = resumen_rendimiento(video_path, frames, registros, tiempo_total)
+    if detector.captura is not None:
+        resumen['captura'] = detector.captura.estadisticas()
+    if detector.fuente is not None:
+        resumen['fuente'] = detector.fuente.estadisticas()
+        if latencias:
+            latencias.sort()
+            resumen['latencia_s'] = {'media': round(sum(latencias) / len(latencias), 4),
+                                     'p95': round(latencias[int(0.95 * (len(latencias) - 1))], 4),
+                                     'max': round(latencias[-1], 4)}
+    if detector.perfilador is not None:
+        resumen['perfil'] = detector.perfilador.estadisticas()
+
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        escribir_eventos(f, registros, resumen)
+
+    return resumen
+
+
+def resumen_rendimiento(video_path, frames, registros, tiempo_total):
+    """Registro final con el rendimiento del análisis."""
+    return {
+        'tipo': 'resumen',
+        'video': video_path,
+        'frames': frames,
+        'infracciones': len(registros),
+        'incidentes': len(agrupar_infracciones(registros)),
+        'tiempo_s': round(tiempo_total, 3),
+        'fps': round(frames / tiempo_total, 1) if tiempo_total > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis headless de salidas de pista.")
+    parser.add_argument('video', help="Ruta al vídeo a analizar")
+    parser.add_argument('--salida', default='eventos.jsonl', help="Fichero JSONL de eventos")
+    parser.add_argument('--ancho', type=int, default=600, help="Ancho de análisis (px)")
+    parser.add_argument('--config', default='config.json', help="Ruta a config.json")
+    parser.add_argument('--prefetch', action='store_true', help="Decodificar en un hilo aparte")
+    parser.add_argument('--en-directo', action='store_true', default=None,
+                        help="Leer el fichero como una cámara (las cámaras y URLs se detectan solas)")
+    parser.add_argument('--duracion', type=float, default=None, help="Segundos de análisis (fuentes en directo)")
+    args = parser.parse_args()
+
+    resumen = analizar_video(args.video, args.salida, args.ancho, args.config, args.prefetch,
+                             args.en_directo, args.duracion)
+
+    print(f"Frames analizados: {resumen['frames']}")
+    print(f"Frames con infracción: {resumen['infracciones']} ({resumen['incidentes']} incidentes)")
+    print(f"Tiempo total: {resumen['tiempo_s']:.2f}s ({resumen['fps']:.1f} frames/s)")
+    if 'fuente' in resumen:
+        print(f"Fuente: {resumen['fuente']}")
+    if 'latencia_s' in resumen:
+        print(f"Latencia captura -> resultado: {resumen['latencia_s']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import os
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+
+from Detector import DetectorDeVideo, AnalizadorFrames, reescalar_frame, formatear_tiempo, imagen_deteccion, zona_roi
+from AnalisisHeadless import registro_infraccion, escribir_eventos, resumen_rendimiento
+from FuenteEnDirecto import es_fuente_en_directo
+
+"""
+Análisis headless de un vídeo largo repartido en tramos entre varios procesos.
+El frame de referencia y la máscara de pista se calculan una sola vez en el proceso padre
+y se envían a cada worker al arrancar. Cada worker se posiciona en su tramo con
+CAP_PROP_POS_FRAMES (comprobando que el backend llegó al frame exacto; si no, avanza con grab()
+desde el principio) y analiza solo ese rango de frames.
+Cada tramo compara contra el frame de referencia, así que solo admite MODELO_FONDO "estatico":
+un modelo adaptativo depende de todos los frames anteriores y cada tramo empezaría de cero.
+
+Uso:
+    python AnalisisParalelo.py Imagenes/RbRingT10.mp4 --salida eventos.jsonl --workers 16
+"""
+
+# Datos de referencia de cada worker (se rellenan en _init_worker, una vez por proceso)
+_REFERENCIA = {}
+
+
+def _init_worker(video_path, ancho_ventana, fps, fondo_vacio, mascara_pista, mascara_pista_bgr, roi, umbrales, canal='bgr', piramide=None):
+    _REFERENCIA.update({
+        'video_path': video_path,
+        'ancho_ventana': ancho_ventana,
+        'fps': fps,
+        'roi': roi,
+        'canal': canal,
+        # Un analizador por proceso: sus buffers se reutilizan en todos los frames del worker
+        'analizador': AnalizadorFrames(fondo_vacio, mascara_pista, mascara_pista_bgr, *umbrales, roi, piramide)
+    })
+
+
+def _analizar_tramo(inicio, fin):
+    """
+    Analiza los frames [inicio, fin) (índices desde 0) y devuelve (frames leídos, registros de infracción).
+    Si fin es None se lee hasta el final del vídeo. Los frame_idx siguen la misma numeración
+    que DetectorDeVideo (el primer frame del vídeo es el 1).
+    """
+    ref = _REFERENCIA
+
+    cap = cv2.VideoCapture(ref['video_path'])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, inicio)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != inicio:
+        # Algunos backends/códecs no se posicionan en el frame exacto: el tramo se solaparía con el
+        # anterior o dejaría un hueco. Se vuelve a abrir y se avanza con grab() desde el principio
+        cap.release()
+        cap = cv2.VideoCapture(ref['video_path'])
+        for _ in range(inicio):
+            if not cap.grab():
+                break
+
+    zona = zona_roi(ref['roi'])
+    imagen_canal = None
+
+    registros = []
+    pos = inicio
+    while fin is None or pos < fin:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        pos += 1
+
+        frame_actual = reescalar_frame(frame, ref['ancho_ventana'])
+        imagen_canal = imagen_deteccion(frame_actual, ref['canal'], zona, dst=imagen_canal)
+        results = ref['analizador'].analizar(frame_actual, frame_deteccion=imagen_canal)
+
+        if results and results['infraccion_detectada']:
+            tiempo_s = pos / ref['fps']
+            results['frame_idx'] = pos
+            results['tiempo_s'] = tiempo_s
+            results['video_time'] = formatear_tiempo(tiempo_s)
+            registros.append(registro_infraccion(results))
+
+    cap.release()
+    return pos - inicio, registros
+
+
+# --- REPARTO EN TRAMOS ---
+def dividir_en_tramos(total_frames, n_tramos):
+    """
+    Divide [0, total_frames) en n_tramos rangos contiguos.
+    El último tramo queda abierto (fin=None) porque CAP_PROP_FRAME_COUNT es solo una estimación
+    en algunos contenedores y así nunca se pierden los frames finales.
+    """
+    n_tramos = max(1, min(n_tramos, total_frames))
+    tamano = total_frames // n_tramos
+    tramos = [(i * tamano, (i + 1) * tamano) for i in range(n_tramos)]
+    tramos[-1] = (tramos[-1][0], None)
+    return tramos
+
+
+def analizar_video_paralelo(video_path, ruta_salida, ancho_ventana=600, ruta_config='config.json', workers=None):
+    """
+    Analiza el vídeo completo repartiéndolo entre `workers` procesos.
+    Los registros de todos los tramos se concatenan en orden y se agrupan en incidentes
+    sobre la secuencia completa, de modo que una infracción que cruza el límite entre dos tramos
+    queda fusionada en un único incidente. Con el fondo estático (el único admitido) el JSONL
+    resultante es idéntico al de AnalisisHeadless.
+    """
+    if es_fuente_en_directo(video_path):
+        raise ValueError(f"AnalisisParalelo necesita un fichero de vídeo (se reparte en tramos): '{video_path}' "
+                         "es una cámara o un stream")
+    workers = workers or os.cpu_count() or 1
+    inicio_t = time.perf_counter()
+
+    # Referencia y máscara se calculan una sola vez, en el proceso padre
+    detector = DetectorDeVideo(video_path, ancho_ventana=ancho_ventana, ruta_config=ruta_config, bucle=False,
+                               incidentes=False)
+    total_frames = int(detector.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    detector.liberar()
+    if detector.MODELO_FONDO != 'estatico':
+        raise ValueError(f"AnalisisParalelo solo admite MODELO_FONDO 'estatico' (config: '{detector.MODELO_FONDO}'): "
+                         "un modelo adaptativo necesita todos los frames anteriores. Usa AnalisisHeadless.py")
+
+    umbrales = (detector.UMBRAL_BG_SUB, detector.UMBRAL_RUIDO_COCHE, detector.UMBRAL_SALIDA)
+    tramos = dividir_en_tramos(max(total_frames, 1), workers)
+
+    initargs = (video_path, ancho_ventana, detector.fps, detector.fondo_deteccion,
+                detector.mascara_pista, detector.mascara_pista_bgr, detector.roi, umbrales, detector.CANAL_DETECCION,
+                detector.piramide)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        resultados = list(pool.map(_analizar_tramo, *zip(*tramos)))
+
+    frames = sum(n for n, _ in resultados)
+    registros = [r for _, regs in resultados for r in regs]
+
+    tiempo_total = time.perf_counter() - inicio_t
+    resumen = resumen_rendimiento(video_path, frames, registros, tiempo_total)
+    resumen['workers'] = workers
+
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        escribir_eventos(f, registros, resumen)
+
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis de salidas de pista repartido en varios procesos.")
+    parser.add_argument('video', help="Ruta al vídeo a analizar")
+    parser.add_argument('--salida', default='eventos.jsonl', help="Fichero JSONL de eventos")
+    parser.add_argument('--ancho', type=int, default=600, help="Ancho de análisis (px)")
+    parser.add_argument('--config', default='config.json', help="Ruta a config.json")
+    parser.add_argument('--workers', type=int, default=None, help="Número de procesos (por defecto, uno por núcleo)")
+    args = parser.parse_args()
+
+    try:
+        resumen = analizar_video_paralelo(args.video, args.salida, args.ancho, args.config, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Frames analizados: {resumen['frames']} con {resumen['workers']} procesos")
+    print(f"Frames con infracción: {resumen['infracciones']} ({resumen['incidentes']} incidentes)")
+    print(f"Tiempo total: {resumen['tiempo_s']:.2f}s ({resumen['fps']:.1f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import argparse
+import json
+
+import cv2
+import numpy as np
+
+from MotorCalibracion import MotorCalibracion, cargar_imagen, guardar_en_config, tamano_kernel
+
+"""
+Calibración automática de la máscara de pista a partir del frame de referencia.
+    1. Semilla de asfalto: los píxeles dentro de un polígono aproximado que marca el usuario o,
+       sin polígono, la mayor región poco saturada y no demasiado clara (el asfalto es gris; las
+       líneas blancas son claras y la hierba, los pianos y las escapatorias, saturados).
+    2. Límites HSV: percentiles de los histogramas de la semilla, con un margen. Si el asfalto es
+       casi gris el tono no dice nada y H se deja completo.
+    3. Kernels: se prueban todas las combinaciones de erosión y cierre y se puntúa cada máscara por
+       componentes sueltos y agujeros. Entre las mejores se queda la que menos deforma la
+       máscara inicial. Por cada erosión (calculada una vez) se sacan todos los cierres de golpe
+       (ver barrer_kernels).
+
+Uso:
+    python AutoCalibracion.py Imagenes/rb_ring16.jpg
+    python AutoCalibracion.py Imagenes/RbRingT10.mp4 --poligono "120,300 400,120 560,200 300,330" --guardar
+
+Las coordenadas del polígono son píxeles de la imagen al ancho de análisis (--ancho).
+Con --guardar los valores se escriben en config.json; CalibradorHSV.py --auto parte de ellos.
+"""
+
+PERCENTILES_HSV = (0.5, 99.5)
+MARGEN_HSV = 0.1 # Fracción del rango de la semilla que se añade a cada lado
+SATURACION_GRIS = 40 # Con la mediana de S de la semilla por debajo, H se deja completo
+MAXIMOS_KERNEL = (15, 25) # Mismos rangos que los deslizadores de erosión y cierre
+COBERTURA_MINIMA = 0.9 # Fracción de la semilla que la máscara final debe conservar
+
+
+# --- 1. SEMILLA Y LÍMITES HSV ---
+
+def mascara_poligono(forma, poligono):
+    mascara = np.zeros(forma[:2], np.uint8)
+    cv2.fillPoly(mascara, [np.asarray(poligono, np.int32)], 255)
+    return mascara > 0
+
+
+def semilla_asfalto(imagen_bgr, poligono=None):
+    """Píxeles que con seguridad son asfalto (máscara booleana)."""
+    if poligono is not None:
+        return mascara_poligono(imagen_bgr.shape, poligono)
+
+    _, s, v = cv2.split(cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2HSV))
+
+    # Otsu separa lo gris de lo saturado y, dentro de lo gris, lo oscuro de lo claro
+    umbral_s, _ = cv2.threshold(s, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    gris = s <= umbral_s
+    umbral_v, _ = cv2.threshold(v[gris].reshape(-1, 1), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    candidatos = np.where(gris & (v <= umbral_v), np.uint8(255), np.uint8(0))
+    candidatos = cv2.morphologyEx(candidatos, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+
+    # La pista es la mayor región conexa
+    num, etiquetas, stats, _ = cv2.connectedComponentsWithStats(candidatos, connectivity=8)
+    if num < 2:
+        raise ValueError("No se encontró ninguna región de asfalto; marca un polígono con --poligono")
+    return etiquetas == 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+
+
+def _percentiles_histograma(histograma, percentiles):
+    acumulado = np.cumsum(histograma)
+    return np.searchsorted(acumulado, np.asarray(percentiles) / 100.0 * acumulado[-1])
+
+
+def proponer_limites_hsv(imagen_bgr, semilla):
+    """(lim_inf, lim_sup) HSV a partir de los histogramas de la semilla."""
+    hsv = cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2HSV)
+    pixeles = hsv[semilla]
+    if len(pixeles) == 0:
+        raise ValueError("La semilla de asfalto está vacía")
+
+    lim_inf, lim_sup = [], []
+    for canal, maximo in enumerate((180, 255, 255)):
+        histograma = np.bincount(pixeles[:, canal], minlength=256)
+        bajo, alto = _percentiles_histograma(histograma, PERCENTILES_HSV)
+        margen = int(round((alto - bajo) * MARGEN_HSV))
+        lim_inf.append(int(max(bajo - margen, 0)))
+        lim_sup.append(int(min(alto + margen, maximo)))
+
+    # Asfalto casi gris: el tono es ruido, se acepta cualquiera
+    if np.median(pixeles[:, 1]) < SATURACION_GRIS:
+        lim_inf[0], lim_sup[0] = 0, 180
+    return lim_inf, lim_sup
+
+
+# --- 2. BARRIDO DE KERNELS ---
+
+def puntuar_mascara(mascara):
+    """Componentes de la máscara y agujeros (regiones sin pista que no tocan el borde)."""
+    num, _, _, _ = cv2.connectedComponentsWithStats(mascara, connectivity=8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(mascara), connectivity=4)
+
+    alto, ancho = mascara.shape
+    x, y, w, h = (stats[1:, i] for i in range(4))
+    toca_borde = (x == 0) | (y == 0) | (x + w == ancho) | (y + h == alto)
+    return {'componentes': num - 1, 'agujeros': int(np.count_nonzero(~toca_borde))}
+
+
+def cierres_escalonados(mascara, cierres):
+    """
+    Cierres de `mascara` con kernels cuadrados de todos los tamaños impares de `cierres` (en orden
+    creciente), apilados en un array (n_cierres, alto, ancho). La dilatación de cada tamaño sale de
+    la del anterior con una dilatación 3x3 más (un cuadrado n x n es la suma de (n-1)/2 cuadrados
+    3x3), así que solo la erosión final se hace con el kernel completo. Da lo mismo que
+    cv2.morphologyEx(MORPH_CLOSE) con cada tamaño.
+    """
+    cerradas = np.empty((len(cierres),) + mascara.shape, np.uint8)
+    kernel_3 = np.ones((3, 3), np.uint8)
+    dilatada, tamano = mascara, 1
+    for i, n in enumerate(cierres):
+        if n <= 1:
+            cerradas[i] = mascara
+            continue
+        while tamano < n:
+            dilatada = cv2.dilate(dilatada, kernel_3)
+            tamano += 2
+        cv2.erode(dilatada, np.ones((n, n), np.uint8), dst=cerradas[i])
+    return cerradas
+
+
+def barrer_kernels(motor, semilla):
+    """
+    Puntúa todas las combinaciones (erosión, cierre) con los límites HSV actuales del motor.
+    Devuelve la tabla completa, ordenada de mejor a peor.
+    Cada erosión se calcula una vez (caché de MotorCalibracion) y todos sus cierres salen de las
+    mismas dilataciones escalonadas; la cobertura y la deformación de todos ellos se cuentan con
+    una sola operación sobre la pila. Los componentes y agujeros necesitan un etiquetado por máscara.
+    """
+    erosiones = sorted({tamano_kernel(n) for n in range(1, MAXIMOS_KERNEL[0] + 1)})
+    cierres = sorted({tamano_kernel(n) for n in range(1, MAXIMOS_KERNEL[1] + 1)})
+    inicial = motor.mascara_hsv()
+    area_inicial = max(cv2.countNonZero(inicial), 1)
+    n_semilla = max(np.count_nonzero(semilla), 1)
+
+    tabla = []
+    for erosion in erosiones:
+        motor.fijar_erosion(erosion)
+        cerradas = cierres_escalonados(motor.mascara_erosionada(), cierres)
+
+        coberturas = np.count_nonzero(cerradas[:, semilla], axis=1) / n_semilla
+        # Píxeles añadidos más quitados respecto a la máscara HSV sin limpiar
+        deformaciones = np.count_nonzero(cerradas != inicial, axis=(1, 2)) / area_inicial
+
+        for cierre, mascara, cobertura, deformacion in zip(cierres, cerradas, coberturas, deformaciones):
+            fila = puntuar_mascara(mascara)
+            fila.update({
+                'KERNEL_EROSION': erosion,
+                'KERNEL_CIERRE': cierre,
+                'cobertura': round(float(cobertura), 4),
+                'deformacion': round(float(deformacion), 4)
+            })
+            tabla.append(fila)
+
+    # Primero las que conservan la semilla, luego menos piezas sueltas y agujeros, luego menos deformación
+    tabla.sort(key=lambda f: (f['cobertura'] < COBERTURA_MINIMA, f['componentes'] - 1 + f['agujeros'],
+                              f['deformacion'], f['KERNEL_EROSION'] + f['KERNEL_CIERRE']))
+    return tabla
+
+
+# --- 3. CALIBRACIÓN COMPLETA ---
+
+def autocalibrar(imagen_bgr, poligono=None):
+    """Devuelve (valores para config.json, tabla del barrido de kernels)."""
+    semilla = semilla_asfalto(imagen_bgr, poligono)
+    lim_inf, lim_sup = proponer_limites_hsv(imagen_bgr, semilla)
+
+    motor = MotorCalibracion(imagen_bgr, lim_inf, lim_sup)
+    tabla = barrer_kernels(motor, semilla)
+
+    mejor = tabla[0]
+    motor.fijar_erosion(mejor['KERNEL_EROSION'])
+    motor.fijar_cierre(mejor['KERNEL_CIERRE'])
+    return motor.valores(), tabla
+
+
+def leer_poligono(texto):
+    """'x,y x,y ...' -> [(x, y), ...]"""
+    if not texto:
+        return None
+    puntos = [tuple(int(v) for v in p.split(',')) for p in texto.split()]
+    if len(puntos) < 3:
+        raise ValueError("El polígono necesita al menos 3 puntos")
+    return puntos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibración automática de la máscara de pista.")
+    parser.add_argument('fuente', help="Imagen de la pista vacía o vídeo (se usa su primer frame)")
+    parser.add_argument('--poligono', default=None, help="Zona aproximada de asfalto: 'x,y x,y x,y ...'")
+    parser.add_argument('--ancho', type=int, default=600, help="Ancho de análisis del detector. 0 = resolución original")
+    parser.add_argument('--config', default='config.json', help="config.json en el que guardar")
+    parser.add_argument('--guardar', action='store_true', help="Escribir los valores propuestos en config.json")
+    args = parser.parse_args()
+
+    imagen = cargar_imagen(args.fuente, args.ancho)
+    valores, tabla = autocalibrar(imagen, leer_poligono(args.poligono))
+
+    print("Mejores combinaciones de kernels:")
+    for fila in tabla[:5]:
+        print("  " + json.dumps(fila, ensure_ascii=False))
+    print(f"Propuesta: {json.dumps(valores)}")
+    if args.guardar:
+        guardar_en_config(valores, args.config)
+        print(f"Guardado en {args.config}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from Detector import DetectorDeVideo, imagen_deteccion, formatear_tiempo
+
+"""
+Barrido de UMBRAL_BG_SUB, UMBRAL_RUIDO_COCHE y UMBRAL_SALIDA en una sola pasada por el vídeo.
+Cada frame se decodifica, se reescala y se resta contra el fondo UNA vez; después:
+    - UMBRAL_BG_SUB: con el histograma de la diferencia se sabe cuántos píxeles superan cada
+      umbral. El cierre 5x5 (x2) solo puede extender cada píxel a su entorno de 9x9, así que si
+      81 veces ese número no llega al menor UMBRAL_RUIDO_COCHE, ese umbral (y los mayores) no
+      pueden ver un coche y se saltan sin umbralizar. Con la pista vacía casi todo se salta.
+    - UMBRAL_RUIDO_COCHE y UMBRAL_SALIDA: de cada blob basta su área y su % en pista. Con los
+      blobs ordenados por área, el mínimo acumulado del % da, para cada UMBRAL_RUIDO_COCHE, el
+      peor coche válido; hay infracción con (ruido, salida) si ese mínimo es menor que salida.
+El veredicto de cada combinación es el mismo que daría AnalizadorFrames (fondo estático,
+NIVEL_ANALISIS 0 y el CANAL_DETECCION de config.json) sobre todos los frames del vídeo.
+
+Uso:
+    python BarridoUmbrales.py Imagenes/RbRingT10.mp4 --salida barrido.jsonl \\
+        --umbral-bg-sub 20 25 30 35 --umbral-ruido 300 500 800 --umbral-salida 2 5 10 \\
+        --referencia eventos_revisados.jsonl
+
+La referencia es un JSONL de eventos como el de AnalisisHeadless.py (registros 'infraccion' o
+'incidente') o un texto con un frame ("120") o un rango ("120-185") por línea.
+Cada línea de la salida es una combinación con sus tramos de frames con infracción y, si hay
+referencia, precisión y recall por frame; la última línea es el resumen.
+"""
+
+# El cierre de AnalizadorFrames (5x5, 2 iteraciones) extiende cada píxel como mucho a 9x9
+CRECIMIENTO_CIERRE = 9 * 9
+
+
+# --- 1. REFERENCIA ETIQUETADA ---
+
+def cargar_referencia(ruta):
+    """Conjunto de frame_idx con infracción según la referencia (JSONL de eventos o texto)."""
+    frames = set()
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea or linea.startswith('#'):
+                continue
+            if linea.startswith('{'):
+                evento = json.loads(linea)
+                if evento.get('tipo') == 'infraccion':
+                    frames.add(evento['frame_idx'])
+                elif evento.get('tipo') == 'incidente':
+                    frames.update(range(evento['inicio_frame'], evento['fin_frame'] + 1))
+            elif '-' in linea:
+                inicio, fin = (int(v) for v in linea.split('-'))
+                frames.update(range(inicio, fin + 1))
+            else:
+                frames.add(int(linea))
+    return frames
+
+
+def rachas(frames):
+    """[[inicio, fin], ...] con los frames consecutivos agrupados (frames ordenados)."""
+    tramos = []
+    for i in frames:
+        if tramos and i == tramos[-1][1] + 1:
+            tramos[-1][1] = i
+        else:
+            tramos.append([i, i])
+    return tramos
+
+
+# --- 2. EVALUACIÓN DE UN FRAME ---
+
+class EvaluadorBarrido:
+    """
+    Evalúa un frame para todos los umbrales a la vez. Reserva sus buffers (tamaño de la ROI)
+    una sola vez, igual que AnalizadorFrames.
+    """
+
+    def __init__(self, fondo, mascara_pista, zona, umbrales_bg_sub, umbrales_ruido):
+        self.fondo = fondo[zona]
+        self.zona = zona
+        self.umbrales_bg_sub = np.array(sorted(umbrales_bg_sub))
+        self.umbrales_ruido = np.array(sorted(umbrales_ruido))
+
+        pista = mascara_pista[zona]
+        forma = pista.shape
+        self._kernel_coche = np.ones((5, 5), np.uint8)
+        self._diff = np.empty(forma + fondo.shape[2:], np.uint8)
+        self._gris = np.empty(forma, np.uint8)
+        self._mascara = np.empty(forma, np.uint8)
+        self._mascara_coche = np.empty(forma, np.uint8)
+        self._etiquetas = np.empty(forma, np.int32)
+        self._indices_pista = np.flatnonzero(pista)
+        self._etiquetas_pista = np.empty(len(self._indices_pista), np.int32)
+
+    def diferencia(self, imagen):
+        """Diferencia con el fondo en gris (ROI). Es lo único que se calcula una vez por frame."""
+        cv2.absdiff(self.fondo, imagen[self.zona], dst=self._diff)
+        if self._diff.ndim == 3:
+            cv2.cvtColor(self._diff, cv2.COLOR_BGR2GRAY, dst=self._gris)
+            return self._gris
+        return self._diff
+
+    def evaluar(self, imagen):
+        """
+        Devuelve una matriz (n_bg_sub, n_ruido) con el menor % en pista de los coches válidos
+        (inf si no hay ninguno), o None si ningún umbral ve un coche.
+        """
+        gris = self.diferencia(imagen)
+
+        # Píxeles por encima de cada umbral (THRESH_BINARY: valor > umbral) a partir del histograma
+        histograma = np.bincount(gris.reshape(-1), minlength=256)
+        por_encima = np.cumsum(histograma[::-1])[::-1] # por_encima[v] = nº de píxeles >= v
+        candidatos = por_encima[np.minimum(self.umbrales_bg_sub + 1, 255)] * CRECIMIENTO_CIERRE >= self.umbrales_ruido[0]
+        if not candidatos.any():
+            return None
+
+        minimos = np.full((len(self.umbrales_bg_sub), len(self.umbrales_ruido)), np.inf)
+        for b in np.flatnonzero(candidatos):
+            cv2.threshold(gris, int(self.umbrales_bg_sub[b]), 255, cv2.THRESH_BINARY, dst=self._mascara)
+            mascara_coche = cv2.morphologyEx(self._mascara, cv2.MORPH_CLOSE, self._kernel_coche,
+                                             dst=self._mascara_coche, iterations=2)
+            num_blobs, etiquetas, stats, _ = cv2.connectedComponentsWithStats(mascara_coche, labels=self._etiquetas,
+                                                                              connectivity=8, ltype=cv2.CV_32S)
+            if num_blobs < 2:
+                continue
+
+            areas = stats[1:, cv2.CC_STAT_AREA]
+            np.take(etiquetas.reshape(-1), self._indices_pista, out=self._etiquetas_pista)
+            pixeles_en_pista = np.bincount(self._etiquetas_pista, minlength=num_blobs)[1:]
+            porcentajes = pixeles_en_pista * 100.0 / areas
+
+            # Blobs de mayor a menor área: los válidos para un umbral de ruido son un prefijo
+            orden = np.argsort(-areas, kind='stable')
+            minimo_acumulado = np.minimum.accumulate(porcentajes[orden])
+            n_validos = np.searchsorted(-areas[orden], -self.umbrales_ruido, side='right')
+            hay = n_validos > 0
+            minimos[b, hay] = minimo_acumulado[n_validos[hay] - 1]
+
+        return minimos
+
+
+# --- 3. BARRIDO ---
+
+def barrer_umbrales(video_path, ruta_salida, umbrales_bg_sub, umbrales_ruido, umbrales_salida,
+                    ruta_referencia=None, ancho_ventana=600, ruta_config='config.json'):
+    """
+    Recorre el vídeo una vez y escribe en ruta_salida (JSONL) una línea por combinación de
+    umbrales y un resumen final. Devuelve el resumen.
+    """
+    inicio_t = time.perf_counter()
+
+    # El detector aporta la referencia (con su caché), la máscara, la ROI y la lectura de frames
+    detector = DetectorDeVideo(video_path, ancho_ventana=ancho_ventana, ruta_config=ruta_config, bucle=False,
+                               incidentes=False)
+    evaluador = EvaluadorBarrido(detector.fondo_deteccion, detector.mascara_pista, detector.zona,
+                                 umbrales_bg_sub, umbrales_ruido)
+    umbrales_salida = np.array(sorted(umbrales_salida))
+
+    frames_evaluados = []
+    minimos = []
+    imagen_canal = None
+    frames = 0
+    while True:
+        frame_actual = detector.leer_frame()
+        if frame_actual is None:
+            break
+        frames += 1
+
+        imagen_canal = imagen_deteccion(frame_actual, detector.CANAL_DETECCION, detector.zona, dst=imagen_canal)
+        resultado = evaluador.evaluar(imagen_canal)
+        if resultado is not None:
+            frames_evaluados.append(detector.frame_count)
+            minimos.append(resultado)
+    detector.liberar()
+
+    # (frames, bg_sub, ruido, salida): infracción si el peor coche válido queda por debajo de salida
+    frames_evaluados = np.array(frames_evaluados, np.int64)
+    if minimos:
+        infracciones = np.stack(minimos)[..., None] < umbrales_salida
+    else:
+        infracciones = np.zeros((0, len(evaluador.umbrales_bg_sub), len(evaluador.umbrales_ruido), len(umbrales_salida)), bool)
+
+    referencia = cargar_referencia(ruta_referencia) if ruta_referencia else None
+
+    combinaciones = []
+    for b, bg_sub in enumerate(evaluador.umbrales_bg_sub):
+        for r, ruido in enumerate(evaluador.umbrales_ruido):
+            for s, salida in enumerate(umbrales_salida):
+                detectados = frames_evaluados[infracciones[:, b, r, s]].tolist()
+                tramos = rachas(detectados)
+                combinacion = {
+                    'tipo': 'combinacion',
+                    'UMBRAL_BG_SUB': int(bg_sub),
+                    'UMBRAL_RUIDO_COCHE': int(ruido),
+                    'UMBRAL_SALIDA': float(salida),
+                    'infracciones': len(detectados),
+                    'incidentes': len(tramos),
+                    'tramos': [[i, f, formatear_tiempo(i / detector.fps)] for i, f in tramos]
+                }
+                if referencia is not None:
+                    vp = len(referencia.intersection(detectados))
+                    combinacion['precision'] = round(vp / len(detectados), 4) if detectados else None
+                    combinacion['recall'] = round(vp / len(referencia), 4) if referencia else None
+                combinaciones.append(combinacion)
+
+    tiempo_total = time.perf_counter() - inicio_t
+    resumen = {
+        'tipo': 'resumen',
+        'video': video_path,
+        'frames': frames,
+        'frames_con_movimiento': len(frames_evaluados),
+        'combinaciones': len(combinaciones),
+        'tiempo_s': round(tiempo_total, 3),
+        'fps': round(frames / tiempo_total, 1) if tiempo_total > 0 else 0.0
+    }
+    if referencia is not None:
+        resumen['frames_referencia'] = len(referencia)
+        resumen['mejor'] = mejor_combinacion(combinaciones)
+
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        for combinacion in combinaciones:
+            f.write(json.dumps(combinacion, ensure_ascii=False) + '\n')
+        f.write(json.dumps(resumen, ensure_ascii=False) + '\n')
+
+    return resumen
+
+
+def mejor_combinacion(combinaciones):
+    """Umbrales de la combinación con mejor F1 frente a la referencia."""
+    def f1(c):
+        p, r = c['precision'] or 0.0, c['recall'] or 0.0
+        return 2 * p * r / (p + r) if p + r > 0 else 0.0
+
+    mejor = max(combinaciones, key=f1)
+    return {clave: mejor[clave] for clave in ('UMBRAL_BG_SUB', 'UMBRAL_RUIDO_COCHE', 'UMBRAL_SALIDA', 'precision', 'recall')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de umbrales de config.json en una sola pasada.")
+    parser.add_argument('video', help="Ruta al vídeo a analizar")
+    parser.add_argument('--salida', default='barrido.jsonl', help="Fichero JSONL de resultados")
+    parser.add_argument('--umbral-bg-sub', type=int, nargs='+', required=True, help="Valores de UMBRAL_BG_SUB")
+    parser.add_argument('--umbral-ruido', type=int, nargs='+', required=True, help="Valores de UMBRAL_RUIDO_COCHE")
+    parser.add_argument('--umbral-salida', type=float, nargs='+', required=True, help="Valores de UMBRAL_SALIDA")
+    parser.add_argument('--referencia', default=None, help="Infracciones etiquetadas (JSONL de eventos o texto)")
+    parser.add_argument('--ancho', type=int, default=600, help="Ancho de análisis (px)")
+    parser.add_argument('--config', default='config.json', help="Ruta a config.json (máscara, ROI y canal)")
+    args = parser.parse_args()
+
+    resumen = barrer_umbrales(args.video, args.salida, args.umbral_bg_sub, args.umbral_ruido, args.umbral_salida,
+                              args.referencia, args.ancho, args.config)
+
+    print(f"Frames analizados: {resumen['frames']} ({resumen['frames_con_movimiento']} con movimiento)")
+    print(f"Combinaciones evaluadas: {resumen['combinaciones']}")
+    if 'mejor' in resumen:
+        print(f"Mejor combinación: {json.dumps(resumen['mejor'], ensure_ascii=False)}")
+    print(f"Tiempo total: {resumen['tiempo_s']:.2f}s ({resumen['fps']:.1f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from Detector import (DetectorDeVideo, AnalizadorFrames, analizar_frame, crear_mascara_pista, reescalar_frame,
+                      calcular_roi, LIM_INF_PISTA, LIM_SUP_PISTA, KERNEL_EROSION, KERNEL_CIERRE)
+
+"""
+Benchmark reproducible: genera vídeos sintéticos a partir de Imagenes/rb_ring16.jpg con
+"coches" (rectángulos) que entran y salen de la pista en frames conocidos, a varias
+resoluciones y con varios coches, y mide:
+    - crear_mascara_pista, reescalar_frame, analizar_frame y AnalizadorFrames.analizar
+    - el rendimiento de extremo a extremo de DetectorDeVideo (frames/s)
+    - la precisión y el recall de las infracciones frente a la verdad conocida
+Todo va a un JSON (con versiones de OpenCV/NumPy/Python y la CPU) para comparar ejecuciones.
+
+Uso:
+    python Benchmark.py --salida benchmark.json
+    python Benchmark.py --salida benchmark.json --resoluciones 960 1920 --coches 1 4 8 --frames 300
+
+La verdad se calcula con la misma máscara de pista que usa el detector (calculada sobre el
+frame reescalado a --ancho), así se mide la detección y no la calibración HSV. Los frames en
+los que un coche está justo en el umbral de salida, o dos coches se tocan, se marcan como
+ambiguos y no cuentan.
+"""
+
+IMAGEN_BASE = os.path.join("Imagenes", "rb_ring16.jpg")
+
+# Colores de los coches (BGR), bien distintos del asfalto y de la hierba
+COLORES_COCHES = [(255, 255, 255), (0, 255, 255), (255, 0, 255), (255, 255, 0),
+                  (0, 0, 255), (255, 128, 0), (128, 0, 255), (0, 128, 255)]
+
+
+# --- 1. GENERADOR DE VÍDEOS SINTÉTICOS ---
+
+def _puntos_candidatos(mascara, tam_coche, dentro, roi):
+    """Centros donde el coche (w, h) cabe entero dentro (o entero fuera) de la pista y dentro de la ROI."""
+    w, h = tam_coche
+    kernel = np.ones((h + 2, w + 2), np.uint8)
+    if dentro:
+        valido = cv2.erode(mascara, kernel) > 0
+    else:
+        valido = cv2.dilate(mascara, kernel) == 0
+
+    x0, y0, rw, rh = roi
+    limite = np.zeros_like(valido)
+    limite[y0 + h:y0 + rh - h, x0 + w:x0 + rw - w] = True
+    ys, xs = np.nonzero(valido & limite)
+    return np.column_stack([xs, ys])
+
+
+def generar_video_sintetico(ruta, ancho, n_coches, n_frames=200, fps=25, ancho_analisis=600,
+                            umbral_salida=5, params_pista=None, semilla=0):
+    """
+    Escribe un vídeo de n_frames a `ancho` px con n_coches que alternan tramos dentro y fuera
+    de la pista. El frame 0 es la pista vacía (la referencia del detector).
+    Devuelve la verdad por frame: lista de (frame_idx, infraccion, ambiguo), con frame_idx
+    numerado como DetectorDeVideo (el primer frame es el 1).
+    """
+    rng = np.random.default_rng(semilla)
+    params_pista = params_pista or {}
+
+    base = cv2.imread(IMAGEN_BASE)
+    if base is None:
+        raise FileNotFoundError(f"No se encontró la imagen base {IMAGEN_BASE}")
+    base = reescalar_frame(base, ancho)
+    alto = base.shape[0]
+
+    # Máscara de pista como la calcula el detector (al ancho de análisis), llevada a la resolución del vídeo
+    referencia = reescalar_frame(base, ancho_analisis)
+    mascara_analisis = crear_mascara_pista(referencia, **params_pista)
+    mascara = cv2.resize(mascara_analisis, (ancho, alto), interpolation=cv2.INTER_NEAREST)
+    escala = ancho / ancho_analisis
+    roi = tuple(int(v * escala) for v in calcular_roi(mascara_analisis))
+
+    tam_coche = (max(int(ancho * 0.07), 4), max(int(ancho * 0.04), 3))
+    w, h = tam_coche
+    en_pista = _puntos_candidatos(mascara, tam_coche, True, roi)
+    fuera = _puntos_candidatos(mascara, tam_coche, False, roi)
+    if len(en_pista) == 0 or len(fuera) == 0:
+        raise ValueError("No hay sitio para colocar coches dentro y fuera de la pista")
+
+    # Trayectoria de cada coche: paradas alternas dentro/fuera con desplazamientos lineales
+    trayectorias = []
+    for c in range(n_coches):
+        inicio = int(rng.integers(1, max(n_frames // 4, 2)))
+        posiciones = {}
+        dentro = bool(c % 2 == 0)
+        actual = (en_pista if dentro else fuera)[rng.integers(len(en_pista if dentro else fuera))]
+        f = inicio
+        while f < n_frames:
+            dentro = not dentro
+            destino = (en_pista if dentro else fuera)[rng.integers(len(en_pista if dentro else fuera))]
+            pasos = int(rng.integers(10, 25))
+            parada = int(rng.integers(10, 30))
+            for k in range(pasos):
+                posiciones[f + k] = actual + (destino - actual) * (k + 1) / pasos
+            for k in range(parada):
+                posiciones[f + pasos + k] = destino
+            f += pasos + parada
+            actual = destino
+        trayectorias.append(posiciones)
+
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*'mp4v'), fps, (ancho, alto))
+    verdad = []
+    for i in range(n_frames):
+        frame = base.copy()
+        cajas = []
+        for c, posiciones in enumerate(trayectorias):
+            if i == 0 or i not in posiciones:
+                continue
+            cx, cy = posiciones[i]
+            x, y = int(cx - w / 2), int(cy - h / 2)
+            cv2.rectangle(frame, (x, y), (x + w - 1, y + h - 1), COLORES_COCHES[c % len(COLORES_COCHES)], -1)
+            cajas.append((x, y))
+
+        infraccion, ambiguo = False, False
+        for j, (x, y) in enumerate(cajas):
+            porcentaje = np.count_nonzero(mascara[y:y + h, x:x + w]) * 100.0 / (w * h)
+            if porcentaje < umbral_salida:
+                infraccion = True
+            # Cerca del umbral el resultado depende de unos pocos píxeles de borde
+            if umbral_salida / 2 <= porcentaje < umbral_salida * 4:
+                ambiguo = True
+            # Dos coches que se tocan forman un solo blob
+            for (x2, y2) in cajas[j + 1:]:
+                if abs(x - x2) < w + 12 and abs(y - y2) < h + 12:
+                    ambiguo = True
+        escritor.write(frame)
+        verdad.append((i + 1, infraccion, ambiguo))
+
+    escritor.release()
+    return verdad
+
+
+# --- 2. MEDIDAS ---
+
+def _cronometrar(funcion, repeticiones):
+    """Mediana y p95 (ms) de `repeticiones` llamadas, tras una de calentamiento."""
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        t = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t) * 1000)
+    tiempos.sort()
+    return {
+        'mediana_ms': round(statistics.median(tiempos), 4),
+        'p95_ms': round(tiempos[min(int(len(tiempos) * 0.95), len(tiempos) - 1)], 4),
+        'repeticiones': repeticiones
+    }
+
+
+def medir_funciones(ruta_video, ancho_analisis, config, repeticiones):
+    """Microbenchmarks de las funciones del pipeline sobre un frame del vídeo con coches."""
+    cap = cv2.VideoCapture(ruta_video)
+    _, fondo = cap.read()
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, total // 2)
+    _, frame = cap.read()
+    cap.release()
+
+    fondo_r = reescalar_frame(fondo, ancho_analisis)
+    frame_r = reescalar_frame(frame, ancho_analisis)
+    mascara = crear_mascara_pista(fondo_r)
+    mascara_bgr = cv2.cvtColor(mascara, cv2.COLOR_GRAY2BGR)
+    roi = calcular_roi(mascara, config.get("MARGEN_ROI", 40))
+    umbrales = (config["UMBRAL_BG_SUB"], config["UMBRAL_RUIDO_COCHE"], config["UMBRAL_SALIDA"])
+    analizador = AnalizadorFrames(fondo_r, mascara, mascara_bgr, *umbrales, roi)
+    dst = np.empty_like(frame_r)
+
+    return {
+        'crear_mascara_pista': _cronometrar(lambda: crear_mascara_pista(fondo_r), repeticiones),
+        'crear_mascara_pista_nativa': _cronometrar(lambda: crear_mascara_pista(fondo), max(repeticiones // 10, 3)),
+        'reescalar_frame': _cronometrar(lambda: reescalar_frame(frame, ancho_analisis, dst=dst), repeticiones),
+        'analizar_frame': _cronometrar(lambda: analizar_frame(frame_r, fondo_r, mascara, *umbrales, mascara_bgr, roi), repeticiones),
+        'AnalizadorFrames.analizar': _cronometrar(lambda: analizador.analizar(frame_r), repeticiones)
+    }
+
+
+def medir_extremo_a_extremo(ruta_video, ancho_analisis, ruta_config, verdad):
+    """Recorre el vídeo con DetectorDeVideo (como el modo headless) y compara con la verdad."""
+    inicio = time.perf_counter()
+    detector = DetectorDeVideo(ruta_video, ancho_ventana=ancho_analisis, ruta_config=ruta_config, bucle=False,
+                               ruta_cache=None, incidentes=False)
+    tiempo_arranque = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    analizados = set()
+    detectadas = set()
+    frames = 0
+    while True:
+        results = detector.get_next_frame_data()
+        if results is None:
+            break
+        frames += 1
+        analizados.add(results['frame_idx'])
+        if results['infraccion_detectada']:
+            detectadas.add(results['frame_idx'])
+    tiempo = time.perf_counter() - inicio
+    detector.liberar()
+
+    # Solo cuentan los frames analizados y no ambiguos (en reposo algunos frames vacíos se saltan)
+    vp = fp = fn = 0
+    for frame_idx, infraccion, ambiguo in verdad:
+        if ambiguo or frame_idx not in analizados:
+            continue
+        detectada = frame_idx in detectadas
+        vp += infraccion and detectada
+        fp += (not infraccion) and detectada
+        fn += infraccion and not detectada
+
+    return {
+        'frames': frames,
+        'arranque_s': round(tiempo_arranque, 3),
+        'tiempo_s': round(tiempo, 3),
+        'fps': round(frames / tiempo, 2) if tiempo > 0 else None,
+        'infracciones_reales': vp + fn,
+        'verdaderos_positivos': vp,
+        'falsos_positivos': fp,
+        'falsos_negativos': fn,
+        'precision': round(vp / (vp + fp), 4) if vp + fp else None,
+        'recall': round(vp / (vp + fn), 4) if vp + fn else None,
+        'frames_ambiguos': sum(1 for _, _, a in verdad if a)
+    }
+
+
+# --- 3. SUITE ---
+
+def entorno():
+    return {
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'hilos_opencv': cv2.getNumThreads()
+    }
+
+
+def ejecutar_benchmark(ruta_salida, resoluciones=(960, 1920), coches=(1, 4), n_frames=200, ancho_analisis=600,
+                       ruta_config='config.json', repeticiones=50, semilla=0, directorio=None):
+    with open(ruta_config, 'r') as f:
+        config = json.load(f)
+    params_pista = {
+        'lim_inf_pista': config.get("LIM_INF_PISTA", LIM_INF_PISTA),
+        'lim_sup_pista': config.get("LIM_SUP_PISTA", LIM_SUP_PISTA),
+        'kernel_erosion_size': config.get("KERNEL_EROSION", KERNEL_EROSION),
+        'kernel_cierre_size': config.get("KERNEL_CIERRE", KERNEL_CIERRE)
+    }
+
+    directorio_propio = directorio is None
+    directorio = directorio or tempfile.mkdtemp(prefix='f1_benchmark_')
+    os.makedirs(directorio, exist_ok=True)
+
+    casos = []
+    try:
+        for ancho in resoluciones:
+            for n_coches in coches:
+                ruta_video = os.path.join(directorio, f"sintetico_{ancho}_{n_coches}.mp4")
+                verdad = generar_video_sintetico(ruta_video, ancho, n_coches, n_frames, ancho_analisis=ancho_analisis,
+                                                 umbral_salida=config["UMBRAL_SALIDA"], params_pista=params_pista,
+                                                 semilla=semilla)
+                caso = {
+                    'ancho': ancho,
+                    'coches': n_coches,
+                    'frames': n_frames,
+                    'funciones': medir_funciones(ruta_video, ancho_analisis, config, repeticiones),
+                    'extremo_a_extremo': medir_extremo_a_extremo(ruta_video, ancho_analisis, ruta_config, verdad)
+                }
+                casos.append(caso)
+                e2e = caso['extremo_a_extremo']
+                print(f"{ancho}px, {n_coches} coches: {e2e['fps']} frames/s, "
+                      f"precisión {e2e['precision']}, recall {e2e['recall']}")
+    finally:
+        if directorio_propio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    resultado = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'entorno': entorno(),
+        'config': config,
+        'ancho_analisis': ancho_analisis,
+        'semilla': semilla,
+        'casos': casos
+    }
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark con vídeos sintéticos y verdad conocida.")
+    parser.add_argument("--salida", default="benchmark.json", help="Fichero JSON de resultados")
+    parser.add_argument("--resoluciones", type=int, nargs='+', default=[960, 1920], help="Anchos de los vídeos generados")
+    parser.add_argument("--coches", type=int, nargs='+', default=[1, 4], help="Número de coches por vídeo")
+    parser.add_argument("--frames", type=int, default=200, help="Frames por vídeo")
+    parser.add_argument("--ancho", type=int, default=600, help="Ancho de análisis (ancho_ventana del detector)")
+    parser.add_argument("--config", default="config.json", help="Ruta a config.json")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Repeticiones de cada microbenchmark")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla de las trayectorias")
+    parser.add_argument("--directorio", default=None, help="Dónde guardar los vídeos (por defecto, temporal y se borra)")
+    args = parser.parse_args()
+
+    ejecutar_benchmark(args.salida, args.resoluciones, args.coches, args.frames, args.ancho, args.config,
+                       args.repeticiones, args.semilla, args.directorio)
+    print(f"Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+import numpy as np
+
+"""
+Buffer circular preasignado con los últimos N frames analizados.
+Sirve para que la revisión de un incidente empiece unos segundos ANTES de que el coche
+se salga de la pista. Los frames se escriben directamente en su hueco (sin reservar memoria
+por frame) y, al abrirse un incidente, el buffer entero se entrega al incidente sin copiar
+nada: el detector pasa a escribir en un buffer de repuesto.
+"""
+
+
+class BufferCircular:
+
+    def __init__(self, capacidad, forma, dtype=np.uint8):
+        self.capacidad = capacidad
+        self.forma = tuple(forma)
+        self.dtype = dtype
+
+        self._datos = np.zeros((capacidad,) + self.forma, dtype)
+        self._repuesto = np.zeros_like(self._datos)
+        self._indices = np.full(capacidad, -1, np.int64) # frame_idx de cada hueco (-1 = vacío)
+        self._pos = 0
+        self._generacion = 0 # Cambia cada vez que se entrega el buffer a un incidente
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """
+        Devuelve (hueco, ticket): una vista del siguiente hueco, donde escribir el frame en sitio,
+        y el ticket con el que confirmarlo después con confirmar().
+        """
+        with self._lock:
+            slot = self._pos
+            self._pos = (slot + 1) % self.capacidad
+            self._indices[slot] = -1
+            return self._datos[slot], (self._generacion, slot)
+
+    def confirmar(self, ticket, frame_idx):
+        """Marca el hueco como escrito. Si el buffer se entregó mientras tanto, no hace nada."""
+        generacion, slot = ticket
+        with self._lock:
+            if generacion == self._generacion:
+                self._indices[slot] = frame_idx
+
+    def desacoplar(self, hasta=None):
+        """
+        Entrega los frames guardados, en orden cronológico, como vistas del buffer actual
+        (sin copiarlos) y pasa a escribir en el buffer de repuesto.
+        Si se indica `hasta`, solo se devuelven los frames con frame_idx < hasta.
+        """
+        with self._lock:
+            datos, indices = self._datos, self._indices.copy()
+            self._datos = self._repuesto if self._repuesto is not None else np.empty_like(datos)
+            self._repuesto = None
+            self._indices.fill(-1)
+            self._pos = 0
+            self._generacion += 1
+
+        # Nuevo repuesto: una sola reserva por incidente (np.empty no inicializa la memoria)
+        repuesto = np.empty_like(datos)
+        with self._lock:
+            if self._repuesto is None:
+                self._repuesto = repuesto
+
+        orden = np.argsort(indices, kind='stable')
+        return [datos[i] for i in orden
+                if indices[i] >= 0 and (hasta is None or indices[i] < hasta)]
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+"""
+Caché en disco del frame de referencia y de la máscara de pista.
+Evita releer el primer frame y recalcular crear_mascara_pista cada vez que arranca un detector.
+Cada entrada es un directorio con un .npy por array; al cargar se mapean en memoria
+(np.load con mmap_mode='r'), así que la carga es prácticamente instantánea.
+"""
+
+# Subir este número invalida todas las entradas si cambia el formato o el algoritmo de la máscara
+VERSION_CACHE = 1
+
+ARRAYS_REFERENCIA = ('fondo_vacio', 'mascara_pista', 'mascara_pista_bgr')
+
+
+def identificador_fuente(video_path):
+    """
+    Identifica la fuente de vídeo. Para ficheros incluye tamaño y fecha de modificación,
+    de modo que si se sustituye el vídeo la entrada antigua deja de coincidir.
+    Para cámaras (índice V4L2, URL) basta con el propio identificador.
+    """
+    if isinstance(video_path, str) and os.path.isfile(video_path):
+        st = os.stat(video_path)
+        return [os.path.abspath(video_path), st.st_size, int(st.st_mtime)]
+    return [str(video_path)]
+
+
+def clave_cache(video_path, ancho_ventana, params_pista):
+    """Clave de la entrada: fuente, ancho de análisis, límites HSV y tamaños de kernel."""
+    datos = {
+        'version': VERSION_CACHE,
+        'fuente': identificador_fuente(video_path),
+        'ancho': ancho_ventana,
+        'params': params_pista
+    }
+    return hashlib.sha1(json.dumps(datos, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cargar_referencia(ruta_cache, clave):
+    """Devuelve un dict con los arrays de referencia mapeados en memoria, o None si no hay entrada."""
+    directorio = os.path.join(ruta_cache, clave)
+    if not os.path.isdir(directorio):
+        return None
+    try:
+        # np.asarray: vista ndarray normal sobre el mmap (se puede pasar a OpenCV y a otros procesos)
+        return {nombre: np.asarray(np.load(os.path.join(directorio, nombre + '.npy'), mmap_mode='r'))
+                for nombre in ARRAYS_REFERENCIA}
+    except (OSError, ValueError):
+        # Entrada corrupta o incompleta: se ignora y se recalcula
+        return None
+
+
+def guardar_referencia(ruta_cache, clave, arrays):
+    """
+    Guarda los arrays de referencia. Se escriben en un directorio temporal que luego se renombra,
+    así otro proceso nunca ve una entrada a medio escribir.
+    """
+    directorio = os.path.join(ruta_cache, clave)
+    temporal = f"{directorio}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(temporal, exist_ok=True)
+        for nombre in ARRAYS_REFERENCIA:
+            np.save(os.path.join(temporal, nombre + '.npy'), arrays[nombre])
+        os.replace(temporal, directorio)
+    except OSError:
+        # Otro proceso la escribió antes (o no hay permisos): la caché es opcional
+        shutil.rmtree(temporal, ignore_errors=True)
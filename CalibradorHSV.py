@@ -1,98 +1,103 @@
+import argparse
 import cv2
-import numpy as np
+
+from MotorCalibracion import MotorCalibracion, MAXIMOS_HSV, cargar_imagen, para_mostrar, guardar_en_config
+from AutoCalibracion import autocalibrar, leer_poligono
 
 """
 Carga una imagen y nos permite determinar los valores
-del filtro de colorr HSV y el valor del erode.
+del filtro de color HSV y el valor del erode.
+Los deslizadores parten de los valores de config.json y, al pulsar 'g', los valores
+elegidos se guardan en config.json (LIM_INF_PISTA, LIM_SUP_PISTA, KERNEL_EROSION).
+Solo se recalcula (y se repinta) cuando se mueve un deslizador (ver MotorCalibracion.py).
+Con --auto los deslizadores parten de la propuesta de AutoCalibracion.py y solo queda retocarla.
+
+Uso:
+    python CalibradorHSV.py Imagenes/rb_ring16.jpg --config config.json
+    python CalibradorHSV.py Imagenes/RbRingT10.mp4 --auto --poligono "120,300 400,120 560,200 300,330"
 """
 
-def nada(x):
-    pass
-
-# --- Configuración Inicial ---
-ruta_imagen = 'Imagenes/rb_ring16.jpg'
-ancho_max_ventana = 800  # Para reescalar la imagen si es muy grande
-
-# Cargar la imagen
-imagen = cv2.imread(ruta_imagen)
-if imagen is None:
-    print(f"Error: No se pudo cargar la imagen en {ruta_imagen}")
-    exit()
-
-# Reescalar la imagen para que quepa en la pantalla
-altura, anchura = imagen.shape[:2]
-if anchura > ancho_max_ventana:
-    escala = ancho_max_ventana / anchura
-    dim = (ancho_max_ventana, int(altura * escala))
-    imagen = cv2.resize(imagen, dim, interpolation=cv2.INTER_AREA)
-
-# Convertir a HSV
-hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
-
-# Crear la ventana para los controles (trackbars)
-cv2.namedWindow('Controles HSV')
-cv2.resizeWindow('Controles HSV', 600, 350) # Aumentamos el tamaño para el nuevo trackbar
-
-# --- Crear los 6 Trackbars HSV ---
-cv2.createTrackbar('H Min', 'Controles HSV', 0, 180, nada)
-cv2.createTrackbar('H Max', 'Controles HSV', 180, 180, nada)
-cv2.createTrackbar('S Min', 'Controles HSV', 0, 255, nada)
-cv2.createTrackbar('S Max', 'Controles HSV', 255, 255, nada)
-cv2.createTrackbar('V Min', 'Controles HSV', 0, 255, nada)
-cv2.createTrackbar('V Max', 'Controles HSV', 255, 255, nada)
-
-# --- Crear el trackbar para determinar el erode ---
-cv2.createTrackbar('Kernel Erosion', 'Controles HSV', 1, 15, nada)
-
-
-print("\n--- Calibrador HSV con Erosión ---")
-print("Ajusta los deslizadores HSV para aislar el color.")
-print("Luego ajusta 'Kernel Erosion' para limpiar el ruido.")
-print("Presiona 'ESC' para salir.")
-
-# --- Bucle Principal ---
-while True:
-    # 1. Leer la posición actual de los 6 trackbars HSV
-    h_min = cv2.getTrackbarPos('H Min', 'Controles HSV')
-    h_max = cv2.getTrackbarPos('H Max', 'Controles HSV')
-    s_min = cv2.getTrackbarPos('S Min', 'Controles HSV')
-    s_max = cv2.getTrackbarPos('S Max', 'Controles HSV')
-    v_min = cv2.getTrackbarPos('V Min', 'Controles HSV')
-    v_max = cv2.getTrackbarPos('V Max', 'Controles HSV')
-
-    # 2. Leer la posición del trackbar de Erosión
-    kernel_erosion_size = cv2.getTrackbarPos('Kernel Erosion', 'Controles HSV')
-    
-    # Kernel debe ser impar.
-    if kernel_erosion_size % 2 == 0:
-        kernel_erosion_size += 1
-    if kernel_erosion_size == 0:
-        kernel_erosion_size = 1
-
-
-    # 3. Crear los arrays de límites HSV
-    limite_inferior = np.array([h_min, s_min, v_min])
-    limite_superior = np.array([h_max, s_max, v_max])
-
-    # 4. Crear la máscara con cv2.inRange()
-    mascara = cv2.inRange(hsv, limite_inferior, limite_superior)
-
-    # 5. Aplicar Erosión si el tamaño del kernel es mayor a 1
-    if kernel_erosion_size > 1:
-        kernel = np.ones((kernel_erosion_size, kernel_erosion_size), np.uint8)
-        mascara_limpia = cv2.erode(mascara, kernel, iterations=1)
+VENTANA = 'Controles HSV'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibración de los límites HSV y la erosión de la máscara de pista.")
+    parser.add_argument('imagen', nargs='?', default='Imagenes/rb_ring16.jpg', help="Imagen de la pista vacía (o vídeo)")
+    parser.add_argument('--config', default='config.json', help="config.json del que se parte y en el que se guarda")
+    parser.add_argument('--ancho', type=int, default=600,
+                        help="Ancho de análisis del detector (los kernels dependen de él). 0 = resolución original")
+    parser.add_argument('--auto', action='store_true', help="Partir de la calibración automática en lugar de config.json")
+    parser.add_argument('--poligono', default=None, help="Con --auto, zona aproximada de asfalto: 'x,y x,y x,y ...'")
+    args = parser.parse_args()
+
+    try:
+        imagen = cargar_imagen(args.imagen, args.ancho)
+    except FileNotFoundError as e:
+        print(e)
+        return
+    if args.auto:
+        valores, _ = autocalibrar(imagen, leer_poligono(args.poligono))
+        print(f"Propuesta automática: {valores}")
+        motor = MotorCalibracion(imagen, valores['LIM_INF_PISTA'], valores['LIM_SUP_PISTA'],
+                                 valores['KERNEL_EROSION'], valores['KERNEL_CIERRE'])
     else:
-        mascara_limpia = mascara # Si el kernel es 1, no aplicamos erosión (o aplicamos con un kernel 1x1 sin efecto)
-
-
-    # 6. Mostrar las imágenes
-    cv2.imshow('Imagen Original', imagen)
-    cv2.imshow('Mascara HSV (con Erosion)', mascara_limpia) # Mostramos la máscara limpia
-
-    # 7. Esperar por una tecla (1ms) y comprobar si es 'ESC'
-    k = cv2.waitKey(1) & 0xFF
-    if k == 27:  # 27 es el código ASCII para la tecla 'Esc'
-        break
-
-# Limpiar y cerrar todo
-cv2.destroyAllWindows()
\ No newline at end of file
+        motor = MotorCalibracion.desde_config(imagen, args.config)
+
+    # Los callbacks solo marcan que hay cambios: el cálculo se hace una vez por vuelta del bucle
+    cambios = {'pendiente': False}
+
+    def marcar(_):
+        cambios['pendiente'] = True
+
+    # Crear la ventana para los controles (trackbars)
+    cv2.namedWindow(VENTANA)
+    cv2.resizeWindow(VENTANA, 600, 350)
+
+    # --- Crear los 6 Trackbars HSV (partiendo de config.json) ---
+    for canal, nombre in enumerate('HSV'):
+        cv2.createTrackbar(f'{nombre} Min', VENTANA, int(motor.lim_inf[canal]), MAXIMOS_HSV[canal], marcar)
+        cv2.createTrackbar(f'{nombre} Max', VENTANA, int(motor.lim_sup[canal]), MAXIMOS_HSV[canal], marcar)
+
+    # --- Crear el trackbar para determinar el erode ---
+    cv2.createTrackbar('Kernel Erosion', VENTANA, int(motor.kernel_erosion), 15, marcar)
+
+    print("\n--- Calibrador HSV con Erosión ---")
+    print("Ajusta los deslizadores HSV para aislar el color.")
+    print("Luego ajusta 'Kernel Erosion' para limpiar el ruido.")
+    print(f"Presiona 'g' para guardar en {args.config} y 'ESC' para salir.")
+
+    cv2.imshow('Imagen Original', para_mostrar(imagen))
+    cv2.imshow('Mascara HSV (con Erosion)', para_mostrar(motor.mascara_erosionada()))
+
+    # --- Bucle Principal ---
+    while True:
+        if cambios['pendiente']:
+            cambios['pendiente'] = False
+
+            # 1. Leer los trackbars. El motor solo invalida lo que depende de lo que ha cambiado
+            hubo_cambio = False
+            for canal, nombre in enumerate('HSV'):
+                hubo_cambio |= motor.fijar_rango(canal, cv2.getTrackbarPos(f'{nombre} Min', VENTANA),
+                                                 cv2.getTrackbarPos(f'{nombre} Max', VENTANA))
+            hubo_cambio |= motor.fijar_erosion(cv2.getTrackbarPos('Kernel Erosion', VENTANA))
+
+            # 2. Mostrar la máscara solo si cambió algo
+            if hubo_cambio:
+                cv2.imshow('Mascara HSV (con Erosion)', para_mostrar(motor.mascara_erosionada()))
+
+        # 3. Esperar por una tecla: 'g' guarda, 'ESC' sale
+        k = cv2.waitKey(30) & 0xFF
+        if k == ord('g'):
+            valores = motor.valores()
+            del valores['KERNEL_CIERRE']
+            guardar_en_config(valores, args.config)
+            print(f"Guardado en {args.config}: {valores}")
+        elif k == 27:  # 27 es el código ASCII para la tecla 'Esc'
+            break
+
+    # Limpiar y cerrar todo
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+"""
+Etapa de captura en su propio hilo: decodifica y reescala (reescalar_frame) por adelantado
+en un pool de buffers preasignados y los deja en una cola acotada. Así los picos de latencia
+del decodificador (keyframes, esperas de E/S) no se trasladan al análisis.
+
+Políticas:
+    'todos'  -> no se pierde ningún frame: si la cola está llena el decodificador espera.
+    'ultimo' -> para fuentes en directo: el análisis siempre toma el frame más reciente y
+                los que se quedaron atrás se descartan (y se cuentan).
+"""
+
+
+class CapturaPrefetch:
+
+    def __init__(self, cap, reescalar, forma, capacidad=4, politica='todos', bucle=True):
+        """
+        cap: cv2.VideoCapture ya abierto y posicionado.
+        reescalar: función (frame, dst) -> frame reescalado escrito en dst.
+        forma: forma de los frames reescalados (alto, ancho, 3).
+        capacidad: frames decodificados que pueden esperar en la cola.
+        """
+        if politica not in ('todos', 'ultimo'):
+            raise ValueError(f"Política de captura desconocida: '{politica}'")
+
+        self.cap = cap
+        self.reescalar = reescalar
+        self.politica = politica
+        self.bucle = bucle
+
+        # Pool: los de la cola + el que se decodifica + el que se está analizando
+        self._buffers = np.zeros((capacidad + 2,) + tuple(forma), np.uint8)
+        self._libres = queue.Queue()
+        for i in range(len(self._buffers)):
+            self._libres.put(i)
+        self._listos = queue.Queue(maxsize=capacidad)
+
+        # Contadores (descartados lo tocan los dos hilos: siempre con el lock)
+        self._lock_contadores = threading.Lock()
+        self.decodificados = 0
+        self.analizados = 0
+        self.descartados = 0
+
+        self._fin = False
+        self._activo = True
+        self._hilo = threading.Thread(target=self._hilo_captura, daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------
+    # Lado del análisis (consumidor)
+    # ------------------------------------------------------------
+
+    def obtener(self):
+        """
+        Devuelve (frame_idx, frame, ticket) con el siguiente frame (o el más reciente, con la
+        política 'ultimo'), o None si el vídeo terminó. El buffer se devuelve con liberar(ticket).
+        """
+        if self._fin:
+            return None
+
+        item = self._esperar_item()
+        if self.politica == 'ultimo':
+            while item is not None:
+                try:
+                    siguiente = self._listos.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    # Fin del vídeo: se entrega este último frame y la próxima llamada devuelve None
+                    self._fin = True
+                    break
+                self._libres.put(item[1])
+                self._descartar()
+                item = siguiente
+
+        if item is None:
+            return None
+        frame_idx, slot = item
+        self.analizados += 1
+        return frame_idx, self._buffers[slot], slot
+
+    def _esperar_item(self):
+        """Espera al siguiente item de la cola; None si la captura se detuvo o su hilo terminó sin avisar."""
+        while True:
+            try:
+                return self._listos.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            # Detenida, o el hilo de captura murió (p.ej. una excepción del decodificador): no llegará nada más
+            if not self._activo or not self._hilo.is_alive():
+                self._fin = True
+                try:
+                    return self._listos.get_nowait()
+                except queue.Empty:
+                    return None
+
+    def _descartar(self):
+        with self._lock_contadores:
+            self.descartados += 1
+
+    def liberar(self, ticket):
+        self._libres.put(ticket)
+
+    def estadisticas(self):
+        return {
+            'decodificados': self.decodificados,
+            'analizados': self.analizados,
+            'descartados': self.descartados,
+            'en_cola': self._listos.qsize()
+        }
+
+    def detener(self):
+        """Para el hilo de captura. Un obtener() que esté esperando devuelve None (en menos de 0.1 s)."""
+        self._activo = False
+        self._hilo.join(timeout=1.0)
+
+    # ------------------------------------------------------------
+    # Hilo de captura (productor)
+    # ------------------------------------------------------------
+
+    def _obtener_buffer_libre(self):
+        while self._activo:
+            try:
+                if self.politica == 'ultimo':
+                    return self._libres.get_nowait()
+                return self._libres.get(timeout=0.1)
+            except queue.Empty:
+                if self.politica != 'ultimo':
+                    continue
+            # Sin buffers libres en modo 'ultimo': se descarta el frame más antiguo de la cola
+            try:
+                item = self._listos.get_nowait()
+            except queue.Empty:
+                continue
+            if item is None:
+                continue
+            self._descartar()
+            return item[1]
+        return None
+
+    def _hilo_captura(self):
+        frame_idx = 0
+        while self._activo:
+            slot = self._obtener_buffer_libre()
+            if slot is None:
+                break
+
+            ret, frame = self.cap.read()
+            if not ret and self.bucle:
+                # Si termina el vídeo, reiniciamos (Bucle)
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                frame_idx = 0
+                ret, frame = self.cap.read()
+            if not ret:
+                self._libres.put(slot)
+                self._encolar(None) # Fin del vídeo
+                break
+
+            frame_idx += 1
+            self.reescalar(frame, self._buffers[slot])
+            self.decodificados += 1
+            self._encolar((frame_idx, slot))
+
+    def _encolar(self, item):
+        while self._activo:
+            try:
+                if self.politica == 'ultimo':
+                    self._listos.put_nowait(item)
+                else:
+                    self._listos.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.politica != 'ultimo':
+                    continue
+            # Cola llena en modo 'ultimo': el frame más antiguo deja sitio al nuevo
+            try:
+                viejo = self._listos.get_nowait()
+            except queue.Empty:
+                continue
+            if viejo is not None:
+                self._libres.put(viejo[1])
+                self._descartar()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+
+"""
+Recarga de config.json en caliente.
+VigilanteConfig comprueba cada poco si config.json ha cambiado (fecha de modificación y tamaño,
+sin dependencias externas). Si ha cambiado lo lee, lo valida con ESQUEMA_CONFIG y entrega al
+detector solo las claves cuyo valor es distinto. Un fichero a medio guardar o con valores
+inválidos se ignora (se informa del error) y la detección sigue con la configuración anterior.
+
+Cómo aplica el detector cada clave:
+    CLAVES_EN_VIVO    -> entre dos frames, sin recalcular nada.
+    CLAVES_REFERENCIA -> la máscara de pista (y la ROI) se reconstruye en un hilo aparte y se
+                         cambia de golpe entre dos frames.
+    El resto          -> necesitan reiniciar el detector; se avisa y se ignoran.
+"""
+
+CLAVES_EN_VIVO = ('UMBRAL_SALIDA', 'UMBRAL_BG_SUB', 'UMBRAL_RUIDO_COCHE', 'FRAMES_HASTA_REPOSO',
+                  'REFRESCO_MASCARA_S', 'CAMBIO_MAXIMO_MASCARA')
+CLAVES_REFERENCIA = ('LIM_INF_PISTA', 'LIM_SUP_PISTA', 'KERNEL_EROSION', 'KERNEL_CIERRE', 'MARGEN_ROI')
+
+
+def _numero(minimo=None, maximo=None, entero=False):
+    def validar(valor):
+        if isinstance(valor, bool) or not isinstance(valor, int if entero else (int, float)):
+            return "debe ser un número entero" if entero else "debe ser un número"
+        if minimo is not None and valor < minimo:
+            return f"debe ser >= {minimo}"
+        if maximo is not None and valor > maximo:
+            return f"debe ser <= {maximo}"
+        return None
+    return validar
+
+
+def _limite_hsv(valor):
+    if (not isinstance(valor, list) or len(valor) != 3 or
+            not all(isinstance(v, int) and not isinstance(v, bool) for v in valor)):
+        return "debe ser una lista [H, S, V] de enteros"
+    if not (0 <= valor[0] <= 180 and 0 <= valor[1] <= 255 and 0 <= valor[2] <= 255):
+        return "fuera de rango (H 0-180, S y V 0-255)"
+    return None
+
+
+def _opcion(*opciones):
+    def validar(valor):
+        return None if valor in opciones else f"debe ser uno de {list(opciones)}"
+    return validar
+
+
+def _tipo(tipo, descripcion):
+    def validar(valor):
+        return None if isinstance(valor, tipo) else f"debe ser {descripcion}"
+    return validar
+
+
+# Clave -> función que devuelve None si el valor es válido o la descripción del error
+ESQUEMA_CONFIG = {
+    'UMBRAL_SALIDA': _numero(0, 100),
+    'UMBRAL_BG_SUB': _numero(0, 255, entero=True),
+    'UMBRAL_RUIDO_COCHE': _numero(0, entero=True),
+    'MARGEN_ROI': _numero(0, entero=True),
+    'FRAMES_PRE_INCIDENTE': _numero(0, entero=True),
+    'MODELO_FONDO': _opcion('estatico', 'media', 'mog2'),
+    'TASA_APRENDIZAJE_FONDO': _numero(0, 1),
+    'MUESTREO_REPOSO': _numero(0, entero=True),
+    'FRAMES_HASTA_REPOSO': _numero(1, entero=True),
+    'CANAL_DETECCION': _opcion('bgr', 'gris', 'b', 'g', 'r', 'cr', 'cb'),
+    'NIVEL_ANALISIS': _numero(0, 4, entero=True),
+    'PERFILADO': _tipo(bool, "true o false"),
+    'EXPORTAR_PERFIL': _tipo(str, "una ruta (texto)"),
+    'PERIODO_EXPORTACION_S': _numero(0.1),
+    'LIM_INF_PISTA': _limite_hsv,
+    'LIM_SUP_PISTA': _limite_hsv,
+    'KERNEL_EROSION': _numero(0, 51, entero=True),
+    'KERNEL_CIERRE': _numero(0, 51, entero=True),
+    'REFRESCO_MASCARA_S': _numero(0),
+    'CAMBIO_MAXIMO_MASCARA': _numero(0, 1)
+}
+
+def _limites_pista_ordenados(datos):
+    """LIM_INF_PISTA <= LIM_SUP_PISTA en cada canal; si no, la máscara de pista saldría vacía."""
+    inf, sup = datos.get('LIM_INF_PISTA'), datos.get('LIM_SUP_PISTA')
+    if inf is None or sup is None or _limite_hsv(inf) or _limite_hsv(sup):
+        return None # Falta alguno o ya tiene su propio error
+    canales = [canal for canal, i, s in zip('HSV', inf, sup) if i > s]
+    if canales:
+        return f"LIM_INF_PISTA > LIM_SUP_PISTA en {', '.join(canales)} (valores {inf!r} y {sup!r})"
+    return None
+
+
+# Comprobaciones entre varias claves: devuelven None o la descripción del error
+VALIDACIONES_CRUZADAS = (_limites_pista_ordenados,)
+
+# Claves sin las que el detector no puede funcionar
+CLAVES_OBLIGATORIAS = ('UMBRAL_SALIDA', 'UMBRAL_BG_SUB', 'UMBRAL_RUIDO_COCHE')
+
+
+def validar_config(datos):
+    """Lista de errores ("CLAVE: motivo"); vacía si la configuración es válida. Las claves desconocidas se aceptan."""
+    if not isinstance(datos, dict):
+        return ["config.json debe ser un objeto JSON"]
+    errores = [f"{clave}: falta" for clave in CLAVES_OBLIGATORIAS if clave not in datos]
+    for clave, valor in datos.items():
+        validar = ESQUEMA_CONFIG.get(clave)
+        error = validar(valor) if validar is not None else None
+        if error:
+            errores.append(f"{clave}: {error} (valor {valor!r})")
+    for validar in VALIDACIONES_CRUZADAS:
+        error = validar(datos)
+        if error:
+            errores.append(error)
+    return errores
+
+
+def leer_config(ruta):
+    """Lee y valida config.json. Lanza ValueError con todos los errores si no es válido."""
+    with open(ruta, 'r', encoding='utf-8') as f:
+        try:
+            datos = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{ruta} no es un JSON válido: {e}")
+    errores = validar_config(datos)
+    if errores:
+        raise ValueError(f"{ruta} tiene valores inválidos: " + "; ".join(errores))
+    return datos
+
+
+class VigilanteConfig:
+    """
+    Hilo que vigila config.json y llama a al_cambiar(cambios) con {clave: valor nuevo} cada vez
+    que se guarda una versión válida con algún valor distinto.
+    """
+
+    def __init__(self, ruta, config_actual, al_cambiar, periodo_s=1.0):
+        self.ruta = ruta
+        self.config = dict(config_actual)
+        self.al_cambiar = al_cambiar
+        self.periodo_s = periodo_s
+        self._firma = self._firma_fichero()
+        self._activo = True
+        self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+        self._hilo.start()
+
+    def _firma_fichero(self):
+        try:
+            st = os.stat(self.ruta)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _vigilar(self):
+        while self._activo:
+            time.sleep(self.periodo_s)
+            firma = self._firma_fichero()
+            if firma is None or firma == self._firma:
+                continue
+            self._firma = firma
+            self.comprobar()
+
+    def comprobar(self):
+        """Relee config.json y notifica los cambios. Devuelve los cambios aplicados ({} si ninguno)."""
+        try:
+            nueva = leer_config(self.ruta)
+        except (OSError, ValueError) as e:
+            # Un fichero inválido no para la detección: se sigue con la configuración anterior
+            print(f"Configuración no aplicada: {e}")
+            return {}
+
+        cambios = {clave: valor for clave, valor in nueva.items()
+                   if clave != '_comment' and self.config.get(clave) != valor}
+        if cambios:
+            self.config.update(cambios)
+            self.al_cambiar(cambios)
+        return cambios
+
+    def detener(self):
+        self._activo = False
@@ -1,12 +1,30 @@
 import cv2
 import numpy as np
 import time
-import json
-import sys
+import threading
+
+from CachePista import clave_cache, cargar_referencia, guardar_referencia
+from BufferCircular import BufferCircular
+from AgrupadorIncidentes import AgrupadorIncidentes
+from ModeloFondo import crear_modelo_fondo
+from CapturaPrefetch import CapturaPrefetch
+from FuenteEnDirecto import FuenteEnDirecto, es_fuente_en_directo
+from Perfilador import Perfilador
+from ConfigEnVivo import leer_config, VigilanteConfig, CLAVES_EN_VIVO, CLAVES_REFERENCIA
 
 # --- 1. MÓDULO DE CALIBRACIÓN (crear_mascara_pista) ---
 
-def crear_mascara_pista(imagen_bgr):
+# --- PARÁMETROS DE CALIBRACIÓN POR DEFECTO ---
+# Determinados mediante CalibradorHSV.py y morphCloseBar.py para el Red Bull Ring.
+# Se pueden sobrescribir desde config.json (LIM_INF_PISTA, LIM_SUP_PISTA, KERNEL_EROSION, KERNEL_CIERRE).
+LIM_INF_PISTA = [0, 0, 33]
+LIM_SUP_PISTA = [180, 52, 124]
+KERNEL_EROSION = 4
+KERNEL_CIERRE = 10
+
+
+def crear_mascara_pista(imagen_bgr, lim_inf_pista=LIM_INF_PISTA, lim_sup_pista=LIM_SUP_PISTA,
+                        kernel_erosion_size=KERNEL_EROSION, kernel_cierre_size=KERNEL_CIERRE):
     """
     Toma una imagen BGR y devuelve la máscara de pista final limpia.
     Los valores de los filtros fueron determinados mediante CalibradorHSV.py y morphCloseBar.py
@@ -14,11 +32,9 @@ def crear_mascara_pista(imagen_bgr):
     # Convertir a HSV
     hsv = cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2HSV)
 
-    # --- 1. PARÁMETROS DE CALIBRACIÓN FIJOS ---
-    lim_inf_pista = np.array([0, 0, 33])
-    lim_sup_pista = np.array([180, 52, 124])
-    kernel_erosion_size = 4  
-    kernel_cierre_size = 10 
+    # --- 1. PARÁMETROS DE CALIBRACIÓN ---
+    lim_inf_pista = np.array(lim_inf_pista)
+    lim_sup_pista = np.array(lim_sup_pista)
     
     # --- 2. Creación de la Máscara Inicial ---
     mascara_inicial = cv2.inRange(hsv, lim_inf_pista, lim_sup_pista)
@@ -47,10 +63,11 @@ def crear_mascara_pista(imagen_bgr):
 
 
 # --- FUNCIÓN DE REESCALADO ---
-def reescalar_frame(frame, ancho_fijo=600):
+def reescalar_frame(frame, ancho_fijo=600, dst=None):
     """
     Reescala el frame a un ancho fijo (ancho_fijo), manteniendo la proporción.
     Esto asegura que todos los frames tengan las mismas dimensiones de entrada.
+    Si se pasa dst (de las dimensiones finales), el resultado se escribe ahí sin reservar memoria.
     """
     altura, anchura = frame.shape[:2]
     
@@ -61,119 +78,851 @@ def reescalar_frame(frame, ancho_fijo=600):
     # Usamos interpolación INTER_AREA para reducir, e INTER_LINEAR para aumentar
     inter = cv2.INTER_AREA if escala < 1 else cv2.INTER_LINEAR
     
-    return cv2.resize(frame, dim, interpolation=inter)
+    return cv2.resize(frame, dim, dst=dst, interpolation=inter)
 
 
-# --- 2. MÓDULO DE PROCESAMIENTO DE UN SOLO FRAME (analizar_frame) ---
+# --- REGIÓN DE INTERÉS (ROI) ---
+def calcular_roi(mascara_pista, margen=40):
+    """
+    Devuelve la región de interés (x, y, ancho, alto) que contiene la pista más un margen en píxeles.
+    Fuera de ella (gradas, cielo, escapatorias lejanas) no hay nada que analizar, así que
+    analizar_frame trabaja solo dentro de este rectángulo.
+    El margen debe cubrir el coche más grande que pueda salirse de la pista: lo que quede
+    fuera de la ROI no se ve.
+    """
+    altura, anchura = mascara_pista.shape[:2]
+    if cv2.countNonZero(mascara_pista) == 0:
+        return (0, 0, anchura, altura)
 
-def analizar_frame(frame_actual, fondo_vacio, mascara_pista, UMBRAL_BG_SUB, UMBRAL_RUIDO_COCHE, UMBRAL_SALIDA, mascara_pista_bgr):
-    """Procesa un solo frame y devuelve los resultados de visualización y detección."""
-    
-    frame_display = frame_actual.copy()
-    
-    # --- Detectar el Coche (LÓGICA SIMPLE) ---
-    diff = cv2.absdiff(fondo_vacio, frame_actual)
-    gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-    
-    _, mascara_coche = cv2.threshold(gray_diff, UMBRAL_BG_SUB, 255, cv2.THRESH_BINARY)
-    
-    kernel_coche = np.ones((5, 5), np.uint8)
-    mascara_coche = cv2.morphologyEx(mascara_coche, cv2.MORPH_CLOSE, kernel_coche, iterations=2)
-    
-    # --- Lógica de Decisión ---
-    total_pixeles_coche = cv2.countNonZero(mascara_coche)
-    visualizacion_combinada = mascara_pista_bgr.copy()
-    
-    porcentaje_en_pista = 0.0
-    infraccion_detectada = False
-    
-    if total_pixeles_coche < UMBRAL_RUIDO_COCHE:
-        # No hay coche o es ruido. Devolvemos None.
-        return None
-        
-    # Si detectamos coche:
-    
-    # Lo dibujamos en verde sobre la máscara.
-    visualizacion_combinada[mascara_coche > 0] = [0, 255, 0] # Color VERDE BGR
-    
-    # Comparamos la máscara del coche con la máscara de la pista
-    coche_en_pista = cv2.bitwise_and(mascara_pista, mascara_coche)
-    total_pixeles_coche_en_pista = cv2.countNonZero(coche_en_pista)
-    porcentaje_en_pista = (total_pixeles_coche_en_pista / total_pixeles_coche) * 100
+    x, y, w, h = cv2.boundingRect(mascara_pista)
+    x0, y0 = max(x - margen, 0), max(y - margen, 0)
+    x1, y1 = min(x + w + margen, anchura), min(y + h + margen, altura)
+    return (x0, y0, x1 - x0, y1 - y0)
 
-    # --- Lógica de Alerta ---
-    
-    if porcentaje_en_pista < UMBRAL_SALIDA:
-        infraccion_detectada = True
-        visualizacion_combinada[mascara_coche > 0] = [0, 0, 255] # Dibujar coche en ROJO
 
-    # Dibujar texto en el frame real
-    estado = "¡¡¡SALIDA DE PISTA!!!" if infraccion_detectada else "En Pista"
-    color_texto = (0, 0, 255) if infraccion_detectada else (0, 255, 0)
-    
-    # cv2.putText(frame_display, estado, (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
-    #             1, (255,255,255), 3, cv2.LINE_AA)
-    # cv2.putText(frame_display, estado, (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
-    #             1, color_texto, 2, cv2.LINE_AA)
-
-    # cv2.putText(frame_display, f"En Pista: {porcentaje_en_pista:.1f}%", (50, 100),
-    #             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
-                    
-    return {
-        'frame_real': frame_display,
-        'frame_mascara': visualizacion_combinada,
-        'infraccion_detectada': infraccion_detectada,
-        'porcentaje_en_pista': porcentaje_en_pista
+def zona_roi(roi):
+    """Slices (filas, columnas) de la ROI, para tomar vistas sin copia de cualquier imagen."""
+    if roi is None:
+        return (slice(None), slice(None))
+    x0, y0, w, h = roi
+    return (slice(y0, y0 + h), slice(x0, x0 + w))
+
+
+# --- FORMATO DE TIEMPO DE VÍDEO ---
+def formatear_tiempo(segundos):
+    """Devuelve el tiempo de vídeo en formato MM:SS.Ds (el mismo que muestra la GUI)."""
+    minutes = int(segundos // 60)
+    seconds = segundos % 60
+    return f"{minutes:02d}:{seconds:04.1f}s"
+
+
+# --- CANAL DE DETECCIÓN ---
+# 'bgr' resta los frames completos en color y convierte la diferencia a gris (ruta original).
+# El resto trabajan con un solo canal: el frame se convierte o se extrae una vez y la resta,
+# el umbral y la morfología mueven un tercio de los datos.
+CANALES_DETECCION = {
+    'bgr': None,
+    'gris': (cv2.COLOR_BGR2GRAY, None),   # Luma
+    'b': (None, 0),
+    'g': (None, 1),
+    'r': (None, 2),
+    'cr': (cv2.COLOR_BGR2YCrCb, 1),       # Crominancia rojo
+    'cb': (cv2.COLOR_BGR2YCrCb, 2)        # Crominancia azul
+}
+
+
+def extraer_canal(imagen_bgr, canal, dst=None):
+    """Devuelve el canal de detección (imagen de un canal) de una imagen BGR."""
+    if canal not in CANALES_DETECCION or canal == 'bgr':
+        raise ValueError(f"Canal de detección desconocido: '{canal}' (opciones: {', '.join(CANALES_DETECCION)})")
+    conversion, indice = CANALES_DETECCION[canal]
+    if conversion is None:
+        return cv2.extractChannel(imagen_bgr, indice, dst=dst)
+    if indice is None:
+        return cv2.cvtColor(imagen_bgr, conversion, dst=dst)
+    return cv2.extractChannel(cv2.cvtColor(imagen_bgr, conversion), indice, dst=dst)
+
+
+def imagen_deteccion(frame_actual, canal, zona=(slice(None), slice(None)), dst=None):
+    """
+    Imagen sobre la que se hace la sustracción de fondo: el propio frame con 'bgr' o, si no,
+    su canal de detección. Solo se rellena la zona indicada (la ROI); dst debe tener el tamaño
+    del frame completo y un canal, y se reutiliza entre frames.
+    """
+    if canal == 'bgr':
+        return frame_actual
+    if dst is None:
+        dst = np.zeros(frame_actual.shape[:2], np.uint8)
+    extraer_canal(frame_actual[zona], canal, dst=dst[zona])
+    return dst
+
+
+# --- PIRÁMIDE DE ANÁLISIS ---
+def crear_piramide(fondo, mascara_pista, roi, nivel):
+    """
+    Precalcula el nivel grueso (1/2**nivel) de la ROI del fondo y de la máscara de pista.
+    El movimiento se busca a esa escala y solo las cajas de los blobs encontrados se analizan
+    a resolución completa. Cada celda gruesa de la máscara vale 255 si contiene algún píxel de pista.
+    Las últimas filas/columnas de la ROI que no llenan una celda (menos de 2**nivel píxeles,
+    dentro del margen de la ROI) no se miran a escala gruesa.
+    """
+    factor = 2 ** nivel
+    pista = mascara_pista[zona_roi(roi)]
+    alto, ancho = pista.shape
+    forma = (ancho // factor, alto // factor) # (ancho, alto), como lo espera cv2.resize
+    recorte = (slice(0, forma[1] * factor), slice(0, forma[0] * factor))
+
+    mascara = cv2.resize(pista[recorte], forma, interpolation=cv2.INTER_AREA)
+    cv2.threshold(mascara, 0, 255, cv2.THRESH_BINARY, dst=mascara)
+
+    piramide = {
+        'nivel': nivel,
+        'factor': factor,
+        'forma': forma,
+        'recorte': recorte,
+        'mascara_pista': mascara,
+        'fondo': None
     }
+    actualizar_piramide(piramide, fondo, roi)
+    return piramide
+
+
+def actualizar_piramide(piramide, fondo, roi):
+    """Recalcula el fondo grueso (para los modelos de fondo que cambian en cada frame)."""
+    fondo_roi = fondo[zona_roi(roi)][piramide['recorte']]
+    piramide['fondo'] = cv2.resize(fondo_roi, piramide['forma'], dst=piramide['fondo'], interpolation=cv2.INTER_AREA)
+
+
+def _mascara_diferencia(fondo, imagen, UMBRAL_BG_SUB):
+    """Resta de fondo umbralizada. Con imágenes BGR la diferencia se pasa a gris antes del umbral."""
+    diff = cv2.absdiff(fondo, imagen)
+    # En la ruta de un canal la diferencia ya es la imagen a umbralizar
+    gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY) if diff.ndim == 3 else diff
+    _, mascara = cv2.threshold(gray_diff, UMBRAL_BG_SUB, 255, cv2.THRESH_BINARY)
+    return mascara
+
+
+# --- 2. MÓDULO DE PROCESAMIENTO DE UN SOLO FRAME (analizar_frame) ---
+
+class ResultadosFrame(dict):
+    """
+    Resultados de analizar un frame. 'frame_mascara' (la visualización) no se construye hasta
+    que alguien la lee: en modo headless nunca se pinta.
+    """
+
+    def __init__(self, construir_mascara=None, **datos):
+        super().__init__(**datos)
+        self._construir_mascara = construir_mascara
+
+    def __missing__(self, clave):
+        if clave == 'frame_mascara' and self._construir_mascara is not None:
+            self['frame_mascara'] = self._construir_mascara()
+            self._construir_mascara = None
+            return self['frame_mascara']
+        raise KeyError(clave)
+
+    def materializar(self):
+        """Construye ya la visualización (antes de que el analizador reutilice sus buffers)."""
+        if self._construir_mascara is not None:
+            self['frame_mascara']
+        return self
+
+
+class AnalizadorFrames:
+    """
+    Analizador de frames con estado. Reserva una sola vez (con el tamaño de la ROI) los
+    buffers intermedios y los kernels y los reutiliza en cada frame pasando dst= a OpenCV,
+    así el análisis no reserva memoria por frame.
+    La visualización de un frame solo es válida hasta la siguiente llamada a analizar():
+    quien la quiera (la GUI) debe pedirla antes (ResultadosFrame.materializar).
+    'frame_real' es el propio frame de entrada, sin copiar.
+    """
+
+    def __init__(self, fondo_vacio, mascara_pista, mascara_pista_bgr, UMBRAL_BG_SUB, UMBRAL_RUIDO_COCHE, UMBRAL_SALIDA,
+                 roi=None, piramide=None, mascara_libre=False):
+        """
+        fondo_vacio: fondo contra el que se resta (BGR o de un canal). Si es un modelo adaptativo
+                     que se actualiza en sitio, el analizador ve siempre su estado actual.
+        piramide: nivel grueso precalculado (ver crear_piramide) o None.
+        mascara_libre: True para devolver también 'mascara_libre' (píxeles sin movimiento), de la
+                       que aprende el fondo "media".
+        """
+        self.fondo_vacio = fondo_vacio
+        self.mascara_pista = mascara_pista
+        self.mascara_pista_bgr = mascara_pista_bgr
+        self.UMBRAL_BG_SUB = UMBRAL_BG_SUB
+        self.UMBRAL_RUIDO_COCHE = UMBRAL_RUIDO_COCHE
+        self.UMBRAL_SALIDA = UMBRAL_SALIDA
+        self.roi = roi
+        self.piramide = piramide
+
+        self.zona = zona_roi(roi)
+        self.x0, self.y0 = (0, 0) if roi is None else roi[:2]
+        self.perfilador = None # Perfilador.py: tiempos por etapa (None = sin instrumentar)
+        self.movimiento = 0 # Píxeles en movimiento del último frame analizado (haya coche o no)
+        pista = mascara_pista[self.zona]
+        forma = pista.shape
+
+        # Kernels (se crean una vez)
+        self._kernel_coche = np.ones((5, 5), np.uint8)
+        self._kernel_grueso = np.ones((3, 3), np.uint8)
+
+        # Buffers del tamaño de la ROI
+        self._diff = np.empty(forma + fondo_vacio.shape[2:], np.uint8)
+        self._gris = np.empty(forma, np.uint8)
+        self._mascara = np.empty(forma, np.uint8)
+        self._mascara_coche = np.empty(forma, np.uint8)
+        self._etiquetas = np.empty(forma, np.int32)
+        self._libre = np.empty(forma, np.uint8) if mascara_libre else None
+
+        # Posiciones (aplanadas) de los píxeles de pista dentro de la ROI, para contar
+        # los píxeles en pista de cada blob con un solo gather + histograma
+        self._indices_pista = np.flatnonzero(pista)
+        self._etiquetas_pista = np.empty(len(self._indices_pista), np.int32)
+
+        if piramide is not None:
+            ancho_g, alto_g = piramide['forma']
+            self._imagen_gruesa = np.empty((alto_g, ancho_g) + fondo_vacio.shape[2:], np.uint8)
+            self._diff_grueso = np.empty_like(self._imagen_gruesa)
+            self._gris_grueso = np.empty((alto_g, ancho_g), np.uint8)
+            self._mascara_gruesa = np.empty((alto_g, ancho_g), np.uint8)
+            self._cerrada_gruesa = np.empty((alto_g, ancho_g), np.uint8)
+            self._etiquetas_gruesas = np.empty((alto_g, ancho_g), np.int32)
+
+    def _umbralizar(self, fondo, imagen, diff, gris, dst, libre=None):
+        """
+        Resta de fondo umbralizada en los buffers dados. Con BGR la diferencia se pasa a gris.
+        Si se pasa `libre`, recibe la máscara inversa (píxeles por debajo del umbral).
+        """
+        cv2.absdiff(fondo, imagen, dst=diff)
+        if diff.ndim == 3:
+            cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY, dst=gris)
+        else:
+            # En la ruta de un canal la diferencia ya es la imagen a umbralizar
+            gris = diff
+        cv2.threshold(gris, self.UMBRAL_BG_SUB, 255, cv2.THRESH_BINARY, dst=dst)
+        if libre is not None:
+            cv2.threshold(gris, self.UMBRAL_BG_SUB, 255, cv2.THRESH_BINARY_INV, dst=libre)
+        return dst
+
+    def analizar(self, frame_actual, mascara_movimiento=None, frame_deteccion=None):
+        """
+        Procesa un frame y devuelve un ResultadosFrame, o None si no hay coche.
+        Si se pasa mascara_movimiento (del tamaño de la ROI, p.ej. de un modelo MOG2), se usa
+        en lugar de la resta contra el fondo. Si se pasa frame_deteccion (ver imagen_deteccion),
+        la resta se hace sobre esa imagen de un canal en lugar de sobre el frame BGR.
+        """
+        imagen = frame_actual if frame_deteccion is None else frame_deteccion
+        if self.piramide is not None:
+            return self._analizar_piramide(frame_actual, imagen[self.zona])
+
+        zona = self.zona
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
+
+        # --- Detectar el Coche (LÓGICA SIMPLE) ---
+        if mascara_movimiento is None:
+            mascara_movimiento = self._umbralizar(self.fondo_vacio[zona], imagen[zona], self._diff, self._gris, self._mascara,
+                                                  self._libre)
+            if perf is not None: t = perf.registrar('resta', t)
+
+        mascara_coche = cv2.morphologyEx(mascara_movimiento, cv2.MORPH_CLOSE, self._kernel_coche,
+                                         dst=self._mascara_coche, iterations=2)
+        if perf is not None: t = perf.registrar('cierre', t)
+
+        # --- Lógica de Decisión ---
+        total_pixeles_coche = cv2.countNonZero(mascara_coche)
+        self.movimiento = total_pixeles_coche
+        if perf is not None: t = perf.registrar('conteo', t)
+
+        if total_pixeles_coche < self.UMBRAL_RUIDO_COCHE:
+            # No hay coche o es ruido. Devolvemos None.
+            return None
+
+        # --- Separar los coches (un blob por coche) ---
+        # Con un único porcentaje para todo el movimiento, un coche fuera de pista junto a otro
+        # dentro se "promediaban" y la infracción se perdía. Ahora cada blob tiene su veredicto.
+        num_blobs, etiquetas, stats, _ = cv2.connectedComponentsWithStats(mascara_coche, labels=self._etiquetas,
+                                                                          connectivity=8, ltype=cv2.CV_32S)
+        areas = stats[:, cv2.CC_STAT_AREA]
+
+        # Píxeles en pista de TODOS los blobs con un solo histograma sobre la imagen de etiquetas
+        np.take(etiquetas.reshape(-1), self._indices_pista, out=self._etiquetas_pista)
+        pixeles_en_pista = np.bincount(self._etiquetas_pista, minlength=num_blobs)
+        porcentajes = pixeles_en_pista * 100.0 / np.maximum(areas, 1)
+
+        validos = areas >= self.UMBRAL_RUIDO_COCHE
+        validos[0] = False # La etiqueta 0 es el fondo
+        if not validos.any():
+            # Solo había blobs pequeños (ruido)
+            return None
+
+        infracciones = validos & (porcentajes < self.UMBRAL_SALIDA)
+        infraccion_detectada = bool(infracciones.any())
+        if perf is not None: perf.registrar('blobs', t)
+
+        coches = [{
+            'bbox': (int(stats[i, 0]) + self.x0, int(stats[i, 1]) + self.y0, int(stats[i, 2]), int(stats[i, 3])), # (x, y, ancho, alto)
+            'area': int(areas[i]),
+            'porcentaje_en_pista': float(porcentajes[i]),
+            'infraccion': bool(infracciones[i])
+        } for i in np.flatnonzero(validos)]
+
+        # El coche "peor situado" resume el frame (el de menor porcentaje en pista)
+        peor = min(coches, key=lambda c: c['porcentaje_en_pista'])
+
+        def construir_mascara():
+            if perf is not None: t = time.perf_counter()
+
+            # Dibujamos cada coche sobre la máscara: VERDE en pista, ROJO si está fuera (BGR)
+            colores = np.zeros((num_blobs, 3), np.uint8)
+            colores[validos] = [0, 255, 0]
+            colores[infracciones] = [0, 0, 255]
+
+            # La visualización sí es del frame completo: solo se pinta dentro de la ROI
+            visualizacion_combinada = self.mascara_pista_bgr.copy()
+            pixeles_coche = validos[etiquetas]
+            visualizacion_combinada[zona][pixeles_coche] = colores[etiquetas[pixeles_coche]]
+
+            if perf is not None: perf.registrar('visualizacion', t)
+            return visualizacion_combinada
+
+        return ResultadosFrame(
+            construir_mascara,
+            frame_real=frame_actual,
+            infraccion_detectada=infraccion_detectada,
+            porcentaje_en_pista=peor['porcentaje_en_pista'],
+            area_coche=peor['area'],
+            coches=coches,
+            mascara_coche=mascara_coche, # Tamaño de la ROI
+            mascara_libre=self._libre
+        )
+
+    def _analizar_piramide(self, frame_actual, imagen):
+        """
+        Igual que analizar(), pero buscando el movimiento en el nivel grueso de la pirámide.
+        El área y el porcentaje en pista de cada coche se calculan a resolución completa, solo
+        dentro de la caja de su blob grueso.
+        """
+        piramide = self.piramide
+        f = piramide['factor']
+        fondo = self.fondo_vacio[self.zona]
+        pista = self.mascara_pista[self.zona]
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
+
+        # --- Movimiento en el nivel grueso ---
+        cv2.resize(imagen[piramide['recorte']], piramide['forma'], dst=self._imagen_gruesa, interpolation=cv2.INTER_AREA)
+        self._umbralizar(piramide['fondo'], self._imagen_gruesa, self._diff_grueso, self._gris_grueso, self._mascara_gruesa)
+        if perf is not None: t = perf.registrar('resta', t)
+        mascara_gruesa = cv2.morphologyEx(self._mascara_gruesa, cv2.MORPH_CLOSE, self._kernel_grueso,
+                                          dst=self._cerrada_gruesa, iterations=2)
+        if perf is not None: t = perf.registrar('cierre', t)
+
+        # Los umbrales de área se escalan al nivel grueso (cada celda son f*f píxeles)
+        umbral_ruido_grueso = self.UMBRAL_RUIDO_COCHE / (f * f)
+        total_celdas = cv2.countNonZero(mascara_gruesa)
+        self.movimiento = total_celdas * f * f
+        if perf is not None: t = perf.registrar('conteo', t)
+        if total_celdas < umbral_ruido_grueso:
+            return None
+
+        num_blobs, etiquetas, stats, _ = cv2.connectedComponentsWithStats(mascara_gruesa, labels=self._etiquetas_gruesas,
+                                                                          connectivity=8, ltype=cv2.CV_32S)
+        if perf is not None: t = perf.registrar('blobs', t)
+        alto_g, ancho_g = mascara_gruesa.shape
+
+        # Margen de la caja (en celdas): el cierre 5x5 x2 alcanza 4 píxeles y no debe tocar el borde de la caja
+        m = 1 + -(-4 // f)
+
+        # --- Refinado a resolución completa, solo en la caja de cada blob ---
+        mascara_coche = self._mascara_coche
+        mascara_coche.fill(0)
+
+        coches = []
+        pintados = [] # (caja, máscara fina, color) de cada coche, para la visualización
+        for i in range(1, num_blobs):
+            if stats[i, cv2.CC_STAT_AREA] < umbral_ruido_grueso:
+                continue
+
+            # Caja del blob con margen, en coordenadas gruesas y finas
+            x, y, w, h = (int(v) for v in stats[i, :4])
+            cx0, cy0 = max(x - m, 0), max(y - m, 0)
+            cx1, cy1 = min(x + w + m, ancho_g), min(y + h + m, alto_g)
+            caja = (slice(cy0 * f, cy1 * f), slice(cx0 * f, cx1 * f))
+
+            # Celdas del blob (más una celda alrededor) llevadas a resolución completa:
+            # separan este coche de otro que caiga dentro de la misma caja
+            celdas = np.where(etiquetas[cy0:cy1, cx0:cx1] == i, np.uint8(255), np.uint8(0))
+            celdas = cv2.dilate(celdas, self._kernel_grueso)
+            blob = cv2.resize(celdas, ((cx1 - cx0) * f, (cy1 - cy0) * f), interpolation=cv2.INTER_NEAREST)
+
+            mascara_fina = _mascara_diferencia(fondo[caja], imagen[caja], self.UMBRAL_BG_SUB)
+            mascara_fina = cv2.morphologyEx(mascara_fina, cv2.MORPH_CLOSE, self._kernel_coche, iterations=2)
+            cv2.bitwise_and(mascara_fina, blob, dst=mascara_fina)
+
+            area = cv2.countNonZero(mascara_fina)
+            if area < self.UMBRAL_RUIDO_COCHE:
+                continue
+
+            # Si ninguna celda gruesa del blob toca la pista, no hace falta contar a resolución completa
+            if cv2.countNonZero(cv2.bitwise_and(celdas, piramide['mascara_pista'][cy0:cy1, cx0:cx1])) == 0:
+                en_pista = 0
+            else:
+                en_pista = cv2.countNonZero(cv2.bitwise_and(mascara_fina, pista[caja]))
+
+            porcentaje = en_pista * 100.0 / area
+            infraccion = porcentaje < self.UMBRAL_SALIDA
+
+            bx, by, bw, bh = cv2.boundingRect(mascara_fina)
+            coches.append({
+                'bbox': (bx + cx0 * f + self.x0, by + cy0 * f + self.y0, bw, bh), # (x, y, ancho, alto)
+                'area': int(area),
+                'porcentaje_en_pista': float(porcentaje),
+                'infraccion': bool(infraccion)
+            })
+
+            cv2.bitwise_or(mascara_coche[caja], mascara_fina, dst=mascara_coche[caja])
+            # VERDE en pista, ROJO si está fuera (BGR)
+            pintados.append((caja, mascara_fina, (0, 0, 255) if infraccion else (0, 255, 0)))
+
+        if perf is not None: perf.registrar('refinado', t)
+        if not coches:
+            return None
+
+        peor = min(coches, key=lambda c: c['porcentaje_en_pista'])
+
+        # Aquí no hay umbral a resolución completa: los píxeles libres son los que no son coche
+        if self._libre is not None:
+            cv2.bitwise_not(mascara_coche, dst=self._libre)
+
+        def construir_mascara():
+            if perf is not None: t = time.perf_counter()
+            visualizacion_combinada = self.mascara_pista_bgr.copy()
+            visualizacion_roi = visualizacion_combinada[self.zona]
+            for caja, mascara_fina, color in pintados:
+                visualizacion_roi[caja][mascara_fina > 0] = color
+            if perf is not None: perf.registrar('visualizacion', t)
+            return visualizacion_combinada
+
+        return ResultadosFrame(
+            construir_mascara,
+            frame_real=frame_actual,
+            infraccion_detectada=any(c['infraccion'] for c in coches),
+            porcentaje_en_pista=peor['porcentaje_en_pista'],
+            area_coche=peor['area'],
+            coches=coches,
+            mascara_coche=mascara_coche, # Tamaño de la ROI
+            mascara_libre=self._libre
+        )
+
+
+def analizar_frame(frame_actual, fondo_vacio, mascara_pista, UMBRAL_BG_SUB, UMBRAL_RUIDO_COCHE, UMBRAL_SALIDA, mascara_pista_bgr, roi=None,
+                   mascara_movimiento=None, frame_deteccion=None, piramide=None):
+    """
+    Procesa un solo frame y devuelve los resultados de visualización y detección.
+    Versión sin estado de AnalizadorFrames (reserva sus buffers en cada llamada): para
+    analizar muchos frames con la misma referencia conviene crear un AnalizadorFrames.
+    Si se indica roi=(x, y, ancho, alto) (ver calcular_roi), todo el trabajo por frame se hace
+    solo dentro de ese rectángulo; las coordenadas devueltas siguen siendo del frame completo.
+    """
+    analizador = AnalizadorFrames(fondo_vacio, mascara_pista, mascara_pista_bgr, UMBRAL_BG_SUB, UMBRAL_RUIDO_COCHE, UMBRAL_SALIDA,
+                                  roi, piramide)
+    return analizador.analizar(frame_actual, mascara_movimiento, frame_deteccion)
 
 # --- 3. CLASE GESTORA DEL DETECTOR (Para la Interfaz) ---
 
+# Espera máxima al primer frame de una fuente en directo (cámara arrancando, stream conectando)
+TIMEOUT_REFERENCIA_S = 10.0
+
+
 class DetectorDeVideo:
     
     # AJUSTE: Se reintroduce ancho_ventana
-    def __init__(self, video_path, ancho_ventana=600, ruta_config='config.json'):
-        # 1. Cargar datos del archivo
+    # bucle=False recorre el vídeo una sola vez (modo headless): al llegar al final
+    # get_next_frame_data devuelve None en lugar de volver al frame 0.
+    # ruta_cache: directorio de la caché de referencia/máscara (CachePista.py). None la desactiva.
+    # incidentes=True agrupa las infracciones en incidentes (con sus frames) y los publica en
+    # self.cola_incidentes. El modo headless no lo necesita.
+    # prefetch=True decodifica y reescala en un hilo aparte (CapturaPrefetch.py); politica_captura='ultimo'
+    # hace que el análisis tome siempre el frame más reciente (fuentes en directo).
+    # recarga_config=True vigila config.json y aplica sus cambios sin reiniciar (ConfigEnVivo.py).
+    # en_directo=True lee una cámara o un stream con FuenteEnDirecto.py: se analiza siempre el último
+    # frame capturado y el tiempo sale de la hora de captura. None lo decide según video_path; con un
+    # fichero, True lo reproduce como si fuera una cámara (para probar en local).
+    def __init__(self, video_path, ancho_ventana=600, ruta_config='config.json', bucle=True, ruta_cache='.cache_pista',
+                 incidentes=True, prefetch=False, politica_captura='todos', recarga_config=False, en_directo=None):
+        # 1. Cargar datos del archivo (validados contra el esquema de ConfigEnVivo.py)
         try:
-            with open(ruta_config, 'r') as f:
-                config_data = json.load(f)
+            config_data = leer_config(ruta_config)
         except FileNotFoundError:
-            print(f"Error: Archivo de configuración '{ruta_config}' no encontrado.")
-            sys.exit(1)
+            raise FileNotFoundError(f"Error: Archivo de configuración '{ruta_config}' no encontrado.")
 
         # --- CONFIGURACIÓN ---
         self.ANCHO_VENTANA = ancho_ventana
         self.UMBRAL_SALIDA = config_data.get("UMBRAL_SALIDA")
         self.UMBRAL_BG_SUB = config_data.get("UMBRAL_BG_SUB")
         self.UMBRAL_RUIDO_COCHE = config_data.get("UMBRAL_RUIDO_COCHE")
+        self.MARGEN_ROI = config_data.get("MARGEN_ROI", 40)
+        self.FRAMES_PRE_INCIDENTE = config_data.get("FRAMES_PRE_INCIDENTE", 50)
+        self.MODELO_FONDO = config_data.get("MODELO_FONDO", "estatico")
+        self.TASA_APRENDIZAJE_FONDO = config_data.get("TASA_APRENDIZAJE_FONDO", 0.01)
+        self.MUESTREO_REPOSO = config_data.get("MUESTREO_REPOSO", 0)
+        self.FRAMES_HASTA_REPOSO = config_data.get("FRAMES_HASTA_REPOSO", 25)
+        self.CANAL_DETECCION = config_data.get("CANAL_DETECCION", "bgr")
+        self.NIVEL_ANALISIS = config_data.get("NIVEL_ANALISIS", 0)
+        self.PERFILADO = config_data.get("PERFILADO", False)
+        self.EXPORTAR_PERFIL = config_data.get("EXPORTAR_PERFIL", "")
+        self.PERIODO_EXPORTACION_S = config_data.get("PERIODO_EXPORTACION_S", 10)
+        self.REFRESCO_MASCARA_S = config_data.get("REFRESCO_MASCARA_S", 0)
+        self.CAMBIO_MAXIMO_MASCARA = config_data.get("CAMBIO_MAXIMO_MASCARA", 0.15)
+        self.PARAMS_PISTA = {
+            'lim_inf_pista': config_data.get("LIM_INF_PISTA", LIM_INF_PISTA),
+            'lim_sup_pista': config_data.get("LIM_SUP_PISTA", LIM_SUP_PISTA),
+            'kernel_erosion_size': config_data.get("KERNEL_EROSION", KERNEL_EROSION),
+            'kernel_cierre_size': config_data.get("KERNEL_CIERRE", KERNEL_CIERRE)
+        }
+
+        # Combinaciones no válidas: se comprueban antes de abrir la fuente (y de arrancar su hilo)
+        if self.NIVEL_ANALISIS > 0 and self.MODELO_FONDO == 'mog2':
+            raise ValueError("NIVEL_ANALISIS > 0 no es compatible con MODELO_FONDO 'mog2' (su máscara es a resolución completa)")
         
         # --- Inicialización de Video ---
         self.video_path = video_path
-        self.cap = cv2.VideoCapture(video_path)
-        if not self.cap.isOpened():
-            raise FileNotFoundError(f"Error: No se pudo abrir el vídeo en {video_path}")
+        self.bucle = bucle
+        self.en_directo = es_fuente_en_directo(video_path) if en_directo is None else en_directo
+        self.fuente = None
+        if self.en_directo:
+            # El hilo de la fuente lee sin parar y se reconecta solo; aquí no hay cursor que mover
+            self.fuente = FuenteEnDirecto(video_path)
+            self.cap = None
+            self.fps = self.fuente.fps
+            ruta_cache = None # La referencia de una cámara es la escena de ahora, no la de la última vez
+        else:
+            self.cap = cv2.VideoCapture(video_path)
+            if not self.cap.isOpened():
+                raise FileNotFoundError(f"Error: No se pudo abrir el vídeo en {video_path}")
 
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-        if self.fps == 0: self.fps = 30
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+            if self.fps == 0: self.fps = 30
+        self._inicio_captura = None # En directo: instante de captura del frame de referencia (tiempo 0)
         self.delay_ms = int(1000 / self.fps) # Tiempo de espera para el after()
 
         # --- Variables de Estado ---
-        ret, fondo_vacio = self.cap.read()
-        if not ret: raise Exception("No se pudo leer el primer frame del vídeo.")
+        # Si la referencia ya está en caché no hace falta leer el primer frame ni recalcular la máscara
+        clave = clave_cache(video_path, self.ANCHO_VENTANA, self.PARAMS_PISTA)
+        referencia = cargar_referencia(ruta_cache, clave) if ruta_cache else None
+
+        if referencia is None:
+            referencia = self._calcular_referencia()
+            if ruta_cache: guardar_referencia(ruta_cache, clave, referencia)
+
+        self.fondo_vacio = referencia['fondo_vacio']
+        self.ruta_cache = ruta_cache
+
+        # Fondo en el canal de detección (el mismo fondo_vacio con 'bgr') y buffer del canal de cada frame
+        self._imagen_canal = None
+        self.fondo_deteccion = self.fondo_vacio
+        if self.CANAL_DETECCION != 'bgr':
+            self.fondo_deteccion = extraer_canal(self.fondo_vacio, self.CANAL_DETECCION)
+            self._imagen_canal = np.zeros(self.fondo_deteccion.shape, np.uint8)
+
+        # Modelo de fondo (estático o adaptativo), parte del frame de referencia
+        self.modelo_fondo = crear_modelo_fondo(self.MODELO_FONDO, self.fondo_deteccion, self.TASA_APRENDIZAJE_FONDO)
+
+        # Tiempos por etapa (opcional). Desactivado, cada etapa solo comprueba un None
+        self.perfilador = None
+        if self.PERFILADO:
+            self.perfilador = Perfilador()
+            if self.EXPORTAR_PERFIL:
+                self.perfilador.iniciar_exportacion(self.EXPORTAR_PERFIL, self.PERIODO_EXPORTACION_S)
+
+        # Máscara de pista y todo lo que depende de ella: ROI, pirámide y analizador
+        self._usar_mascara(self._preparar_mascara(referencia['mascara_pista'], referencia['mascara_pista_bgr'], self.MARGEN_ROI))
+
+        # Últimos frames analizados, para poder revisar la aproximación a cada incidente
+        # (solo si se agrupan incidentes: nadie más los consulta)
+        self.buffer_previo = None
+        if incidentes and self.FRAMES_PRE_INCIDENTE > 0:
+            self.buffer_previo = BufferCircular(self.FRAMES_PRE_INCIDENTE, self.fondo_vacio.shape)
+
+        # Agrupación de infracciones en incidentes: ve todos los frames, no solo los que pinta la GUI
+        self.agrupador = None
+        self.cola_incidentes = None
+        if incidentes:
+            self.agrupador = AgrupadorIncidentes(ventana_s=1.0, frames_previos=self.frames_previos)
+            self.cola_incidentes = self.agrupador.cola
+
+        # Etapa de captura en su propio hilo (opcional)
+        # En directo la fuente ya tiene su hilo y entrega el último frame: no hace falta prefetch
+        self.captura = None
+        if prefetch and not self.en_directo:
+            self.captura = CapturaPrefetch(self.cap, lambda frame, dst: reescalar_frame(frame, self.ANCHO_VENTANA, dst=dst),
+                                           self.fondo_vacio.shape, politica=politica_captura, bucle=bucle)
+
+        # Modo reposo: necesita leer directamente del vídeo (saltar y volver atrás), no con prefetch
+        self._reposo_disponible = self.MUESTREO_REPOSO > 1 and self.captura is None and not self.en_directo
+        self._en_reposo = False
+        self._frames_sin_movimiento = 0
+        
+        self.frame_count = 0
+        self.secuencia = 0 # Número de resultado, no se reinicia al volver al principio del vídeo
+
+        # Recarga de config.json en caliente. Los cambios llegan desde otros hilos y se aplican
+        # en el hilo del vídeo, entre dos frames (_aplicar_cambios)
+        self._lock_cambios = threading.Lock()
+        self._cambios_pendientes = {}
+        self._mascara_nueva = None # Máscara reconstruida en segundo plano, lista para el cambio
+        self._generacion_mascara = 0
+        # Últimos parámetros pedidos en config.json (aplicados o aún reconstruyéndose) y nº de
+        # reconstrucciones de config.json en curso: el refresco periódico parte de ellos y no las pisa
+        self._params_objetivo = dict(self.PARAMS_PISTA)
+        self._margen_objetivo = self.MARGEN_ROI
+        self._reconstrucciones_config = 0
+
+        # Refresco periódico de la máscara: el frame sin coches con menos movimiento de cada
+        # periodo se copia en un buffer; al lanzar la reconstrucción los dos buffers se
+        # intercambian, así el hilo de fondo nunca lee un buffer que el vídeo está escribiendo
+        self._buffers_refresco = [np.empty_like(self.fondo_vacio), np.empty_like(self.fondo_vacio)]
+        self._movimiento_candidato = None # None = aún no hay frame candidato en este periodo
+        self._frame_ultimo_refresco = 0
+        self._refresco_en_curso = False
+
+        self.vigilante = None
+        if recarga_config:
+            self.vigilante = VigilanteConfig(ruta_config, config_data, self._al_cambiar_config)
+
+    def _calcular_referencia(self):
+        """Lee el primer frame como pista vacía y calcula la máscara de pista."""
+        if self.en_directo:
+            dato = self.fuente.leer(timeout=TIMEOUT_REFERENCIA_S)
+            if dato is None:
+                self.fuente.detener()
+                raise Exception(f"La fuente {self.video_path} no entregó ningún frame en {TIMEOUT_REFERENCIA_S}s.")
+            fondo_vacio, _, _, self._inicio_captura = dato
+        else:
+            ret, fondo_vacio = self.cap.read()
+            if not ret: raise Exception("No se pudo leer el primer frame del vídeo.")
             
         # AJUSTE: Reescalamos el fondo al ancho fijo
-        self.fondo_vacio = reescalar_frame(fondo_vacio, self.ANCHO_VENTANA)
-        self.mascara_pista = crear_mascara_pista(self.fondo_vacio)
-        self.mascara_pista_bgr = cv2.cvtColor(self.mascara_pista, cv2.COLOR_GRAY2BGR)
+        fondo_vacio = reescalar_frame(fondo_vacio, self.ANCHO_VENTANA)
+        mascara_pista = crear_mascara_pista(fondo_vacio, **self.PARAMS_PISTA)
         
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0) # Reiniciamos el cursor de vídeo
-        self.frame_count = 0
+        if not self.en_directo:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0) # Reiniciamos el cursor de vídeo
+        return {
+            'fondo_vacio': fondo_vacio,
+            'mascara_pista': mascara_pista,
+            'mascara_pista_bgr': cv2.cvtColor(mascara_pista, cv2.COLOR_GRAY2BGR)
+        }
 
-    def get_next_frame_data(self):
-        """Lee un frame, lo procesa y devuelve los frames y resultados."""
+    # ------------------------------------------------------------
+    # Máscara de pista (doble buffer) y recarga de configuración
+    # ------------------------------------------------------------
+
+    def _preparar_mascara(self, mascara_pista, mascara_pista_bgr, margen_roi):
+        """
+        Construye todo lo que depende de la máscara de pista (ROI, pirámide y un analizador con sus
+        buffers) sin tocar el estado del detector: se puede llamar desde un hilo aparte mientras
+        el vídeo sigue analizándose con la máscara anterior.
+        """
+        roi = calcular_roi(mascara_pista, margen_roi)
+        piramide = None
+        if self.NIVEL_ANALISIS > 0:
+            # Pirámide: el movimiento se busca a 1/2**NIVEL_ANALISIS del ancho de ventana
+            piramide = crear_piramide(self.modelo_fondo.fondo, mascara_pista, roi, self.NIVEL_ANALISIS)
+
+        # Analizador con sus buffers reservados una vez (el fondo del modelo se actualiza en sitio)
+        analizador = AnalizadorFrames(self.modelo_fondo.fondo, mascara_pista, mascara_pista_bgr, self.UMBRAL_BG_SUB,
+                                      self.UMBRAL_RUIDO_COCHE, self.UMBRAL_SALIDA, roi, piramide,
+                                      mascara_libre=self.MODELO_FONDO == 'media')
+        analizador.perfilador = self.perfilador
+        return {
+            'mascara_pista': mascara_pista,
+            'mascara_pista_bgr': mascara_pista_bgr,
+            'margen_roi': margen_roi,
+            'roi': roi,
+            'piramide': piramide,
+            'analizador': analizador
+        }
+
+    def _usar_mascara(self, preparada):
+        """Pasa a usar una máscara preparada con _preparar_mascara (en el hilo del vídeo, entre frames)."""
+        roi_anterior = getattr(self, 'roi', None)
+
+        self.mascara_pista = preparada['mascara_pista']
+        self.mascara_pista_bgr = preparada['mascara_pista_bgr']
+        self.MARGEN_ROI = preparada['margen_roi']
+        self.roi = preparada['roi']
+        self.zona = zona_roi(self.roi)
+        self.piramide = preparada['piramide']
+        self.analizador = preparada['analizador']
+
+        # Los umbrales pueden haber cambiado mientras se preparaba
+        self.analizador.UMBRAL_BG_SUB = self.UMBRAL_BG_SUB
+        self.analizador.UMBRAL_RUIDO_COCHE = self.UMBRAL_RUIDO_COCHE
+        self.analizador.UMBRAL_SALIDA = self.UMBRAL_SALIDA
+
+        # MOG2 guarda su estado con el tamaño de la ROI: con otra ROI vuelve a partir de la referencia
+        if roi_anterior is not None and roi_anterior != self.roi and self.MODELO_FONDO == 'mog2':
+            self.modelo_fondo = crear_modelo_fondo(self.MODELO_FONDO, self.fondo_deteccion, self.TASA_APRENDIZAJE_FONDO)
+
+    def _al_cambiar_config(self, cambios):
+        """Llamado por VigilanteConfig (en su hilo) con las claves de config.json que han cambiado."""
+        en_vivo = {c: v for c, v in cambios.items() if c in CLAVES_EN_VIVO}
+        referencia = {c: v for c, v in cambios.items() if c in CLAVES_REFERENCIA}
+        otras = sorted(set(cambios) - set(en_vivo) - set(referencia))
+        if otras:
+            print(f"config.json: {', '.join(otras)} no se aplica hasta reiniciar el detector")
+
+        if en_vivo:
+            with self._lock_cambios:
+                self._cambios_pendientes.update(en_vivo)
+
+        if referencia:
+            # Se parte de lo último pedido, no de lo aplicado: dos guardados seguidos no se pisan
+            with self._lock_cambios:
+                params = dict(self._params_objetivo)
+                for clave, param in (('LIM_INF_PISTA', 'lim_inf_pista'), ('LIM_SUP_PISTA', 'lim_sup_pista'),
+                                     ('KERNEL_EROSION', 'kernel_erosion_size'), ('KERNEL_CIERRE', 'kernel_cierre_size')):
+                    if clave in referencia:
+                        params[param] = referencia[clave]
+                margen_roi = referencia.get('MARGEN_ROI', self._margen_objetivo)
+                self._params_objetivo, self._margen_objetivo = params, margen_roi
+            self.reconstruir_mascara(params, margen_roi)
+
+    def reconstruir_mascara(self, params_pista, margen_roi=None, frame=None, cambio_maximo=None, al_terminar=None):
+        """
+        Recalcula la máscara de pista en un hilo aparte, sobre el frame de referencia o sobre
+        `frame` (que el llamador no debe modificar mientras tanto). El vídeo sigue con la máscara
+        anterior y la nueva se cambia de golpe antes del siguiente frame. Si se pide otra
+        reconstrucción antes de terminar, solo se usa la más reciente.
+        cambio_maximo: fracción máxima de píxeles de pista que pueden cambiar; si la nueva máscara
+                       difiere más (p.ej. un frame con sombras o un coche parado), se descarta.
+                       Una máscara vacía se descarta siempre.
+        al_terminar: se llama al acabar (en el hilo de fondo), se haya usado la máscara o no.
+        """
+        margen_roi = self.MARGEN_ROI if margen_roi is None else margen_roi
+        with self._lock_cambios:
+            self._generacion_mascara += 1
+            generacion = self._generacion_mascara
+            if frame is None:
+                self._reconstrucciones_config += 1
+
+        def reconstruir():
+            try:
+                imagen = self.fondo_vacio if frame is None else frame
+                mascara_pista = crear_mascara_pista(imagen, **params_pista)
+
+                # Sin pista, todo coche sería una infracción: se sigue con la máscara anterior
+                if cv2.countNonZero(mascara_pista) == 0:
+                    print("Máscara de pista no actualizada: con estos parámetros no queda ningún píxel de pista")
+                    return
+
+                if cambio_maximo is not None:
+                    actual = self.mascara_pista
+                    cambio = cv2.countNonZero(cv2.bitwise_xor(mascara_pista, actual)) / max(cv2.countNonZero(actual), 1)
+                    if cambio > cambio_maximo:
+                        print(f"Máscara de pista no actualizada: cambia un {cambio:.0%} (máximo {cambio_maximo:.0%})")
+                        return
+
+                mascara_pista_bgr = cv2.cvtColor(mascara_pista, cv2.COLOR_GRAY2BGR)
+                preparada = self._preparar_mascara(mascara_pista, mascara_pista_bgr, margen_roi)
+                preparada['params_pista'] = params_pista
+                preparada['origen'] = "config.json" if frame is None else "refresco periódico"
+
+                # La caché solo guarda máscaras calculadas sobre el frame de referencia
+                if self.ruta_cache and frame is None:
+                    clave = clave_cache(self.video_path, self.ANCHO_VENTANA, params_pista)
+                    guardar_referencia(self.ruta_cache, clave, {'fondo_vacio': self.fondo_vacio,
+                                                                'mascara_pista': mascara_pista,
+                                                                'mascara_pista_bgr': mascara_pista_bgr})
+                with self._lock_cambios:
+                    if generacion == self._generacion_mascara:
+                        self._mascara_nueva = preparada
+            finally:
+                if frame is None:
+                    with self._lock_cambios:
+                        self._reconstrucciones_config -= 1
+                if al_terminar is not None:
+                    al_terminar()
+
+        threading.Thread(target=reconstruir, daemon=True).start()
+
+    def _actualizar_refresco(self, results, frame_actual):
+        """
+        Refresco periódico de la máscara (REFRESCO_MASCARA_S > 0): guarda el frame sin coches con
+        menos movimiento del periodo y, al cumplirse, reconstruye la máscara con él en segundo plano.
+        El movimiento es el del analizador, medido contra el modelo de fondo activo: con "estatico"
+        es la diferencia con el frame de referencia, con "media" o "mog2" la del fondo adaptado.
+        Usa los últimos parámetros pedidos en config.json y espera mientras haya una reconstrucción
+        de config.json en curso o sin aplicar, para no dejarla obsoleta.
+        """
+        if self.frame_count < self._frame_ultimo_refresco:
+            self._frame_ultimo_refresco = 0 # El vídeo volvió al principio
+
+        if not results['coches']:
+            movimiento = self.analizador.movimiento
+            if self._movimiento_candidato is None or movimiento < self._movimiento_candidato:
+                np.copyto(self._buffers_refresco[0], frame_actual)
+                self._movimiento_candidato = movimiento
+
+        periodo_frames = self.REFRESCO_MASCARA_S * self.fps
+        if (self.frame_count - self._frame_ultimo_refresco < periodo_frames or
+                self._movimiento_candidato is None or self._refresco_en_curso):
+            return
+
+        with self._lock_cambios:
+            ocupado = self._reconstrucciones_config > 0 or self._mascara_nueva is not None
+            params, margen_roi = dict(self._params_objetivo), self._margen_objetivo
+        if ocupado:
+            return # Se reintenta en el siguiente frame, con el mismo candidato
+
+        # Doble buffer: el candidato pasa al hilo de fondo y el vídeo sigue con el otro buffer
+        candidato = self._buffers_refresco[0]
+        self._buffers_refresco.reverse()
+        self._movimiento_candidato = None
+        self._frame_ultimo_refresco = self.frame_count
+        self._refresco_en_curso = True
+
+        def terminado():
+            self._refresco_en_curso = False
+
+        self.reconstruir_mascara(params, margen_roi, frame=candidato, cambio_maximo=self.CAMBIO_MAXIMO_MASCARA,
+                                 al_terminar=terminado)
+
+    def _aplicar_cambios(self):
+        """Aplica entre dos frames los umbrales nuevos y la máscara reconstruida, si los hay."""
+        with self._lock_cambios:
+            cambios, self._cambios_pendientes = self._cambios_pendientes, {}
+            preparada, self._mascara_nueva = self._mascara_nueva, None
+
+        for clave, valor in cambios.items():
+            setattr(self, clave, valor)
+            if hasattr(self.analizador, clave):
+                setattr(self.analizador, clave, valor)
+        if cambios:
+            print(f"config.json aplicado: {cambios}")
+
+        if preparada is not None:
+            self.PARAMS_PISTA = preparada['params_pista']
+            self._usar_mascara(preparada)
+            print(f"Máscara de pista reconstruida ({preparada['origen']})")
+
+    def leer_frame(self):
+        """Lee el siguiente frame ya reescalado (o None al final del vídeo si no hay bucle)."""
+        if self.captura is not None:
+            return self._leer_frame_prefetch()
+        if self.fuente is not None:
+            return self._leer_frame_directo()
         
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
         ret, frame = self.cap.read()
 
         if not ret:
+            if not self.bucle: return None
+
             # Si termina el vídeo, reiniciamos (Bucle)
             self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
             self.frame_count = 0
@@ -181,28 +930,254 @@ class DetectorDeVideo:
             if not ret: return None
         
         self.frame_count += 1
+        if perf is not None: t = perf.registrar('decodificacion', t)
         
         # AJUSTE: Reescalamos el frame actual al mismo ancho fijo
-        frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA)
+        if self.buffer_previo is None:
+            frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA)
+        else:
+            # Con buffer previo, el reescalado se escribe directamente en su hueco (sin copias)
+            hueco, ticket = self.buffer_previo.reservar()
+            frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA, dst=hueco)
+            self.buffer_previo.confirmar(ticket, self.frame_count)
+
+        if perf is not None: perf.registrar('reescalado', t)
+        return frame_actual
+
+    def _leer_frame_prefetch(self):
+        """Toma el siguiente frame ya decodificado y reescalado por el hilo de captura."""
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
+        item = self.captura.obtener()
+        if perf is not None: perf.registrar('espera_captura', t)
+        if item is None: return None
+        frame_idx, frame, ticket = item
+        self.frame_count = frame_idx
+
+        # El buffer de la captura se devuelve enseguida: el frame pasa al buffer previo (copia en sitio)
+        if self.buffer_previo is None:
+            frame_actual = frame.copy()
+        else:
+            frame_actual, ticket_previo = self.buffer_previo.reservar()
+            np.copyto(frame_actual, frame)
+            self.buffer_previo.confirmar(ticket_previo, frame_idx)
+
+        self.captura.liberar(ticket)
+        return frame_actual
+
+    def _leer_frame_directo(self):
+        """
+        Toma el frame más reciente de la fuente en directo (esperando a que llegue uno nuevo).
+        frame_count cuenta los frames analizados, consecutivos aunque la fuente haya descartado
+        frames entre medias; el número de captura se guarda aparte. None si la fuente se detuvo.
+        """
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
+        dato = self.fuente.leer()
+        if dato is None: return None
+        frame, self._numero_captura, self._t_captura, self._t_captura_mono = dato
+        self.frame_count += 1
+        if perf is not None: t = perf.registrar('espera_captura', t)
+
+        if self.buffer_previo is None:
+            frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA)
+        else:
+            hueco, ticket = self.buffer_previo.reservar()
+            frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA, dst=hueco)
+            self.buffer_previo.confirmar(ticket, self.frame_count)
+
+        if perf is not None: perf.registrar('reescalado', t)
+        return frame_actual
+
+    def liberar(self):
+        """
+        Detiene los hilos de captura, de vigilancia de config.json y de exportación del perfil, cierra
+        la fuente de vídeo y entrega el incidente que siguiera abierto.
+        """
+        if self.vigilante is not None:
+            self.vigilante.detener()
+        if self.perfilador is not None:
+            self.perfilador.detener()
+        if self.captura is not None:
+            self.captura.detener()
+        if self.fuente is not None:
+            self.fuente.detener()
+        else:
+            self.cap.release()
+        if self.agrupador is not None:
+            self.agrupador.cerrar()
+
+    def frames_previos(self, frame_idx):
+        """
+        Frames anteriores a frame_idx guardados en el buffer previo (sin copiarlos).
+        Se llama al abrirse un incidente para incluir la aproximación a la curva.
+        """
+        if self.buffer_previo is None:
+            return []
+        return self.buffer_previo.desacoplar(hasta=frame_idx)
+
+    def get_next_frame_data(self):
+        """Lee un frame, lo procesa y devuelve los frames y resultados."""
+
+        # Cambios de configuración llegados desde otro hilo (sin coste si no hay ninguno)
+        if self._cambios_pendientes or self._mascara_nueva is not None:
+            self._aplicar_cambios()
+
+        # En reposo (pista vacía) solo se analiza uno de cada MUESTREO_REPOSO frames
+        if self._en_reposo:
+            results = self._sondear_reposo()
+            if results is not None: return results
         
-        results = analizar_frame(frame_actual, self.fondo_vacio, self.mascara_pista, self.UMBRAL_BG_SUB, self.UMBRAL_RUIDO_COCHE, self.UMBRAL_SALIDA, self.mascara_pista_bgr)
+        frame_actual = self.leer_frame()
+        if frame_actual is None:
+            # Fin del vídeo: el incidente que siguiera abierto ya no recibirá más frames
+            if self.agrupador is not None: self.agrupador.cerrar()
+            return None
+        
+        results = self._completar_resultados(self._analizar(frame_actual), frame_actual)
+        self._actualizar_reposo(results)
+        return results
+
+    def _analizar(self, frame_actual, aprender=True):
+        """Analiza el frame contra el modelo de fondo y (salvo aprender=False) actualiza el modelo."""
+        modelo = self.modelo_fondo
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
+
+        # El canal de detección se calcula una sola vez y lo usan tanto el modelo como la resta
+        imagen = imagen_deteccion(frame_actual, self.CANAL_DETECCION, self.zona, dst=self._imagen_canal)
+        mascara_movimiento = modelo.mascara_movimiento(imagen, self.zona, aprender)
+        if self.piramide is not None and self.MODELO_FONDO != 'estatico':
+            actualizar_piramide(self.piramide, modelo.fondo, self.roi)
+        if perf is not None: t = perf.registrar('preparacion', t)
 
-        # Añadir tiempo de vídeo
-        current_time_seconds = self.frame_count / self.fps
-        minutes = int(current_time_seconds // 60)
-        seconds = current_time_seconds % 60
-        time_str = f"{minutes:02d}:{seconds:04.1f}s"
+        results = self.analizador.analizar(frame_actual, mascara_movimiento, imagen)
+        if perf is not None: t = perf.registrar('analisis', t)
+
+        # El fondo aprende de este frame, salvo en los píxeles que ahora mismo están en movimiento
+        if aprender:
+            modelo.actualizar(imagen, self.zona, results['mascara_libre'] if results else None)
+            if perf is not None: perf.registrar('modelo_fondo', t)
+        return results
+
+    def _completar_resultados(self, results, frame_actual):
+        """Añade tiempo e índice de frame (o el placeholder si no hay coche) y alimenta al agrupador."""
+
+        # Añadir tiempo de vídeo (en directo, el transcurrido entre capturas desde el frame de referencia)
+        if self.en_directo:
+            current_time_seconds = self._t_captura_mono - self._inicio_captura
+        else:
+            current_time_seconds = self.frame_count / self.fps
+        time_str = formatear_tiempo(current_time_seconds)
         
         if results:
             results['video_time'] = time_str
         else:
             # Devuelve un placeholder si no detecta coche, pero es necesario para la GUI
-            results = {
-                'frame_real': frame_actual,
-                'frame_mascara': self.mascara_pista_bgr,
-                'infraccion_detectada': False,
-                'video_time': time_str,
-                'porcentaje_en_pista': 100.0
-            }
+            results = ResultadosFrame(
+                frame_real=frame_actual,
+                frame_mascara=self.mascara_pista_bgr,
+                infraccion_detectada=False,
+                video_time=time_str,
+                porcentaje_en_pista=100.0,
+                area_coche=0,
+                coches=[]
+            )
+
+        self.secuencia += 1
+        results['frame_idx'] = self.frame_count
+        results['tiempo_s'] = current_time_seconds
+        results['seq'] = self.secuencia
+        if self.en_directo:
+            results['frame_captura'] = self._numero_captura
+            results['t_captura'] = self._t_captura
+            # Desde que el frame salió de la fuente hasta tener su resultado
+            results['latencia_s'] = time.perf_counter() - self._t_captura_mono
+
+        if self.agrupador is not None:
+            perf = self.perfilador
+            if perf is not None: t = time.perf_counter()
+            self.agrupador.procesar(results)
+            if perf is not None: perf.registrar('agrupacion', t)
+
+        if self.REFRESCO_MASCARA_S > 0:
+            self._actualizar_refresco(results, frame_actual)
         
-        return results
\ No newline at end of file
+        return results
+
+    # ------------------------------------------------------------
+    # Modo reposo (muestreo adaptativo cuando no hay coches)
+    # ------------------------------------------------------------
+
+    def _actualizar_reposo(self, results):
+        if not self._reposo_disponible:
+            return
+        if results['coches']:
+            self._frames_sin_movimiento = 0
+            return
+        self._frames_sin_movimiento += 1
+        if self._frames_sin_movimiento >= self.FRAMES_HASTA_REPOSO:
+            self._en_reposo = True
+
+    def _sondear_reposo(self):
+        """
+        Salta MUESTREO_REPOSO - 1 frames con cap.grab() (sin decodificarlos) y analiza el siguiente.
+        Si sigue sin haber movimiento devuelve su resultado. Si aparece movimiento (o se llega al
+        final del vídeo con frames saltados), vuelve a posicionar el vídeo justo después del
+        último frame analizado, sale del reposo y devuelve None: los frames saltados se analizan
+        a ritmo completo (relleno hacia atrás).
+        El sondeo no actualiza el modelo de fondo: con movimiento ese frame se vuelve a analizar,
+        y así no se aprende dos veces.
+        """
+        ultimo_analizado = self.frame_count
+
+        for _ in range(self.MUESTREO_REPOSO - 1):
+            if not self.cap.grab(): break
+            self.frame_count += 1
+
+        ret, frame = self.cap.read()
+        if not ret:
+            # Final del vídeo: se analizan los frames saltados y el final lo gestiona leer_frame (bucle o fin)
+            self._salir_reposo(ultimo_analizado)
+            return None
+        self.frame_count += 1
+
+        frame_actual = reescalar_frame(frame, self.ANCHO_VENTANA)
+        results = self._analizar(frame_actual, aprender=False)
+
+        if results is None:
+            return self._completar_resultados(None, frame_actual)
+
+        # Hay movimiento: se vuelve a ritmo completo desde el primer frame saltado
+        if self._salir_reposo(ultimo_analizado):
+            return None
+
+        # Sin relleno posible: se sigue desde este frame, ahora sí aprendiendo de él
+        return self._completar_resultados(self._analizar(frame_actual), frame_actual)
+
+    def _salir_reposo(self, ultimo_analizado):
+        """
+        Sale del reposo y reposiciona el vídeo justo después de ultimo_analizado. CAP_PROP_POS_FRAMES
+        no es exacto con todos los backends y códecs: si la posición leída tras set() no coincide,
+        se vuelve a donde estaba el vídeo, se desactiva el reposo y se devuelve False (sin relleno).
+        """
+        self._en_reposo = False
+        self._frames_sin_movimiento = 0
+        if self.frame_count == ultimo_analizado:
+            return True # No se saltó nada
+
+        posicion = self.frame_count
+        if self._posicionar(ultimo_analizado):
+            self.frame_count = ultimo_analizado
+            return True
+
+        print("El vídeo no se puede reposicionar con exactitud: modo reposo desactivado")
+        self._reposo_disponible = False
+        if not self._posicionar(posicion):
+            self.frame_count = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        return False
+
+    def _posicionar(self, frame_idx):
+        """Mueve el cursor para que el siguiente frame leído sea el frame_idx + 1. True si el backend lo confirma."""
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_idx
@@ -0,0 +1,325 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from Detector import DetectorDeVideo, ResultadosFrame
+
+"""
+DetectorDeVideo en un proceso aparte, con los frames publicados en memoria compartida.
+El proceso del detector escribe frame_real y frame_mascara en un anillo de huecos de tamaño
+fijo (multiprocessing.shared_memory) y por la cola solo viaja un mensaje pequeño con los
+metadatos (número de secuencia, hueco, veredicto, porcentaje, tiempo de vídeo): los frames
+nunca se serializan. Así el análisis y el pintado de la GUI corren en paralelo de verdad,
+sin competir por el GIL, y un frame lento de la GUI no frena la detección.
+
+Los frames de cada incidente tampoco pasan por la cola: se copian en un bloque de memoria
+compartida propio del incidente y solo se envían sus metadatos y el nombre del bloque. El lado
+de la GUI copia los frames del bloque y lo borra. La máscara de pista cuando cambia (recarga de
+config.json o refresco periódico), poco frecuente, sí viaja serializada por su propia cola.
+"""
+
+N_HUECOS = 8
+
+# Metadatos de cada resultado que se envían por la cola (todo menos las imágenes)
+CAMPOS_META = ('seq', 'frame_idx', 'video_time', 'tiempo_s', 'infraccion_detectada',
+               'porcentaje_en_pista', 'area_coche', 'coches')
+
+
+class AnilloCompartido:
+    """
+    Anillo de huecos en memoria compartida. Cada hueco guarda el frame real y la máscara
+    (alto, ancho, 3), y una cabecera guarda el número de secuencia de cada hueco: el lector
+    comprueba después de copiar que el hueco no se sobrescribió mientras lo leía.
+    """
+
+    def __init__(self, forma, n_huecos=N_HUECOS, nombre=None):
+        """Sin nombre crea el bloque de memoria (escritor); con nombre se conecta a uno existente (lector)."""
+        self.forma = tuple(forma)
+        self.n_huecos = n_huecos
+        self._propio = nombre is None
+
+        tamano = n_huecos * 8 + n_huecos * 2 * int(np.prod(self.forma))
+        if self._propio:
+            self.shm = shared_memory.SharedMemory(create=True, size=tamano)
+        else:
+            self.shm = shared_memory.SharedMemory(name=nombre)
+            # El bloque es del proceso que lo creó (y lo borra). Si el resource_tracker de este
+            # proceso también lo registrara, al salir intentaría borrarlo otra vez y avisaría de una fuga
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.secuencias = np.ndarray((n_huecos,), np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((n_huecos, 2) + self.forma, np.uint8, buffer=self.shm.buf, offset=n_huecos * 8)
+        if self._propio:
+            self.secuencias.fill(-1)
+        self._siguiente = 0
+
+    @property
+    def nombre(self):
+        return self.shm.name
+
+    def escribir(self, seq, frame_real, frame_mascara):
+        """Copia los dos frames en el siguiente hueco y devuelve su índice."""
+        hueco = self._siguiente
+        self._siguiente = (hueco + 1) % self.n_huecos
+
+        self.secuencias[hueco] = -1 # Hueco a medio escribir
+        np.copyto(self.frames[hueco, 0], frame_real)
+        np.copyto(self.frames[hueco, 1], frame_mascara)
+        self.secuencias[hueco] = seq
+        return hueco
+
+    def leer(self, hueco, seq):
+        """Copia los frames del hueco. Devuelve None si el escritor lo reutilizó entretanto."""
+        if self.secuencias[hueco] != seq:
+            return None
+        frame_real = self.frames[hueco, 0].copy()
+        frame_mascara = self.frames[hueco, 1].copy()
+        if self.secuencias[hueco] != seq:
+            return None
+        return frame_real, frame_mascara
+
+    def cerrar(self):
+        # Las vistas numpy deben soltarse antes de cerrar el bloque
+        del self.secuencias, self.frames
+        self.shm.close()
+        if self._propio:
+            self.shm.unlink()
+
+
+# --- PROCESO DEL DETECTOR ---
+
+def _publicar_incidente(cola, incidente):
+    """
+    Copia los frames del incidente en un bloque de memoria compartida nuevo y encola el resto
+    del incidente con el nombre y la forma del bloque. El bloque pasa a ser del lado de la GUI,
+    que es quien lo borra (ColaIncidentes.get_nowait).
+    """
+    frames = incidente.pop('frames')
+    incidente['shm'] = None
+    if frames:
+        forma = (len(frames),) + frames[0].shape
+        bloque = shared_memory.SharedMemory(create=True, size=int(np.prod(forma)))
+        datos = np.ndarray(forma, np.uint8, buffer=bloque.buf)
+        for destino, frame in zip(datos, frames):
+            np.copyto(destino, frame)
+        del datos
+        # Este proceso no lo borra: que su resource_tracker no lo dé por fugado al salir
+        resource_tracker.unregister(bloque._name, 'shared_memory')
+        bloque.close()
+        incidente['shm'] = bloque.name
+        incidente['forma'] = forma
+    cola.put(incidente)
+
+
+def _publicar_ultimo(cola, meta):
+    """Encola meta; si la GUI va atrasada y la cola está llena se descarta el mensaje más antiguo."""
+    while True:
+        try:
+            cola.put_nowait(meta)
+            return
+        except queue.Full:
+            pass
+        try:
+            cola.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def _reenviar_incidentes(detector, cola_incidentes):
+    """Publica para la GUI los incidentes que el detector ya ha cerrado."""
+    if detector.cola_incidentes is None:
+        return
+    while True:
+        try:
+            _publicar_incidente(cola_incidentes, detector.cola_incidentes.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _proceso_detector(video_path, kwargs_detector, n_huecos, fps_objetivo, cola_meta, cola_incidentes, cola_mascaras,
+                      conectado, parar):
+    try:
+        detector = DetectorDeVideo(video_path, **kwargs_detector)
+    except Exception as e:
+        cola_meta.put({'error': f"{type(e).__name__}: {e}"})
+        return
+
+    anillo = AnilloCompartido(detector.fondo_vacio.shape, n_huecos)
+    cola_meta.put({
+        'shm': anillo.nombre,
+        'forma': anillo.forma,
+        'n_huecos': n_huecos,
+        'mascara_pista': detector.mascara_pista,
+        'fps': detector.fps
+    })
+    # El bloque no se puede liberar antes de que el proceso de la GUI se haya conectado
+    conectado.wait()
+
+    periodo = 1.0 / fps_objetivo
+    mascara_publicada = detector.mascara_pista
+    try:
+        while not parar.is_set():
+            inicio = time.perf_counter()
+
+            results = detector.get_next_frame_data()
+            if results is None:
+                break
+
+            results.materializar()
+            meta = {campo: results[campo] for campo in CAMPOS_META}
+            meta['hueco'] = anillo.escribir(results['seq'], results['frame_real'], results['frame_mascara'])
+            _publicar_ultimo(cola_meta, meta)
+
+            # La máscara de pista se reconstruye como un array nuevo: se publica solo cuando cambia
+            if detector.mascara_pista is not mascara_publicada:
+                mascara_publicada = detector.mascara_pista
+                cola_mascaras.put(mascara_publicada)
+
+            _reenviar_incidentes(detector, cola_incidentes)
+
+            # Una fuente en directo ya marca el ritmo: esperar más solo añadiría latencia
+            espera = periodo - (time.perf_counter() - inicio)
+            if espera > 0 and not detector.en_directo:
+                time.sleep(espera)
+    finally:
+        detector.liberar() # Cierra también el incidente que quedara abierto
+        _reenviar_incidentes(detector, cola_incidentes)
+        _publicar_ultimo(cola_meta, None) # Fin del vídeo
+        anillo.cerrar()
+
+
+# --- LADO DE LA GUI ---
+
+class ColaIncidentes:
+    """
+    Cola de incidentes del lado de la GUI: get_nowait() devuelve el incidente con sus frames
+    (copiados de su bloque de memoria compartida, que se borra), como la cola de DetectorDeVideo.
+    """
+
+    def __init__(self, cola):
+        self._cola = cola # mp.Queue en la que el proceso del detector publica los incidentes
+
+    def get_nowait(self):
+        incidente = self._cola.get_nowait()
+        nombre = incidente.pop('shm')
+        if nombre is None:
+            incidente['frames'] = []
+            return incidente
+
+        bloque = shared_memory.SharedMemory(name=nombre)
+        try:
+            # Una sola copia contigua; cada frame es una vista de ella
+            datos = np.ndarray(incidente.pop('forma'), np.uint8, buffer=bloque.buf).copy()
+        finally:
+            bloque.close()
+            bloque.unlink()
+        incidente['frames'] = list(datos)
+        return incidente
+
+    def vaciar(self):
+        """Borra los bloques de los incidentes que nadie llegó a leer."""
+        while True:
+            try:
+                incidente = self._cola.get_nowait()
+            except queue.Empty:
+                return
+            if incidente['shm'] is not None:
+                bloque = shared_memory.SharedMemory(name=incidente['shm'])
+                bloque.close()
+                bloque.unlink()
+
+
+class DetectorEnProceso:
+    """
+    Lo que la GUI usa de DetectorDeVideo (get_next_frame_data, mascara_pista, cola_incidentes),
+    con el detector corriendo en otro proceso. Los argumentos extra se pasan a DetectorDeVideo.
+    """
+
+    def __init__(self, video_path, n_huecos=N_HUECOS, fps_objetivo=25, **kwargs_detector):
+        # Pocos mensajes en cola: un mensaje muy atrasado apuntaría a un hueco ya reutilizado
+        self._cola_meta = mp.Queue(maxsize=max(n_huecos // 2, 1))
+        cola_incidentes = mp.Queue()
+        self.cola_incidentes = ColaIncidentes(cola_incidentes)
+        self._cola_mascaras = mp.Queue()
+        self._parar = mp.Event()
+        conectado = mp.Event()
+
+        self._proceso = mp.Process(target=_proceso_detector, daemon=True,
+                                   args=(video_path, kwargs_detector, n_huecos, fps_objetivo, self._cola_meta,
+                                         cola_incidentes, self._cola_mascaras, conectado, self._parar))
+        self._proceso.start()
+
+        inicio = self._esperar_inicio()
+        if 'error' in inicio:
+            self._proceso.join()
+            raise RuntimeError(f"El proceso del detector no pudo arrancar: {inicio['error']}")
+
+        self.anillo = AnilloCompartido(inicio['forma'], inicio['n_huecos'], nombre=inicio['shm'])
+        self.mascara_pista = inicio['mascara_pista']
+        self.fps = inicio['fps']
+        self.terminado = False
+        # El anillo se lee en el hilo de vídeo de la GUI y se cierra desde el de Tk
+        self._lock_anillo = threading.Lock()
+        self._cerrado = False
+        conectado.set()
+
+    def _esperar_inicio(self):
+        while True:
+            try:
+                return self._cola_meta.get(timeout=0.5)
+            except queue.Empty:
+                if not self._proceso.is_alive():
+                    raise RuntimeError("El proceso del detector terminó antes de arrancar")
+
+    def get_next_frame_data(self):
+        """
+        Devuelve el resultado más reciente publicado por el detector (los atrasados se descartan),
+        o None si no ha llegado ninguno nuevo, si el vídeo terminó o si su hueco ya se reutilizó.
+        """
+        if self.terminado:
+            return None
+
+        # Máscara reconstruida en el proceso del detector: es otro array, la GUI la vuelve a cachear
+        while True:
+            try:
+                self.mascara_pista = self._cola_mascaras.get_nowait()
+            except queue.Empty:
+                break
+
+        try:
+            meta = self._cola_meta.get(timeout=0.1)
+        except queue.Empty:
+            return None
+        while meta is not None:
+            try:
+                meta = self._cola_meta.get_nowait()
+            except queue.Empty:
+                break
+
+        if meta is None:
+            self.terminado = True
+            return None
+
+        with self._lock_anillo:
+            if self._cerrado:
+                return None
+            frames = self.anillo.leer(meta.pop('hueco'), meta['seq'])
+        if frames is None:
+            return None
+        frame_real, frame_mascara = frames
+        return ResultadosFrame(frame_real=frame_real, frame_mascara=frame_mascara, **meta)
+
+    def detener(self):
+        self._parar.set()
+        self._proceso.join(timeout=2.0)
+        if self._proceso.is_alive():
+            self._proceso.terminate()
+        with self._lock_anillo:
+            self.terminado = True
+            self._cerrado = True
+            self.anillo.cerrar()
+        self.cola_incidentes.vaciar()
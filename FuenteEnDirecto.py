@@ -0,0 +1,173 @@
+import threading
+import time
+
+import cv2
+
+"""
+Fuentes en directo (cámaras V4L2, URLs RTSP/HTTP/UDP...) para DetectorDeVideo.
+Un hilo lee la fuente sin parar y solo conserva el frame más reciente: el análisis siempre toma
+el último frame capturado y los que no llegó a ver se descartan (y se cuentan). En control de
+carrera importa más la latencia entre la captura y la alerta que analizar todos los frames.
+    - Cada frame lleva la hora de captura (time.time() al leerlo) y su número de captura, en
+      lugar de derivar el tiempo de frame_count / fps.
+    - Si la fuente se corta se reconecta sola, con esperas crecientes entre intentos.
+    - Un fichero de vídeo (o una FIFO alimentada por ffmpeg) sirve como sustituto local de una
+      cámara: se lee al ritmo de sus fps y al terminar se "reconecta" desde el principio.
+"""
+
+PREFIJOS_STREAM = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://', 'srt://')
+
+ESPERA_RECONEXION_S = (0.5, 8.0) # Primera espera y espera máxima entre intentos
+
+
+def es_fuente_en_directo(video_path):
+    """True para índices de cámara (0, "0"), dispositivos /dev/video* y URLs de streaming."""
+    if isinstance(video_path, int):
+        return True
+    ruta = str(video_path)
+    return ruta.isdigit() or ruta.startswith('/dev/video') or ruta.lower().startswith(PREFIJOS_STREAM)
+
+
+def abrir_captura(video_path):
+    """cv2.VideoCapture de la fuente ("0" se abre como la cámara 0) con el buffer interno mínimo."""
+    fuente = int(video_path) if str(video_path).isdigit() else video_path
+    cap = cv2.VideoCapture(fuente)
+    # En cámaras y streams el buffer del backend añade latencia; no todos los backends lo admiten
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+class FuenteEnDirecto:
+
+    def __init__(self, video_path, ritmo_fichero=None):
+        """
+        video_path: índice o ruta de cámara, URL o fichero.
+        ritmo_fichero: fps al que se lee un fichero para simular una cámara (None = los del
+                       propio fichero). No se usa con cámaras ni streams, que marcan su ritmo.
+        """
+        self.video_path = video_path
+        self.es_fichero = not es_fuente_en_directo(video_path)
+
+        self.cap = abrir_captura(video_path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Error: No se pudo abrir la fuente {video_path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self._periodo_fichero = 1.0 / (ritmo_fichero or self.fps) if self.es_fichero else 0.0
+
+        # Último frame capturado: (frame, número de captura, hora de captura, instante monotónico)
+        self._cond = threading.Condition()
+        self._ultimo = None
+        self._entregado = 0 # Número de captura del último frame entregado
+
+        # Contadores
+        self.capturados = 0
+        self.entregados = 0
+        self.descartados = 0
+        self.reconexiones = 0
+        self.conectada = True
+
+        self._activo = True
+        self._hilo = threading.Thread(target=self._hilo_captura, daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------
+    # Lado del análisis
+    # ------------------------------------------------------------
+
+    def leer(self, timeout=None):
+        """
+        Devuelve (frame, numero_captura, t_captura, t_monotonico) con el frame más reciente que aún
+        no se ha entregado, esperando a que llegue uno. None si se agota el timeout o se detuvo.
+        El frame es del llamador (el hilo de captura no lo reutiliza).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._activo or
+                                       (self._ultimo is not None and self._ultimo[1] > self._entregado), timeout):
+                return None
+            if not self._activo:
+                return None
+            frame, numero, t_captura, t_mono = self._ultimo
+            self.descartados += numero - self._entregado - 1
+            self._entregado = numero
+            self.entregados += 1
+            return frame, numero, t_captura, t_mono
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'capturados': self.capturados,
+                'entregados': self.entregados,
+                'descartados': self.descartados,
+                'reconexiones': self.reconexiones,
+                'conectada': self.conectada
+            }
+
+    def detener(self):
+        """
+        Para el hilo de captura. La captura la cierra el propio hilo al salir de su bucle: si sigue
+        bloqueado en cap.read() (stream parado), cerrarla desde aquí sería leer y liberar a la vez.
+        """
+        with self._cond:
+            self._activo = False
+            self._cond.notify_all()
+        self._hilo.join(timeout=2.0)
+
+    # ------------------------------------------------------------
+    # Hilo de captura
+    # ------------------------------------------------------------
+
+    def _reconectar(self):
+        """Reabre la fuente hasta conseguirlo (o hasta detener), con esperas crecientes."""
+        espera, espera_maxima = ESPERA_RECONEXION_S
+        with self._cond:
+            self.conectada = False
+        self.cap.release()
+
+        while self._activo:
+            if not self.es_fichero:
+                time.sleep(espera)
+                espera = min(espera * 2, espera_maxima)
+            cap = abrir_captura(self.video_path)
+            if cap.isOpened():
+                with self._cond:
+                    # Si se detuvo mientras se abría, esta captura no se publica (nadie la cerraría)
+                    publicada = self._activo
+                    if publicada:
+                        self.cap = cap
+                        self.conectada = True
+                        self.reconexiones += 1
+                if publicada:
+                    return
+            cap.release()
+            if self.es_fichero:
+                time.sleep(espera)
+
+    def _hilo_captura(self):
+        try:
+            self._bucle_captura()
+        finally:
+            self.cap.release()
+
+    def _bucle_captura(self):
+        siguiente = time.perf_counter()
+        while self._activo:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self._activo:
+                    print(f"Fuente {self.video_path} sin señal, reconectando...")
+                    self._reconectar()
+                continue
+
+            if self._periodo_fichero:
+                # Un fichero se lee al ritmo de sus fps, como llegarían los frames de una cámara
+                siguiente += self._periodo_fichero
+                espera = siguiente - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                else:
+                    siguiente = time.perf_counter()
+
+            with self._cond:
+                self.capturados += 1
+                self._ultimo = (frame, self.capturados, time.time(), time.perf_counter())
+                self._cond.notify_all()
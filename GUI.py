@@ -1,11 +1,14 @@
 import customtkinter as ctk
-from tkinter import Toplevel, messagebox
+from tkinter import messagebox
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import cv2
 import numpy as np
 import time
 import threading
+import queue
 from Detector import DetectorDeVideo
+from DetectorEnProceso import DetectorEnProceso
+from AlmacenIncidentes import AlmacenIncidentes
 
 PLACEHOLDER_COLOR = "gray40"
 
@@ -16,6 +19,18 @@ except IOError:
 
 CTK_BACKGROUND_HEX = "#212121"
 
+# Memoria máxima (MB) para frames de incidentes sin comprimir; los antiguos se vuelcan a disco
+PRESUPUESTO_INCIDENTES_MB = 256
+
+# True: el detector corre en otro proceso y publica los frames en memoria compartida (DetectorEnProceso.py)
+DETECTOR_EN_PROCESO = False
+
+# True: decodificación en un hilo aparte (CapturaPrefetch.py)
+CAPTURA_PREFETCH = False
+
+# True: los cambios de config.json se aplican sin reiniciar (ConfigEnVivo.py)
+RECARGA_CONFIG = False
+
 
 # ===============================================================
 #                     GUI PRINCIPAL (MULTITHREAD)
@@ -23,7 +38,7 @@ CTK_BACKGROUND_HEX = "#212121"
 
 class DetectorGUI(ctk.CTk):
 
-    def __init__(self, detector):
+    def __init__(self, detector, presupuesto_incidentes_mb=PRESUPUESTO_INCIDENTES_MB):
         super().__init__()
         self.title("Detector de Salida de Pista F1")
         self.geometry("1200x700")
@@ -39,18 +54,23 @@ class DetectorGUI(ctk.CTk):
         # Detector (OpenCV)
         self.detector = detector
 
+        # Tiempos por etapa (solo si el detector los está midiendo: PERFILADO en config.json)
+        self.perfilador = getattr(detector, "perfilador", None)
+        self._ticks_perfil = 0
+
         # Último resultado del hilo de vídeo
         self.latest_results = None
 
+        # Lienzo, PhotoImage y último contenido pintado de cada label
+        self._render_labels = {}
+
         # Estado de vista
         self.modo_visualizacion = ctk.StringVar(value="Pista con Coche")
         self.infracciones_registradas = []
 
-        # Agrupación de infracciones
-        self.infraccion_activa = False
-        self.infraccion_frames = []
-        self.infraccion_inicio_t = None
-        self.infraccion_window_s = 1.0
+        # Frames de los incidentes ya cerrados (acotado en memoria)
+        self.almacen_incidentes = AlmacenIncidentes(presupuesto_mb=presupuesto_incidentes_mb)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         # Widgets de la GUI
         self._setup_widgets()
@@ -87,6 +107,13 @@ class DetectorGUI(ctk.CTk):
         self.lbl_video_real.grid_propagate(False)
         self.lbl_vista_seleccionada.grid_propagate(False)
 
+        # Panel de tiempos por etapa, encima del vídeo
+        self.lbl_perfil = None
+        if self.perfilador is not None:
+            self.lbl_perfil = ctk.CTkLabel(viz_frame, text="", font=("Courier", 11), justify="left",
+                                           fg_color="#000000", text_color="#00FF00")
+            self.lbl_perfil.place(x=12, y=12)
+
         # ✅ Forzar alturas iguales al 50% del contenedor
         # (lo hacemos tras update_idletasks para que Tk calcule tamaños)
         self.update_idletasks()
@@ -140,12 +167,13 @@ class DetectorGUI(ctk.CTk):
         TARGET_FPS = 25
         TARGET_DELAY = 1.0 / TARGET_FPS   # tiempo entre frames
 
-        while True:
+        while self._video_activo:
             start = time.time()
 
             results = self.detector.get_next_frame_data()
             if results is not None:
-                self.latest_results = results
+                # La visualización se construye en este hilo: el analizador reutiliza sus buffers en el siguiente frame
+                self.latest_results = results.materializar()
 
             elapsed = time.time() - start
             sleep_time = TARGET_DELAY - elapsed
@@ -158,7 +186,9 @@ class DetectorGUI(ctk.CTk):
     # ===============================================================
 
     def _start_threads(self):
-        threading.Thread(target=self._video_thread, daemon=True).start()
+        self._video_activo = True
+        self._hilo_video = threading.Thread(target=self._video_thread, daemon=True)
+        self._hilo_video.start()
         self._tk_loop()
 
 
@@ -169,6 +199,15 @@ class DetectorGUI(ctk.CTk):
         if self.latest_results is not None:
             self._render_latest_results(self.latest_results)
 
+        # Incidentes cerrados por el detector (agrupados en el hilo de vídeo, sin perder frames)
+        self._consume_incidents()
+
+        # Los percentiles se recalculan ~1 vez por segundo, no en cada tick
+        if self.lbl_perfil is not None:
+            self._ticks_perfil += 1
+            if self._ticks_perfil % 33 == 0:
+                self.lbl_perfil.configure(text=self.perfilador.texto())
+
         self.after(30, self._tk_loop)   # ~33 FPS estables para Tkinter
 
 
@@ -176,66 +215,63 @@ class DetectorGUI(ctk.CTk):
     #               RENDER DE FRAME (TKINTER)
     # ===============================================================
 
+    def _set_view_mode(self, modo):
+        self.modo_visualizacion.set(modo)
+
+
     def _render_latest_results(self, results):
 
-        frame_real = results["frame_real"]
-        frame_mascara = results["frame_mascara"]
+        # Un resultado ya pintado (mismo número de secuencia) no se vuelve a pintar
+        seq = results["seq"]
 
         self._update_label_image(
-            self.lbl_video_real, frame_real, "CÁMARA REAL"
+            self.lbl_video_real, results["frame_real"], "CÁMARA REAL", clave=seq
         )
 
         if self.modo_visualizacion.get() == "Solo Pista":
+            # La máscara de pista solo se pinta al entrar en el modo, si cambia el tamaño o si el
+            # detector la reconstruye (recarga de config.json: es otro array)
             self._update_label_image(
                 self.lbl_vista_seleccionada,
                 self.detector.mascara_pista,
-                "VISTA SELECCIONADA: Solo Pista"
+                "VISTA SELECCIONADA: Solo Pista",
+                clave=("Solo Pista", id(self.detector.mascara_pista))
             )
         else:
             self._update_label_image(
                 self.lbl_vista_seleccionada,
-                frame_mascara,
-                f"VISTA SELECCIONADA: Pista con Coche | En Pista: {results['porcentaje_en_pista']:.1f}%"
+                results["frame_mascara"],
+                f"VISTA SELECCIONADA: Pista con Coche | En Pista: {results['porcentaje_en_pista']:.1f}%",
+                clave=seq
             )
 
-        # --------------------------
-        # Agrupación de infracciones
-        # --------------------------
-
-        if results["infraccion_detectada"]:
-
-            if not self.infraccion_activa:
-                self.infraccion_activa = True
-                self.infraccion_inicio_t = time.time()
-                self.infraccion_frames = []
-
-            self.infraccion_frames.append(frame_real.copy())
-
-            if time.time() - self.infraccion_inicio_t >= self.infraccion_window_s:
-                self._add_alert_button_grouped(results["video_time"],
-                                               self.infraccion_frames.copy())
-
-                self.infraccion_activa = False
-                self.infraccion_frames = []
-
-        else:
-            if self.infraccion_activa and self.infraccion_frames:
-                self._add_alert_button_grouped(results["video_time"],
-                                               self.infraccion_frames.copy())
-
-            self.infraccion_activa = False
-            self.infraccion_frames = []
-
 
     # ===============================================================
     #                BOTONES DE ALERTAS AGRUPADAS
     # ===============================================================
 
-    def _add_alert_button_grouped(self, time_str, frames):
-        text = f"⚠️ INF: Salida en {time_str} (x{len(frames)} frames)"
+    def _consume_incidents(self):
+        cola = self.detector.cola_incidentes
+        if cola is None:
+            return
+
+        while True:
+            try:
+                incidente = cola.get_nowait()
+            except queue.Empty:
+                break
+            self._add_alert_button_grouped(incidente["video_time"],
+                                           incidente["frames"],
+                                           incidente["n_previos"])
+
+    def _add_alert_button_grouped(self, time_str, frames, n_previos=0):
+        # El botón solo guarda el id del incidente: los frames viven en el almacén
+        id_incidente = self.almacen_incidentes.agregar(frames)
+
+        text = f"⚠️ INF: Salida en {time_str} (x{len(frames) - n_previos} frames)"
         btn = ctk.CTkButton(self.scroll_frame_alertas, text=text,
                             fg_color="#CC0000", hover_color="#AA0000",
-                            command=lambda t=time_str, f=frames: self._open_alert_window_grouped(t, f))
+                            command=lambda t=time_str, i=id_incidente, p=n_previos: self._open_alert_window_grouped(t, i, p))
 
         btn.grid(row=self.alert_button_count, column=0, padx=5, pady=3, sticky="ew")
         self.alert_button_count += 1
@@ -257,7 +293,7 @@ class DetectorGUI(ctk.CTk):
         self.group_info_label = None
 
 
-    def _open_alert_window_grouped(self, time_str, frames):
+    def _open_alert_window_grouped(self, time_str, id_incidente, n_previos=0):
 
         if hasattr(self, 'alert_window') and self.alert_window.winfo_exists():
             self.alert_window.destroy()
@@ -267,7 +303,9 @@ class DetectorGUI(ctk.CTk):
         self.alert_window.geometry("900x650")
         self.alert_window.configure(fg_color="black")
 
-        self.group_frames = frames
+        # Carga perezosa: solo ahora se descomprimen los frames del incidente
+        self.group_frames = self.almacen_incidentes.frames(id_incidente)
+        self.group_n_previos = n_previos
         self.group_index = 0
 
         self.group_img_label = ctk.CTkLabel(self.alert_window, text="", fg_color="black")
@@ -314,8 +352,9 @@ class DetectorGUI(ctk.CTk):
         self.group_img_label.configure(image=self.group_photo)
         self.group_img_label.image = self.group_photo
 
+        previo = " (aproximación)" if self.group_index < self.group_n_previos else ""
         self.group_info_label.configure(
-            text=f"Imagen {self.group_index+1}/{len(self.group_frames)}"
+            text=f"Imagen {self.group_index+1}/{len(self.group_frames)}{previo}"
         )
 
     def _group_prev(self):
@@ -329,43 +368,87 @@ class DetectorGUI(ctk.CTk):
             self._group_show_image()
 
 
+    def _on_close(self):
+        self._video_activo = False
+        if isinstance(self.detector, DetectorEnProceso):
+            self.detector.detener()
+        else:
+            # La captura se cierra cuando el hilo de vídeo ha terminado su frame
+            self._hilo_video.join(timeout=2.0)
+            self.detector.liberar()
+        self.almacen_incidentes.cerrar()
+        self.destroy()
+
+
     # ===============================================================
     #                 ACTUALIZADOR DE IMÁGENES
     # ===============================================================
 
-    def _update_label_image(self, label, frame_bgr, text):
-
-        label.update_idletasks()
+    def _update_label_image(self, label, frame_bgr, text, clave=None):
+        """
+        Pinta frame_bgr (BGR o gris) en el label, con la banda de texto debajo.
+        Cada label conserva su lienzo RGB y su PhotoImage: solo se recrean si cambia el tamaño
+        del label, la banda solo se vuelve a dibujar si cambia el texto y cada actualización
+        hace paste() sobre la PhotoImage existente. Si `clave` (p.ej. el número de secuencia
+        del resultado) es la misma que la del último pintado, no se hace nada.
+        """
         w = label.winfo_width()
         h = label.winfo_height()
 
         if w < 20 or h < 20:
             return
 
-        img_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(img_rgb)
+        perf = self.perfilador
+        if perf is not None: t = time.perf_counter()
 
         band = 30
         draw_h = h - band
 
-        final = Image.new("RGB", (w, h), color=CTK_BACKGROUND_HEX)
+        estado = self._render_labels.get(label)
+        if estado is None or estado["size"] != (w, h):
+            estado = {
+                "size": (w, h),
+                "lienzo": np.zeros((h, w, 3), np.uint8),
+                "photo": ImageTk.PhotoImage("RGB", (w, h)),
+                "texto": None,
+                "clave": None
+            }
+            self._render_labels[label] = estado
+            label.configure(image=estado["photo"], text="")
+            label.image = estado["photo"]
+        elif clave is not None and clave == estado["clave"] and text == estado["texto"]:
+            return
+
+        lienzo = estado["lienzo"]
+        if text != estado["texto"]:
+            lienzo[draw_h:] = self._render_band(w, band, text)
+            estado["texto"] = text
+
+        # Redimensionado y conversión de color en OpenCV, escribiendo directamente en el lienzo
+        fh, fw = frame_bgr.shape[:2]
+        inter = cv2.INTER_AREA if w < fw and draw_h < fh else cv2.INTER_LINEAR
+        img = cv2.resize(frame_bgr, (w, draw_h), interpolation=inter)
+        conversion = cv2.COLOR_GRAY2RGB if img.ndim == 2 else cv2.COLOR_BGR2RGB
+        cv2.cvtColor(img, conversion, dst=lienzo[:draw_h])
 
-        img_pil = img_pil.resize((w, draw_h), Image.Resampling.LANCZOS)
-        final.paste(img_pil, (0, 0))
+        estado["photo"].paste(Image.fromarray(lienzo))
+        estado["clave"] = clave
 
-        draw = ImageDraw.Draw(final)
-        draw.rectangle([0, h-band, w, h], fill="#333333")
+        if perf is not None: perf.registrar("render_gui", t)
+
+
+    def _render_band(self, w, band, text):
+        """Banda gris con el texto centrado (array RGB de band x w)."""
+        img = Image.new("RGB", (w, band), color="#333333")
+        draw = ImageDraw.Draw(img)
 
         bbox = draw.textbbox((0, 0), text, font=DEFAULT_FONT)
         tw = bbox[2] - bbox[0]
         th = bbox[3] - bbox[1]
 
-        draw.text(((w-tw)//2, h-band + (band-th)//2 - 3),
+        draw.text(((w-tw)//2, (band-th)//2 - 3),
                   text, fill="white", font=DEFAULT_FONT)
-
-        photo = ImageTk.PhotoImage(final)
-        label.configure(image=photo, text="")
-        label.image = photo
+        return np.asarray(img)
 
 
 # ===============================================================
@@ -378,7 +461,12 @@ def main():
     #VIDEO_PATH = r"Imagenes\Suzuka.mp4"
 
     try:
-        detector = DetectorDeVideo(VIDEO_PATH, ancho_ventana=600)
+        if DETECTOR_EN_PROCESO:
+            detector = DetectorEnProceso(VIDEO_PATH, ancho_ventana=600, prefetch=CAPTURA_PREFETCH,
+                                         recarga_config=RECARGA_CONFIG)
+        else:
+            detector = DetectorDeVideo(VIDEO_PATH, ancho_ventana=600, prefetch=CAPTURA_PREFETCH,
+                                       recarga_config=RECARGA_CONFIG)
         app = DetectorGUI(detector)
         app.mainloop()
 
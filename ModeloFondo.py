@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+"""
+Modelos de fondo para la sustracción de fondo de analizar_frame.
+Con el fondo estático (el frame 0) los cambios de luz, sombras y autoexposición de la cámara
+generan cada vez más falso movimiento a lo largo de una sesión. Los modelos adaptativos
+actualizan el fondo en sitio en cada frame, solo dentro de la ROI.
+
+Se elige con "MODELO_FONDO" en config.json:
+    "estatico" -> el frame de referencia, sin actualizar (comportamiento original)
+    "media"    -> media móvil exponencial, sin aprender los píxeles marcados como coche
+    "mog2"     -> mezcla de gaussianas (cv2.createBackgroundSubtractorMOG2)
+"""
+
+
+class FondoEstatico:
+    """Fondo fijo: el frame de referencia."""
+
+    def __init__(self, fondo_vacio):
+        self.fondo = fondo_vacio
+
+    def mascara_movimiento(self, frame_actual, zona, aprender=True):
+        # None: analizar_frame hace la resta contra self.fondo
+        return None
+
+    def actualizar(self, frame_actual, zona, mascara_libre):
+        pass
+
+
+class FondoMediaMovil:
+    """
+    Media móvil exponencial: fondo = (1 - alpha) * fondo + alpha * frame.
+    Solo aprende de los píxeles libres (los que quedaron por debajo del umbral de la resta), así
+    los coches presentes no se "funden" con el fondo. Cuesta dos pasadas por frame sobre la ROI:
+    cv2.accumulateWeighted sobre el acumulador float32 y la conversión de vuelta a 8 bits. La
+    máscara de píxeles libres sale de una pasada de umbral más en AnalizadorFrames
+    (THRESH_BINARY_INV sobre la misma diferencia).
+    """
+
+    def __init__(self, fondo_vacio, tasa_aprendizaje=0.01):
+        self.alpha = tasa_aprendizaje
+        self.fondo = np.array(fondo_vacio, dtype=np.uint8) # Copia escribible (la caché es de solo lectura)
+        self._acumulador = self.fondo.astype(np.float32)
+
+    def mascara_movimiento(self, frame_actual, zona, aprender=True):
+        return None
+
+    def actualizar(self, frame_actual, zona, mascara_libre):
+        """mascara_libre: píxeles de la ROI de los que aprender (None = todos, no hay coche)."""
+        cv2.accumulateWeighted(frame_actual[zona], self._acumulador[zona], self.alpha, mask=mascara_libre)
+        cv2.convertScaleAbs(self._acumulador[zona], dst=self.fondo[zona])
+
+
+class FondoMOG2:
+    """
+    Mezcla de gaussianas por píxel. Da directamente la máscara de movimiento
+    (sustituye a absdiff + umbral) y se actualiza en la misma llamada.
+    """
+
+    def __init__(self, fondo_vacio, tasa_aprendizaje=0.01):
+        self.alpha = tasa_aprendizaje
+        self.fondo = fondo_vacio
+        self._sustractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self._iniciado = False
+
+    def mascara_movimiento(self, frame_actual, zona, aprender=True):
+        if not self._iniciado:
+            # El modelo parte del frame de referencia (pista vacía)
+            self._sustractor.apply(self.fondo[zona], learningRate=1.0)
+            self._iniciado = True
+        # aprender=False (sondeo del modo reposo): solo se consulta el modelo, sin actualizarlo
+        return self._sustractor.apply(frame_actual[zona], learningRate=self.alpha if aprender else 0)
+
+    def actualizar(self, frame_actual, zona, mascara_libre):
+        # Ya se actualizó dentro de apply()
+        pass
+
+
+MODELOS_FONDO = {
+    'estatico': FondoEstatico,
+    'media': FondoMediaMovil,
+    'mog2': FondoMOG2
+}
+
+
+def crear_modelo_fondo(nombre, fondo_vacio, tasa_aprendizaje=0.01):
+    if nombre not in MODELOS_FONDO:
+        raise ValueError(f"MODELO_FONDO desconocido: '{nombre}' (opciones: {', '.join(MODELOS_FONDO)})")
+    if nombre == 'estatico':
+        return FondoEstatico(fondo_vacio)
+    return MODELOS_FONDO[nombre](fondo_vacio, tasa_aprendizaje)
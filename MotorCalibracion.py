@@ -0,0 +1,200 @@
+import json
+import os
+import re
+
+import cv2
+import numpy as np
+
+from Detector import LIM_INF_PISTA, LIM_SUP_PISTA, KERNEL_EROSION, KERNEL_CIERRE, reescalar_frame
+
+"""
+Motor común de CalibradorHSV.py y morphCloseBar.py.
+Solo recalcula lo que depende del parámetro que ha cambiado:
+    - El HSV y sus tres canales se calculan una vez por imagen.
+    - Cada canal tiene su propia máscara de rango, hecha con una tabla de consulta (cv2.LUT) de
+      256 entradas: mover un deslizador de H cuesta una pasada de LUT sobre H y un AND de las tres.
+    - Las erosiones se guardan por tamaño de kernel y los cierres por (erosión, cierre), hasta que
+      cambian los límites HSV. Volver a un tamaño ya visto no recalcula nada.
+El resultado es idéntico a crear_mascara_pista con los mismos parámetros, y los valores elegidos
+se escriben directamente en config.json (sin perder los comentarios del fichero).
+"""
+
+# Comentario de cada clave de calibración si hay que añadirla a config.json
+COMENTARIOS_CALIBRACION = {
+    'LIM_INF_PISTA': "Limite inferior HSV de la pista [H, S, V] (CalibradorHSV.py)",
+    'LIM_SUP_PISTA': "Limite superior HSV de la pista [H, S, V] (CalibradorHSV.py)",
+    'KERNEL_EROSION': "Lado del kernel de erosion de la mascara de pista (CalibradorHSV.py)",
+    'KERNEL_CIERRE': "Lado del kernel de cierre de la mascara de pista (morphCloseBar.py)"
+}
+
+MAXIMOS_HSV = (180, 255, 255)
+
+
+def tamano_kernel(n):
+    """Mismo ajuste que crear_mascara_pista: los kernels pares pasan al impar siguiente."""
+    if n % 2 == 0 and n > 0:
+        n += 1
+    return n
+
+
+# --- 1. MOTOR ---
+
+class MotorCalibracion:
+
+    def __init__(self, imagen_bgr, lim_inf=LIM_INF_PISTA, lim_sup=LIM_SUP_PISTA,
+                 kernel_erosion=KERNEL_EROSION, kernel_cierre=KERNEL_CIERRE):
+        self.imagen = imagen_bgr
+        self.canales = cv2.split(cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2HSV))
+
+        self.lim_inf = list(lim_inf)
+        self.lim_sup = list(lim_sup)
+        self.kernel_erosion = kernel_erosion
+        self.kernel_cierre = kernel_cierre
+
+        self._lut = np.zeros(256, np.uint8)
+        self._mascaras_canal = [None, None, None]
+        self._mascara_hsv = None
+        self._erosiones = {} # tamaño de kernel -> máscara erosionada
+        self._cierres = {}   # (erosión, cierre) -> máscara final
+
+    @classmethod
+    def desde_config(cls, imagen_bgr, ruta_config='config.json'):
+        """Motor con los valores actuales de config.json (o los de Detector.py si no están)."""
+        with open(ruta_config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(imagen_bgr,
+                   config.get('LIM_INF_PISTA', LIM_INF_PISTA), config.get('LIM_SUP_PISTA', LIM_SUP_PISTA),
+                   config.get('KERNEL_EROSION', KERNEL_EROSION), config.get('KERNEL_CIERRE', KERNEL_CIERRE))
+
+    # ------------------------------------------------------------
+    # Cambios de parámetros
+    # ------------------------------------------------------------
+
+    def fijar_rango(self, canal, minimo, maximo):
+        """Cambia el rango de un canal (0=H, 1=S, 2=V). Devuelve True si algo cambió."""
+        if (self.lim_inf[canal], self.lim_sup[canal]) == (minimo, maximo):
+            return False
+        self.lim_inf[canal], self.lim_sup[canal] = minimo, maximo
+        self._mascaras_canal[canal] = None
+        self._mascara_hsv = None
+        self._erosiones.clear()
+        self._cierres.clear()
+        return True
+
+    def fijar_erosion(self, n):
+        if n == self.kernel_erosion:
+            return False
+        self.kernel_erosion = n
+        return True
+
+    def fijar_cierre(self, n):
+        if n == self.kernel_cierre:
+            return False
+        self.kernel_cierre = n
+        return True
+
+    # ------------------------------------------------------------
+    # Máscaras (perezosas, con caché)
+    # ------------------------------------------------------------
+
+    def _mascara_canal(self, canal):
+        if self._mascaras_canal[canal] is None:
+            # inRange con límites inclusivos, como una tabla de 256 entradas
+            self._lut.fill(0)
+            self._lut[max(self.lim_inf[canal], 0):max(self.lim_sup[canal] + 1, 0)] = 255
+            self._mascaras_canal[canal] = cv2.LUT(self.canales[canal], self._lut)
+        return self._mascaras_canal[canal]
+
+    def mascara_hsv(self):
+        """Máscara inicial (equivale a cv2.inRange sobre el HSV)."""
+        if self._mascara_hsv is None:
+            mascara = cv2.bitwise_and(self._mascara_canal(0), self._mascara_canal(1))
+            self._mascara_hsv = cv2.bitwise_and(mascara, self._mascara_canal(2), dst=mascara)
+        return self._mascara_hsv
+
+    def mascara_erosionada(self):
+        n = tamano_kernel(self.kernel_erosion)
+        if n not in self._erosiones:
+            if n > 1:
+                self._erosiones[n] = cv2.erode(self.mascara_hsv(), np.ones((n, n), np.uint8), iterations=1)
+            else:
+                self._erosiones[n] = self.mascara_hsv()
+        return self._erosiones[n]
+
+    def mascara_final(self):
+        """Máscara de pista final, la misma que devuelve crear_mascara_pista."""
+        clave = (tamano_kernel(self.kernel_erosion), tamano_kernel(self.kernel_cierre))
+        if clave not in self._cierres:
+            n = clave[1]
+            if n > 1:
+                self._cierres[clave] = cv2.morphologyEx(self.mascara_erosionada(), cv2.MORPH_CLOSE,
+                                                        np.ones((n, n), np.uint8), iterations=1)
+            else:
+                self._cierres[clave] = self.mascara_erosionada()
+        return self._cierres[clave]
+
+    def valores(self):
+        """Parámetros actuales, con las claves de config.json."""
+        return {
+            'LIM_INF_PISTA': [int(v) for v in self.lim_inf],
+            'LIM_SUP_PISTA': [int(v) for v in self.lim_sup],
+            'KERNEL_EROSION': int(self.kernel_erosion),
+            'KERNEL_CIERRE': int(self.kernel_cierre)
+        }
+
+
+# --- 2. CARGA DE LA IMAGEN ---
+
+def cargar_imagen(ruta_imagen, ancho=600):
+    """
+    Imagen a calibrar al ancho de análisis del detector (los kernels se miden en píxeles a ese
+    ancho). ancho=0 la deja a resolución original. Si la ruta es un vídeo se usa su primer
+    frame, el mismo que toma DetectorDeVideo como referencia.
+    """
+    imagen = cv2.imread(ruta_imagen)
+    if imagen is None:
+        cap = cv2.VideoCapture(ruta_imagen)
+        _, imagen = cap.read()
+        cap.release()
+    if imagen is None:
+        raise FileNotFoundError(f"Error: No se pudo cargar la imagen en {ruta_imagen}")
+    if ancho:
+        imagen = reescalar_frame(imagen, ancho)
+    return imagen
+
+
+def para_mostrar(imagen, ancho_max_ventana=800):
+    """Copia reducida para imshow: el cálculo se hace a resolución completa, la ventana no."""
+    if imagen.shape[1] > ancho_max_ventana:
+        return reescalar_frame(imagen, ancho_max_ventana)
+    return imagen
+
+
+# --- 3. ESCRITURA EN config.json ---
+
+def guardar_en_config(valores, ruta_config='config.json'):
+    """
+    Escribe los valores en config.json editando el texto: json.dump perdería las líneas
+    "_comment" (claves repetidas). Las claves que ya existen se sustituyen en su sitio y las
+    nuevas se añaden al final, cada una con su comentario.
+    """
+    with open(ruta_config, 'r', encoding='utf-8') as f:
+        texto = f.read()
+
+    for clave, valor in valores.items():
+        nuevo = json.dumps(valor)
+        patron = re.compile(r'("%s"\s*:\s*)(\[[^\]]*\]|[^,\n}]+)' % re.escape(clave))
+        if patron.search(texto):
+            texto = patron.sub(lambda m: m.group(1) + nuevo, texto, count=1)
+        else:
+            comentario = COMENTARIOS_CALIBRACION.get(clave, "")
+            fin = texto.rstrip().rfind('}')
+            cuerpo = texto[:fin].rstrip()
+            texto = (f'{cuerpo},\n\n    "{clave}": {nuevo},\n    "_comment": "{comentario}"\n' +
+                     texto[fin:])
+
+    json.loads(texto) # Nunca dejar un config.json inválido
+    temporal = ruta_config + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(texto)
+    os.replace(temporal, ruta_config)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+"""
+Instrumentación por etapas del pipeline (lectura, reescalado, resta, cierre, blobs,
+visualización, pintado en la GUI...). Cada etapa guarda sus últimas N duraciones en un
+buffer circular preasignado (de ahí salen p50/p95/p99) y contadores acumulados para el
+ritmo (ejecuciones por segundo).
+
+Uso en el código instrumentado (sin perfilador, el coste es un `is not None` por etapa):
+    perf = self.perfilador
+    if perf is not None: t = time.perf_counter()
+    ... etapa ...
+    if perf is not None: t = perf.registrar('resta', t)
+
+Exportación periódica a CSV (ruta .csv) o a fichero de texto Prometheus (cualquier otra ruta,
+p.ej. para el textfile collector de node_exporter).
+"""
+
+PERCENTILES = (50, 95, 99)
+
+
+class _Etapa:
+    __slots__ = ('muestras', 'pos', 'n', 'total_s')
+
+    def __init__(self, ventana):
+        self.muestras = np.zeros(ventana, np.float64)
+        self.pos = 0
+        self.n = 0
+        self.total_s = 0.0
+
+
+class Perfilador:
+
+    def __init__(self, ventana=1000):
+        """ventana: nº de duraciones recientes por etapa con las que se calculan los percentiles."""
+        self.ventana = ventana
+        self._etapas = {}
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._hilo_exportacion = None
+        self._parar = threading.Event()
+
+    def registrar(self, nombre, t0):
+        """Registra la duración desde t0 (perf_counter) para la etapa y devuelve el instante actual."""
+        ahora = time.perf_counter()
+        etapa = self._etapas.get(nombre)
+        if etapa is None:
+            with self._lock:
+                etapa = self._etapas.setdefault(nombre, _Etapa(self.ventana))
+
+        dt = ahora - t0
+        etapa.muestras[etapa.pos] = dt
+        etapa.pos = (etapa.pos + 1) % self.ventana
+        etapa.n += 1
+        etapa.total_s += dt
+        return ahora
+
+    def estadisticas(self):
+        """{etapa: {'n', 'por_segundo', 'media_ms', 'p50_ms', 'p95_ms', 'p99_ms'}}"""
+        transcurrido = max(time.perf_counter() - self._inicio, 1e-9)
+        with self._lock:
+            etapas = list(self._etapas.items())
+
+        resultado = {}
+        for nombre, etapa in etapas:
+            muestras = etapa.muestras[:min(etapa.n, self.ventana)]
+            if len(muestras) == 0:
+                continue
+            percentiles = np.percentile(muestras, PERCENTILES) * 1000
+            resultado[nombre] = {
+                'n': etapa.n,
+                'por_segundo': round(etapa.n / transcurrido, 2),
+                'media_ms': round(etapa.total_s / etapa.n * 1000, 3),
+                **{f"p{p}_ms": round(float(v), 3) for p, v in zip(PERCENTILES, percentiles)}
+            }
+        return resultado
+
+    def texto(self):
+        """Resumen de una línea por etapa, para mostrarlo en pantalla."""
+        return "\n".join(f"{nombre:<14} p50 {e['p50_ms']:6.2f}  p95 {e['p95_ms']:6.2f}  p99 {e['p99_ms']:6.2f} ms"
+                         for nombre, e in self.estadisticas().items())
+
+    # ------------------------------------------------------------
+    # Exportación
+    # ------------------------------------------------------------
+
+    def exportar(self, ruta):
+        """Escribe las estadísticas en CSV (ruta .csv) o en formato de texto Prometheus."""
+        estadisticas = self.estadisticas()
+        temporal = ruta + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            if ruta.endswith('.csv'):
+                self._escribir_csv(f, estadisticas)
+            else:
+                self._escribir_prometheus(f, estadisticas)
+        # Reemplazo atómico: quien lea el fichero nunca ve una exportación a medias
+        os.replace(temporal, ruta)
+
+    def _escribir_csv(self, f, estadisticas):
+        f.write("etapa,n,por_segundo,media_ms," + ",".join(f"p{p}_ms" for p in PERCENTILES) + "\n")
+        for nombre, e in estadisticas.items():
+            f.write(f"{nombre},{e['n']},{e['por_segundo']},{e['media_ms']}," +
+                    ",".join(str(e[f'p{p}_ms']) for p in PERCENTILES) + "\n")
+
+    def _escribir_prometheus(self, f, estadisticas):
+        f.write("# HELP f1opencv_etapa_segundos Duración de cada etapa del pipeline (ventana reciente).\n")
+        f.write("# TYPE f1opencv_etapa_segundos summary\n")
+        for nombre, e in estadisticas.items():
+            for p in PERCENTILES:
+                f.write(f'f1opencv_etapa_segundos{{etapa="{nombre}",quantile="{p / 100}"}} {e[f"p{p}_ms"] / 1000:.6f}\n')
+            f.write(f'f1opencv_etapa_segundos_sum{{etapa="{nombre}"}} {e["media_ms"] * e["n"] / 1000:.6f}\n')
+            f.write(f'f1opencv_etapa_segundos_count{{etapa="{nombre}"}} {e["n"]}\n')
+
+    def iniciar_exportacion(self, ruta, periodo_s=10.0):
+        """Exporta cada periodo_s segundos en un hilo aparte."""
+        self._parar.clear()
+
+        def exportar_periodicamente():
+            while not self._parar.wait(periodo_s):
+                try:
+                    self.exportar(ruta)
+                except OSError as e:
+                    # Un fallo puntual (disco lleno, directorio borrado...) no para la exportación
+                    print(f"No se pudo exportar el perfil a {ruta}: {e}")
+
+        self._hilo_exportacion = threading.Thread(target=exportar_periodicamente, daemon=True)
+        self._hilo_exportacion.start()
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo_exportacion is not None:
+            self._hilo_exportacion.join(timeout=1.0)
@@ -0,0 +1,341 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Detector import DetectorDeVideo, AnalizadorFrames, formatear_tiempo, imagen_deteccion
+from FuenteEnDirecto import es_fuente_en_directo
+
+"""
+Supervisión de varias cámaras fijas de un mismo circuito desde una sola máquina.
+Cada cámara tiene su propio frame de referencia, máscara de pista y config.json.
+Los frames se leen en un hilo por cámara y el análisis se reparte en un pool fijo de procesos.
+Como frames consecutivos de una cámara pueden ir a workers distintos, cada worker compara contra
+el frame de referencia: solo se admite MODELO_FONDO "estatico".
+
+Uso:
+    python PlanificadorCamaras.py camaras.json --workers 8
+
+Formato de camaras.json:
+    [{"id": "T1", "video": "Imagenes/T1.mp4", "prioridad": 2},
+     {"id": "T10", "video": "Imagenes/RbRingT10.mp4", "config": "config.json", "ancho": 600},
+     {"id": "T3", "video": "rtsp://10.0.0.13/stream1"}]
+
+"video" admite cámaras (0, /dev/video0) y URLs de streaming: se leen en directo con
+FuenteEnDirecto.py. "en_directo": true reproduce un fichero como si fuera una cámara.
+"""
+
+# Analizador y canal de detección de cada cámara en cada worker (se rellenan en _init_worker)
+_REFERENCIAS = {}
+
+
+def _init_worker(referencias):
+    # Un analizador por cámara y proceso: sus buffers se reutilizan frame a frame
+    for camera_id, (fondo_vacio, mascara_pista, mascara_pista_bgr, roi, umbrales, canal, piramide) in referencias.items():
+        analizador = AnalizadorFrames(fondo_vacio, mascara_pista, mascara_pista_bgr, *umbrales, roi, piramide)
+        _REFERENCIAS[camera_id] = (analizador, canal)
+
+
+def _analizar_frame_camara(camera_id, frame_actual):
+    """Analiza un frame de una cámara en un worker. Solo devuelve el veredicto, nunca imágenes."""
+    analizador, canal = _REFERENCIAS[camera_id]
+
+    imagen = imagen_deteccion(frame_actual, canal, analizador.zona)
+    results = analizador.analizar(frame_actual, frame_deteccion=imagen)
+    if results is None:
+        return None
+    return {
+        'infraccion_detectada': results['infraccion_detectada'],
+        'porcentaje_en_pista': results['porcentaje_en_pista'],
+        'area_coche': results['area_coche']
+    }
+
+
+# --- 1. FUENTE DE CÁMARA ---
+
+class FuenteCamara:
+    """
+    Una cámara del circuito: su detector (referencia, máscara y config propios), su prioridad
+    y la cola acotada de frames pendientes de analizar.
+    Si la cola está llena al llegar un frame nuevo se descarta el más antiguo (contrapresión):
+    la cámara pierde frames pero la latencia no crece.
+    """
+
+    def __init__(self, camera_id, video_path, ancho_ventana=600, ruta_config='config.json',
+                 prioridad=1, max_pendientes=2, tiempo_real=True, bucle=False, en_directo=None):
+        self.camera_id = camera_id
+        self.prioridad = max(prioridad, 1e-3)
+        self.tiempo_real = tiempo_real
+        if not tiempo_real and (es_fuente_en_directo(video_path) if en_directo is None else en_directo):
+            # Sin tiempo real se lee el fichero tan rápido como se analiza: una cámara marca su ritmo
+            raise ValueError(f"Cámara {camera_id}: '{video_path}' se lee en directo y no admite --sin-tiempo-real")
+        self.detector = DetectorDeVideo(video_path, ancho_ventana=ancho_ventana,
+                                        ruta_config=ruta_config, bucle=bucle, incidentes=False,
+                                        en_directo=en_directo)
+        if self.detector.MODELO_FONDO != 'estatico':
+            self.detector.liberar()
+            raise ValueError(f"Cámara {camera_id}: PlanificadorCamaras solo admite MODELO_FONDO 'estatico' "
+                             f"(config: '{self.detector.MODELO_FONDO}')")
+
+        self.pendientes = deque(maxlen=max_pendientes)
+        self.terminada = False
+
+        # Planificación justa ponderada: cada frame enviado avanza el "pase" 1/prioridad
+        self.pase = 0.0
+
+        # Estadísticas
+        self.leidos = 0
+        self.descartados = 0
+        self.analizados = 0
+        self.infracciones = 0
+
+    def referencia(self):
+        d = self.detector
+        return (d.fondo_deteccion, d.mascara_pista, d.mascara_pista_bgr, d.roi,
+                (d.UMBRAL_BG_SUB, d.UMBRAL_RUIDO_COCHE, d.UMBRAL_SALIDA), d.CANAL_DETECCION, d.piramide)
+
+    def estadisticas(self):
+        return {
+            'camera_id': self.camera_id,
+            'leidos': self.leidos,
+            'analizados': self.analizados,
+            'descartados': self.descartados,
+            'infracciones': self.infracciones,
+            'pendientes': len(self.pendientes)
+        }
+
+
+# --- 2. PLANIFICADOR ---
+
+class PlanificadorCamaras:
+    """
+    Reparte el análisis de N cámaras sobre un pool fijo de procesos.
+    - Un hilo lector por cámara deja los frames en la cola acotada de su FuenteCamara.
+    - Un hilo despachador elige siempre la cámara con menor pase (planificación justa
+      ponderada por prioridad) y nunca tiene más de `max_en_vuelo` frames en el pool.
+    - Las infracciones de todas las cámaras llegan a una única cola (self.eventos)
+      etiquetadas con camera_id.
+    """
+
+    def __init__(self, fuentes, workers=4, max_en_vuelo=None):
+        self.fuentes = {f.camera_id: f for f in fuentes}
+        self.workers = workers
+        self.max_en_vuelo = max_en_vuelo or workers * 2
+
+        self.eventos = queue.Queue()
+        self._cond = threading.Condition()
+        self._en_vuelo = 0
+        self._activo = False
+        self._hilos = []
+
+        referencias = {cid: f.referencia() for cid, f in self.fuentes.items()}
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(referencias,))
+
+    # ------------------------------------------------------------
+    # Arranque / parada
+    # ------------------------------------------------------------
+
+    def iniciar(self):
+        self._activo = True
+        for fuente in self.fuentes.values():
+            t = threading.Thread(target=self._hilo_lector, args=(fuente,), daemon=True)
+            t.start()
+            self._hilos.append(t)
+
+        t = threading.Thread(target=self._hilo_despachador, daemon=True)
+        t.start()
+        self._hilos.append(t)
+
+    def detener(self):
+        with self._cond:
+            self._activo = False
+            self._cond.notify_all()
+        # Un lector en directo puede estar esperando un frame que no llega: se le despierta
+        for fuente in self.fuentes.values():
+            if fuente.detector.en_directo:
+                fuente.detector.liberar()
+        for t in self._hilos:
+            t.join()
+        self.pool.shutdown(wait=True)
+        for fuente in self.fuentes.values():
+            if not fuente.detector.en_directo:
+                fuente.detector.liberar()
+
+    def terminado(self):
+        """True cuando todas las cámaras han llegado al final y no queda nada pendiente."""
+        with self._cond:
+            return (self._en_vuelo == 0 and
+                    all(f.terminada and not f.pendientes for f in self.fuentes.values()))
+
+    def estadisticas(self):
+        with self._cond:
+            return [f.estadisticas() for f in self.fuentes.values()]
+
+    # ------------------------------------------------------------
+    # Hilos
+    # ------------------------------------------------------------
+
+    def _hilo_lector(self, fuente):
+        """
+        Lee frames de una cámara. En tiempo real se respeta el ritmo de la fuente; una fuente en
+        directo ya lo marca ella (leer_frame espera al siguiente frame capturado).
+        """
+        detector = fuente.detector
+        periodo = 1.0 / detector.fps
+        siguiente = time.perf_counter()
+
+        while self._activo:
+            frame_actual = detector.leer_frame()
+            if frame_actual is None:
+                break
+
+            with self._cond:
+                if len(fuente.pendientes) == fuente.pendientes.maxlen:
+                    fuente.descartados += 1   # La deque descarta el frame más antiguo
+                if detector.en_directo:
+                    # Tiempo y latencia desde la captura, no desde que el lector tomó el frame
+                    t_captura = detector._t_captura_mono
+                    tiempo_s = t_captura - detector._inicio_captura
+                else:
+                    t_captura = time.perf_counter()
+                    tiempo_s = detector.frame_count / detector.fps
+                fuente.pendientes.append((detector.frame_count, tiempo_s, t_captura, frame_actual))
+                fuente.leidos += 1
+                self._cond.notify_all()
+
+            if detector.en_directo:
+                continue
+            elif fuente.tiempo_real:
+                siguiente += periodo
+                espera = siguiente - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                else:
+                    siguiente = time.perf_counter()
+            else:
+                # Sin tiempo real (p.ej. vídeos grabados) no se descarta nada: esperamos hueco
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._activo or
+                                        len(fuente.pendientes) < fuente.pendientes.maxlen)
+
+        with self._cond:
+            fuente.terminada = True
+            self._cond.notify_all()
+
+    def _siguiente_fuente(self):
+        """Cámara con frames pendientes y menor pase (se llama con self._cond adquirido)."""
+        candidatas = [f for f in self.fuentes.values() if f.pendientes]
+        if not candidatas:
+            return None
+        return min(candidatas, key=lambda f: f.pase)
+
+    def _hilo_despachador(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._activo or
+                                    (self._en_vuelo < self.max_en_vuelo and self._siguiente_fuente()))
+                if not self._activo:
+                    return
+
+                fuente = self._siguiente_fuente()
+
+                # Una cámara que estuvo parada no acumula crédito frente a las demás
+                pase_min = min(f.pase for f in self.fuentes.values() if not f.terminada or f.pendientes)
+                frame_idx, tiempo_s, t_captura, frame_actual = fuente.pendientes.popleft()
+                fuente.pase = max(fuente.pase, pase_min) + 1.0 / fuente.prioridad
+                self._en_vuelo += 1
+                self._cond.notify_all()
+
+            futuro = self.pool.submit(_analizar_frame_camara, fuente.camera_id, frame_actual)
+            futuro.add_done_callback(
+                lambda fut, f=fuente, i=frame_idx, s=tiempo_s, t=t_captura: self._al_terminar(fut, f, i, s, t))
+
+    def _al_terminar(self, futuro, fuente, frame_idx, tiempo_s, t_captura):
+        try:
+            results = futuro.result()
+        except Exception as e:
+            print(f"Error analizando cámara {fuente.camera_id}: {e}")
+            results = None
+
+        with self._cond:
+            self._en_vuelo -= 1
+            fuente.analizados += 1
+            if results and results['infraccion_detectada']:
+                fuente.infracciones += 1
+            self._cond.notify_all()
+
+        if results and results['infraccion_detectada']:
+            self.eventos.put({
+                'tipo': 'infraccion',
+                'camera_id': fuente.camera_id,
+                'frame_idx': frame_idx,
+                'video_time': formatear_tiempo(tiempo_s),
+                'tiempo_s': round(tiempo_s, 3),
+                'porcentaje_en_pista': round(results['porcentaje_en_pista'], 2),
+                'area_coche': int(results['area_coche']),
+                'latencia_s': round(time.perf_counter() - t_captura, 3)
+            })
+
+
+# --- 3. MAIN ---
+
+def cargar_fuentes(ruta_camaras, tiempo_real=True):
+    with open(ruta_camaras, 'r', encoding='utf-8') as f:
+        camaras = json.load(f)
+    fuentes = []
+    try:
+        for c in camaras:
+            fuentes.append(FuenteCamara(c['id'], c['video'],
+                                        ancho_ventana=c.get('ancho', 600),
+                                        ruta_config=c.get('config', 'config.json'),
+                                        prioridad=c.get('prioridad', 1),
+                                        max_pendientes=c.get('max_pendientes', 2),
+                                        tiempo_real=tiempo_real,
+                                        en_directo=c.get('en_directo')))
+    except Exception:
+        # Una cámara que no arranca no deja abiertas las capturas (ni sus hilos) de las anteriores
+        for fuente in fuentes:
+            fuente.detector.liberar()
+        raise
+    return fuentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervisión multicámara de salidas de pista.")
+    parser.add_argument('camaras', help="JSON con la lista de cámaras")
+    parser.add_argument('--workers', type=int, default=4, help="Tamaño del pool de procesos")
+    parser.add_argument('--sin-tiempo-real', action='store_true',
+                        help="Leer los vídeos a máxima velocidad sin descartar frames")
+    args = parser.parse_args()
+
+    try:
+        fuentes = cargar_fuentes(args.camaras, not args.sin_tiempo_real)
+    except ValueError as e:
+        parser.error(str(e))
+    planificador = PlanificadorCamaras(fuentes, workers=args.workers)
+    planificador.iniciar()
+
+    try:
+        while not planificador.terminado():
+            try:
+                evento = planificador.eventos.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            print(json.dumps(evento, ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        planificador.detener()
+
+    while not planificador.eventos.empty():
+        print(json.dumps(planificador.eventos.get(), ensure_ascii=False))
+    for e in planificador.estadisticas():
+        print(json.dumps(dict(e, tipo='estadisticas'), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()